@@ -1,68 +1,153 @@
 """This file initializes Application."""
+from collections.abc import MutableMapping
+import functools
 import logging
-from logging.handlers import TimedRotatingFileHandler
 import os
-import subprocess
 import sys
 import traceback
+from typing import Any
 
 from app.helpers.constants import HttpStatusCode
 from app.helpers.constants import QueueName
+from app.helpers.constants import RedisDatabase
 from app.helpers.constants import ResponseMessageKeys
-import boto3
-from botocore.client import Config
+from app.helpers.log_handlers import configure_logger
 from flask import Flask,request
+from flask import has_request_context
 from flask_restful import Resource,Api
 from flask import jsonify
 from flask_limiter import Limiter
 from flask_limiter import RequestLimit
-from flask_migrate import Migrate
+from flask_sqlalchemy import get_state
+from flask_sqlalchemy import SignallingSession
 from flask_sqlalchemy import SQLAlchemy
 from flask_swagger_ui import get_swaggerui_blueprint
 import redis
 from rq import Queue
-from rq_scheduler import Scheduler
+from sqlalchemy import event
+from sqlalchemy import orm
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
 import yaml
 
 base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(base_dir)
-media_dir = os.path.join(base_dir, 'media')  # type: ignore  # noqa: FKA100
-if not os.path.exists(media_dir):
-    os.makedirs(media_dir)
+CONFIG_FILE = os.path.join(base_dir, 'config', 'config.yml')  # type: ignore  # noqa: FKA100
 
 
-try:
-    CONFIG_FILE = os.path.join(base_dir, 'config', 'config.yml')  # type: ignore  # noqa: FKA100
-    with open(file=CONFIG_FILE) as config_file:
-        config_data = yaml.load(config_file, Loader=yaml.FullLoader)
+class LazyConfig(MutableMapping):
+    """Mapping of config.yml, file is parsed on first access instead of at import of app."""
 
-except Exception as exception_error:
-    logging.error('Unable to read config file for database : '
-                  + str(exception_error))
+    def __init__(self, path: str):
+        """Keep path of config file."""
+        self.path = path
+        self.data: Any = None
 
-SHELL_COMMAND_TO_FETCH_TASK_ID = 'curl -s "$ECS_CONTAINER_METADATA_URI_V4/task" | jq -r ".TaskARN" | cut -d "/" -f 3'
-TASK_ID = subprocess.getoutput(SHELL_COMMAND_TO_FETCH_TASK_ID)
-S3_RESOURCE = boto3.resource(
-    's3',
-    region_name=config_data.get('AWS').get('S3_REGION'),
-    config=Config(signature_version='s3v4')
-)
+    def load(self) -> dict:
+        """Parse config file once, empty config is used if it can not be read."""
+        if self.data is None:
+            try:
+                with open(file=self.path) as config_file:
+                    self.data = yaml.load(config_file, Loader=yaml.FullLoader) or {}
+            except Exception as exception_error:
+                logging.error('Unable to read config file for database : '
+                              + str(exception_error))
+                self.data = {}
+        return self.data
 
-# Initializing logging configuration object
-formatter = logging.Formatter(
-    '%(asctime)s: %(levelname)s {%(filename)s:%(lineno)d} -> %(message)s'
-)
+    def __getitem__(self, key: str) -> Any:
+        """Return value of config key."""
+        return self.load()[key]
 
+    def __setitem__(self, key: str, value: Any) -> None:
+        """Set value of config key."""
+        self.load()[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        """Remove config key."""
+        del self.load()[key]
+
+    def __iter__(self) -> Any:
+        """Iterate over config keys."""
+        return iter(self.load())
+
+    def __len__(self) -> int:
+        """Return number of config keys."""
+        return len(self.load())
+
+
+config_data = LazyConfig(CONFIG_FILE)
+
+
+@functools.lru_cache(maxsize=None)
+def get_task_id() -> str:
+    """
+    Return id of ECS task this process runs in, '' outside ECS.
+    TASK_ID environment variable is used if it is set, otherwise id is read from ECS_CONTAINER_METADATA_URI_V4
+    which ends with `<task id>-<container number>` on Fargate.
+    """
+    task_id = os.environ.get('TASK_ID')
+    if task_id is not None:
+        return task_id
+    container = os.environ.get('ECS_CONTAINER_METADATA_URI_V4', '').rstrip('/').rsplit('/', 1)[-1]
+    return container.split('-', 1)[0] if '-' in container else ''  # type: ignore  # noqa: FKA100
+
+
+@functools.lru_cache(maxsize=None)
+def get_s3_resource() -> Any:
+    """Return S3 resource, boto3 is imported and resource is built on first use."""
+    import boto3
+    from botocore.client import Config
+    return boto3.resource(
+        's3',
+        region_name=config_data.get('AWS').get('S3_REGION'),
+        config=Config(signature_version='s3v4')
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_redis() -> redis.Redis:
+    """Return redis client of queues, built on first use with shared pool (see app/helpers/redis_pool.py)."""
+    from app.helpers.redis_pool import get_redis_client
+    return get_redis_client(RedisDatabase.QUEUE)
+
+
+@functools.lru_cache(maxsize=None)
+def get_media_dir() -> str:
+    """Return media directory of project, it is created on first use."""
+    media_dir = os.path.join(base_dir, 'media')  # type: ignore  # noqa: FKA100
+    os.makedirs(media_dir, exist_ok=True)
+    return media_dir
+
+
+# Attributes of app which are built on first access, e.g. `from app import r`.
+LAZY_ATTRIBUTES = {'TASK_ID': get_task_id, 'S3_RESOURCE': get_s3_resource, 'r': get_redis,
+                   'media_dir': get_media_dir}
+
+
+def __getattr__(name: str) -> Any:
+    """Return lazily built attribute of app (see LAZY_ATTRIBUTES)."""
+    if name in LAZY_ATTRIBUTES:
+        return LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+# Logger of application, its handlers are attached by init_logger (called by create_app) and not at import.
 logger = logging.getLogger(__name__)
 
-handler = TimedRotatingFileHandler(
-    config_data.get('LOG_FILE_PATH'),
-    when='midnight',
-    interval=1,
-    backupCount=7)
-handler.setFormatter(formatter)
-logger.addHandler(handler)
-logger.setLevel(logging.DEBUG)
+
+def init_logger(mode: Any = None) -> None:
+    """
+    Attach handlers of LOGGING section of config.yml to app logger once per process, records are written by a
+    listener thread in queue mode (see app/helpers/log_handlers.py). mode overrides LOGGING.MODE, rq workers
+    use sync mode (see workers/rq_worker.py).
+    """
+    if logger.handlers:
+        return
+    log_config = dict(config_data.get('LOGGING') or {})
+    if mode:
+        log_config['MODE'] = mode
+    configure_logger(logger=logger, log_file=config_data.get('LOG_FILE_PATH'), log_config=log_config)
 
 
 def ratelimit_handler(request_limit: RequestLimit) -> tuple:
@@ -83,6 +168,7 @@ def create_app():
         :return: application instance
     """
     try:
+        init_logger()
         application = Flask(__name__, instance_relative_config=True)
         application.config.from_object(config_data)
         # if TESTING:
@@ -93,23 +179,26 @@ def create_app():
         
 
         application.register_error_handler(429, ratelimit_handler)  # type: ignore  # noqa: FKA100
+        # flask_migrate imports alembic, it is only needed by applications which are created.
+        from flask_migrate import Migrate
         db.init_app(application)
         Migrate(app=application, db=db, compare_type=True)
 
-        r = redis.Redis(host=config_data.get('REDIS').get('HOST'), port=config_data.get(
-                'REDIS').get('PORT'), db=config_data.get('REDIS').get('DB'))
-        send_mail_q = Queue(QueueName.SEND_MAIL, connection=r)
+        send_mail_q = Queue(QueueName.SEND_MAIL, connection=get_redis())
 
+        from app.helpers.redis_pool import redis_pools
         limiter = Limiter(app=application, key_func=None, strategy=config_data.get('STRATEGY'),  # Creating instance of Flask-Limiter for rate limiting.
-                  key_prefix=config_data.get('KEY_PREFIX'), storage_uri='redis://{}:{}/{}'.format(
-                config_data.get('REDIS').get('HOST'), config_data.get('REDIS').get('PORT'), config_data.get('RATE_LIMIT').get('REDIS_DB')))
-
+                  key_prefix=config_data.get('KEY_PREFIX'), storage_uri=redis_pools.get_url(RedisDatabase.RATE_LIMIT),
+                  storage_options={'connection_pool': redis_pools.get_pool(RedisDatabase.RATE_LIMIT)})
 
         app_set_configurations(application=application,
                                config_data=config_data)
+        set_json_provider(application)
         initialize_extensions(application)
         register_blueprints(application)
         register_swagger_blueprints(application)
+        register_metrics(application)
+        register_compression(application)
 
         return application
 
@@ -125,6 +214,7 @@ def initialize_extensions(application):
     :return:
     """
     try:
+        from flask_migrate import Migrate
         db.init_app(application)
         migrate = Migrate(app=application, db=db, compare_type=True)
         return db, migrate
@@ -182,6 +272,38 @@ def register_swagger_blueprints(application):
                      + str(exception_error))
 
 
+def set_json_provider(application):
+    """
+    Sets JSON provider which serializes responses with orjson when it is installed (see JSON section of config.yml).
+    :param application:
+    :return: None
+    """
+    from app.helpers.json_provider import FastJSONProvider
+    application.json = FastJSONProvider(application, encoder=(config_data.get('JSON') or {}).get('ENCODER', 'auto'))
+
+
+def register_compression(application):
+    """
+    Registers gzip/brotli compression of responses and precompressed static files (see COMPRESSION section of
+    config.yml).
+    :param application:
+    :return: None
+    """
+    from app.helpers.compression import init_compression
+    init_compression(application)
+
+
+def register_metrics(application):
+    """
+    Registers request latency/size metrics and /metrics view (see METRICS section of config.yml). It is registered
+    before compression, so response sizes are counted as sent.
+    :param application:
+    :return: None
+    """
+    from app.helpers.metrics import init_metrics
+    init_metrics(application)
+
+
 def app_set_configurations(application, config_data):
     """This method is used to setting configuration data from config.yml"""
     try:
@@ -193,19 +315,62 @@ def app_set_configurations(application, config_data):
                      + str(exception_error))
 
 
-r = redis.Redis(host=config_data.get('REDIS').get('HOST'), port=config_data.get(
-                'REDIS').get('PORT'), db=config_data.get('REDIS').get('DB'))
 def clear_scheduler():
     """ Method to delete scheduled jobs in scheduler. """
-    scheduler = Scheduler(connection=r)
+    from rq_scheduler import Scheduler
+    scheduler = Scheduler(connection=get_redis())
     for job in scheduler.get_jobs():
         scheduler.cancel(job)
 
 
+class RoutingSession(SignallingSession):
+    """
+    Session which sends SELECTs of views marked with read_replica decorator to a replica bind
+    (DATABASE_REPLICAS section of config.yml, see app/helpers/replica.py). Flushes, INSERT/UPDATE/DELETE
+    statements, other statements and all reads of a session after its first write use primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        """Return replica engine for reads of read-only views, engine of model bind or primary otherwise."""
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info['has_written'] = True
+        elif (isinstance(clause, Select) and not self.info.get('has_written')
+              and (mapper is None or not mapper.persist_selectable.info.get('bind_key'))):
+            from app.helpers.replica import replica_router
+            state = get_state(self.app)
+            bind = replica_router.get_request_bind(
+                get_engine=lambda bind_key: state.db.get_engine(self.app, bind=bind_key))
+            if bind is not None:
+                return state.db.get_engine(self.app, bind=bind)
+        return super().get_bind(mapper=mapper, clause=clause)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def mark_request_write(session):
+    """Reads of client which committed a write go to primary for a while (DATABASE_REPLICAS.STICKY_SECONDS)."""
+    if session.info.pop('has_written', False) and has_request_context():
+        from app.helpers.replica import replica_router
+        replica_router.mark_write()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def discard_request_write(session):
+    """Rolled back writes do not make reads sticky."""
+    session.info.pop('has_written', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy extension whose sessions route reads to replicas (see RoutingSession)."""
+
+    def create_session(self, options):
+        """Return session factory of RoutingSession."""
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
 application = Flask(__name__)
 api=Api(application)
 # app_set_configurations(application=app, config_data=config_data)
-db = SQLAlchemy(app=application,session_options={'expire_on_commit': False})
+db = RoutingSQLAlchemy(app=application,session_options={'expire_on_commit': False})
 # migrate = Migrate(app=app, db=db, compare_type=True)
 
 
@@ -0,0 +1,321 @@
+"""In-process and Redis backed caches shared by helpers, models and views."""
+from collections import OrderedDict
+import hashlib
+import pickle
+import threading
+import time
+import uuid
+from typing import Any
+from typing import Callable
+
+from app import config_data
+from app import logger
+from app.helpers.constants import RedisDatabase
+from app.helpers.redis_pool import get_redis_client
+
+_MISSING = object()
+
+
+class CacheStats:
+    """Thread safe hit/miss counters for a cache."""
+
+    def __init__(self):
+        """Initialize all counters with zero."""
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record_hit(self) -> None:
+        """Increment hit counter."""
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self) -> None:
+        """Increment miss counter."""
+        with self._lock:
+            self.misses += 1
+
+    @property
+    def hit_rate(self) -> float:
+        """Return ratio of hits over total lookups."""
+        total = self.hits + self.misses
+        return round(self.hits / total, 4) if total else 0.0
+
+    def as_dict(self) -> dict:
+        """Return counters as dictionary."""
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate}
+
+
+class LRUCache:
+    """Thread safe in-process LRU cache where every entry expires after ttl seconds."""
+
+    def __init__(self, max_size: int = 1024, ttl: int = 60):
+        """Initialize LRU cache with max number of entries and default ttl in seconds."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return value of key if present and not expired else default."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.stats.record_hit()
+                    return value
+                del self._data[key]
+        self.stats.record_miss()
+        return default
+
+    def set(self, key: str, value: Any, ttl: Any = None) -> None:
+        """Store value for key, evicting least recently used entry if cache is full."""
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        """Remove given keys from cache."""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all entries from cache."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        """Return number of entries currently stored."""
+        return len(self._data)
+
+
+class TieredCache:
+    """
+        Two level cache: per process LRUCache (L1) in front of a shared Redis tier (L2).
+        - Values are pickled in Redis so they can be shared across workers.
+        - Redis errors never propagate, L2 is skipped for `retry_after` seconds after a failure.
+        - With `fail_closed` deletes are sent even while L2 is skipped, keys whose Redis delete failed are never
+          served from or stored in cache and their delete is retried on each access until it succeeds.
+    """
+
+    def __init__(self, name: str, redis_client: Any = None, l1_max_size: int = 1024, l1_ttl: int = 30,
+                 ttl: int = 300, retry_after: int = 30, fail_closed: bool = False):
+        """Initialize tiered cache with redis key prefix `name`."""
+        self.name = name
+        self.fail_closed = fail_closed
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.l1 = LRUCache(max_size=l1_max_size, ttl=l1_ttl)
+        self.stats = CacheStats()
+        self.l2_hits = 0
+        self._redis = redis_client
+        self._redis_down_until = 0.0
+        self._pending_deletes: set = set()
+        self._pending_lock = threading.Lock()
+
+    def _key(self, key: str) -> str:
+        """Return namespaced redis key."""
+        return f'{self.name}:{key}'
+
+    def _redis_available(self) -> bool:
+        """Return True if redis tier is configured and not marked down."""
+        return self._redis is not None and time.monotonic() >= self._redis_down_until
+
+    def _redis_call(self, func: Callable, *args, **kwargs) -> Any:
+        """Call redis function, marking L2 as down for `retry_after` seconds on failure."""
+        try:
+            return func(*args, **kwargs)
+        except Exception as exception_error:
+            self._redis_down_until = time.monotonic() + self.retry_after
+            logger.error(f'Cache {self.name}: redis unavailable, using in-process cache only : {exception_error}')
+            return None
+
+    def _delete_pending(self, keys: Any) -> bool:
+        """Retry Redis delete of pending keys out of keys, returns True if none of keys is pending anymore."""
+        keys = [key for key in keys if key in self._pending_deletes]
+        if not keys:
+            return True
+        if self._redis_call(self._redis.delete, *[self._key(key) for key in keys]) is None:
+            return False
+        with self._pending_lock:
+            self._pending_deletes.difference_update(keys)
+        return True
+
+    def get(self, key: str, default: Any = None, record_stats: bool = True) -> Any:
+        """Return value from L1, then L2 (populating L1) or default on miss (or while delete of key is pending)."""
+        if self._pending_deletes and not self._delete_pending([key]):
+            if record_stats:
+                self.stats.record_miss()
+            return default
+        value = self.l1.get(key, _MISSING)
+        if value is not _MISSING:
+            if record_stats:
+                self.stats.record_hit()
+            return value
+        if self._redis_available():
+            raw = self._redis_call(self._redis.get, self._key(key))
+            if raw is not None:
+                value = pickle.loads(raw)
+                self.l1.set(key, value)
+                if record_stats:
+                    self.l2_hits += 1
+                    self.stats.record_hit()
+                return value
+        if record_stats:
+            self.stats.record_miss()
+        return default
+
+    def get_version(self, key: str) -> str:
+        """
+            Return version token stored at key, used as part of keys of entries which are invalidated together.
+            A new token is stored if it is missing, so expired or evicted version never brings back old entries.
+        """
+        version = self.get(key, record_stats=False)
+        return version if version is not None else self.bump_version(key)
+
+    def bump_version(self, key: str) -> str:
+        """Store new version token at key, entries keyed with previous token are never read again."""
+        version = uuid.uuid4().hex
+        self.set(key, version)
+        return version
+
+    def bump_versions(self, *keys: str) -> None:
+        """Store new version tokens at all keys with one pipeline, see bump_version."""
+        self.set_many({key: uuid.uuid4().hex for key in keys})
+
+    def get_many(self, keys: list) -> dict:
+        """Return dict of found keys and values, keys missing in L1 are fetched from L2 with one MGET."""
+        found = {}
+        missing = []
+        if self._pending_deletes:
+            self._delete_pending(keys)
+        for key in keys:
+            if key in self._pending_deletes:
+                continue
+            value = self.l1.get(key, _MISSING)
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing and self._redis_available():
+            raw_values = self._redis_call(self._redis.mget, [self._key(key) for key in missing]) or []
+            for key, raw in zip(missing, raw_values):
+                if raw is not None:
+                    found[key] = pickle.loads(raw)
+                    self.l1.set(key, found[key])
+                    self.l2_hits += 1
+        for key in keys:
+            if key in found:
+                self.stats.record_hit()
+            else:
+                self.stats.record_miss()
+        return found
+
+    def set_many(self, mapping: dict, ttl: Any = None) -> None:
+        """Store all key/values of mapping in both tiers, L2 writes are sent in one pipeline."""
+        ttl = self.ttl if ttl is None else min(int(ttl), self.ttl)
+        if self._pending_deletes and not self._delete_pending(mapping):
+            mapping = {key: value for key, value in mapping.items() if key not in self._pending_deletes}
+        if ttl <= 0 or not mapping:
+            return
+        for key, value in mapping.items():
+            self.l1.set(key, value, ttl=ttl)
+        if self._redis_available():
+            def write_pipeline():
+                pipeline = self._redis.pipeline(transaction=False)
+                for key, value in mapping.items():
+                    pipeline.set(self._key(key), pickle.dumps(value), ex=ttl)
+                pipeline.execute()
+            self._redis_call(write_pipeline)
+
+    def set(self, key: str, value: Any, ttl: Any = None) -> None:
+        """Store value in both tiers, ttl is capped by cache ttl."""
+        ttl = self.ttl if ttl is None else min(int(ttl), self.ttl)
+        if ttl <= 0 or self._pending_deletes and not self._delete_pending([key]):
+            return
+        self.l1.set(key, value, ttl=ttl)
+        if self._redis_available():
+            self._redis_call(self._redis.set, self._key(key), pickle.dumps(value), ex=ttl)
+
+    def delete(self, *keys: str) -> None:
+        """Remove keys from both tiers, see class docstring for `fail_closed`."""
+        if not keys:
+            return
+        self.l1.delete(*keys)
+        if not self.fail_closed:
+            if self._redis_available():
+                self._redis_call(self._redis.delete, *[self._key(key) for key in keys])
+            return
+        if self._redis is None:
+            return
+        with self._pending_lock:
+            self._pending_deletes.update(keys)
+        self._delete_pending(keys)
+
+    def clear(self) -> None:
+        """Clear in-process tier. Redis entries expire on their own."""
+        self.l1.clear()
+
+    def get_stats(self) -> dict:
+        """Return hit/miss counters of cache."""
+        data = self.stats.as_dict()
+        data.update(l1_hits=self.stats.hits - self.l2_hits, l2_hits=self.l2_hits, l1_size=len(self.l1),
+                    pending_deletes=len(self._pending_deletes))
+        return data
+
+
+def get_token_digest(token: Any) -> str:
+    """Return sha256 digest of jwt token, used as cache key instead of raw token."""
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(token).hexdigest()
+
+
+def build_tiered_cache(config_key: str, default_prefix: str, use_l1: bool = True,
+                       fail_closed: bool = False) -> TieredCache:
+    """
+        Return TieredCache configured from given section of config.yml. Without `use_l1` entries are kept only in
+        Redis, so an invalidation in one worker is seen by all workers on their next lookup.
+    """
+    cache_config = config_data.get(config_key) or {}
+    use_redis = cache_config.get('USE_REDIS', True)
+    return TieredCache(name=cache_config.get('KEY_PREFIX', default_prefix),
+                       redis_client=get_redis_client(RedisDatabase.CACHE) if use_redis else None,
+                       l1_max_size=cache_config.get('L1_MAX_SIZE', 10000),
+                       l1_ttl=cache_config.get('L1_TTL', 30) if use_l1 else 0,
+                       ttl=cache_config.get('TTL', 300), fail_closed=fail_closed)
+
+
+# Verified tokens are not kept in per-worker L1 and their deletes fail closed: a rotated or revoked token must be
+# rejected by every worker at once, even if Redis failed while it was invalidated.
+token_cache = build_tiered_cache(config_key='AUTH_CACHE', default_prefix='AUTH_TOKEN', use_l1=False,
+                                 fail_closed=True)
+user_summary_cache = build_tiered_cache(config_key='USER_CACHE', default_prefix='USER_SUMMARY')
+student_cache = build_tiered_cache(config_key='CACHE', default_prefix='STUDENT')
+# Versions of students and student lists are part of keys of their entries and are read from Redis only, see
+# view_version_cache.
+student_version_cache = build_tiered_cache(config_key='CACHE', default_prefix='STUDENT', use_l1=False)
+view_cache = build_tiered_cache(config_key='VIEW_CACHE', default_prefix='VIEW')
+# Tag versions are read from Redis only: a version bumped by one worker changes cache keys in every worker at once,
+# so responses of invalidated tags are never served from L1 of another worker.
+view_version_cache = build_tiered_cache(config_key='VIEW_CACHE', default_prefix='VIEW', use_l1=False)
+
+
+def get_view_tag_key(tag: str) -> str:
+    """Return key of version of cache tag, versions are part of keys of views cached with the tag."""
+    return f'tag:{tag}'
+
+
+def invalidate_view_tags(*tags: str) -> None:
+    """Bump versions of tags, so views cached with any of them are never read again."""
+    for tag in set(tags):
+        view_version_cache.bump_version(get_view_tag_key(tag))
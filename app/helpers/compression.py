@@ -0,0 +1,119 @@
+"""Contains response compression (gzip/brotli) and precompressed static files."""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Any
+from typing import Optional
+
+from app import config_data
+from flask import abort
+from flask import current_app
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+compression_config = config_data.get('COMPRESSION') or {}
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encodings: Any) -> Optional[str]:
+    """Return first encoding of COMPRESSION.ALGORITHMS accepted by client (and installed), None for identity."""
+    for encoding in compression_config.get('ALGORITHMS', ['br', 'gzip']):
+        if encoding in SUPPORTED_ENCODINGS and accept_encodings[encoding] > 0:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress data with gzip (COMPRESSION.LEVEL) or brotli (COMPRESSION.BROTLI_QUALITY)."""
+    if encoding == 'br':
+        return brotli.compress(data, quality=compression_config.get('BROTLI_QUALITY', 5))
+    # mtime is fixed so that same content is always compressed to same bytes.
+    return gzip.compress(data, compresslevel=compression_config.get('LEVEL', 6), mtime=0)
+
+
+def compress_response(response):
+    """
+        after_request hook which compresses response body with encoding negotiated from Accept-Encoding.
+        Streamed, file and already encoded (or negotiated) responses, non 200 responses, bodies smaller than
+        COMPRESSION.MIN_SIZE and content types outside COMPRESSION.MIME_TYPES are sent as they are.
+    """
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or 'Accept-Encoding' in response.vary
+            or response.mimetype not in compression_config.get('MIME_TYPES', ['application/json'])):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None or response.calculate_content_length() < compression_config.get('MIN_SIZE', 1024):
+        return response
+    response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, is_weak = response.get_etag()
+    if etag:
+        # Compressed body is a different representation, so it can not share ETag of uncompressed one.
+        response.set_etag(f'{etag}-{encoding}', weak=is_weak)
+    return response
+
+
+class PrecompressedStatic:
+    """
+        Files of a static directory read and compressed once (at startup) with every supported encoding.
+        Each variant has its own ETag, so requests are served from memory or answered with 304.
+    """
+
+    def __init__(self, directory: str):
+        """Read and compress all files of directory."""
+        self.directory = directory
+        self.files: dict = {}
+        for file_name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, file_name)  # type: ignore  # noqa: FKA100
+            if os.path.isfile(path):
+                with open(path, 'rb') as static_file:
+                    self.add(file_name=file_name, data=static_file.read())
+
+    def add(self, file_name: str, data: bytes) -> None:
+        """Keep identity and compressed variants of file which are smaller than file."""
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        variants = {None: (data, digest)}
+        for encoding in SUPPORTED_ENCODINGS:
+            compressed = compress(data, encoding)
+            if len(compressed) < len(data):
+                variants[encoding] = (compressed, f'{digest}-{encoding}')
+        self.files[file_name] = variants
+
+    def serve(self, filename: str):
+        """View function which returns variant of file for Accept-Encoding of request, 304 if ETag matches."""
+        variants = self.files.get(filename)
+        if variants is None:
+            abort(404)
+        encoding = choose_encoding(request.accept_encodings)
+        if encoding not in variants:
+            encoding = None
+        data, etag = variants[encoding]
+        response = current_app.response_class(data, mimetype=mimetypes.guess_type(filename)[0]
+                                              or 'application/octet-stream')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(etag)
+        # Clients revalidate on every use, unchanged files are answered with 304 without a body.
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+
+def init_compression(application) -> None:
+    """Register compression hook and precompressed static directories (COMPRESSION.PRECOMPRESSED_STATIC)."""
+    if not compression_config.get('ENABLED', True):
+        return
+    application.after_request(compress_response)
+    for directory in compression_config.get('PRECOMPRESSED_STATIC', ['swagger_json']):
+        path = os.path.join(application.static_folder, directory)  # type: ignore  # noqa: FKA100
+        if not os.path.isdir(path):
+            continue
+        static = PrecompressedStatic(path)
+        application.add_url_rule(f'{application.static_url_path}/{directory}/<path:filename>',
+                                 endpoint=f'precompressed_{directory}', view_func=static.serve)
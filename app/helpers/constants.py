@@ -28,6 +28,7 @@ class HttpStatusCode(enum.Enum):
     UNAUTHORIZED = '401'
     FORBIDDEN = '403'
     NOT_FOUND = '404'
+    CONFLICT = '409'
     INTERNAL_SERVER_ERROR = '500'
     TOO_MANY_REQUESTS = '429'
 
@@ -42,6 +43,8 @@ class HttpStatusCode(enum.Enum):
             return 401
         elif status == cls.FORBIDDEN.value:
             return 403
+        elif status == cls.CONFLICT.value:
+            return 409
         elif status == cls.INTERNAL_SERVER_ERROR.value:
             return 500
         else:
@@ -63,6 +66,12 @@ class ResponseMessageKeys(enum.Enum):
     INVALID_PASSWORD = 'Invalid password.'
     USER_NOT_EXIST = 'Entered Email ID is not registered with us.'
     EMAIL_DETAILS_NOT_FOUND = 'Entered Email ID is not registered with us.'
+    IMPORT_STARTED = 'Import started, check its progress with import id.'
+    IMPORT_NOT_FOUND = 'Import not found.'
+    IMPORT_ALREADY_COMPLETED = 'Import is already completed.'
+    IMPORT_ALREADY_RUNNING = 'Import is already running.'
+    STUDENT_NOT_FOUND = 'Student not found.'
+    BULK_ITEMS_REQUIRED = 'Please send list of students.'
 
 
 SupportedFileTypes = {  # Contains all the supported file types.
@@ -108,6 +117,15 @@ class ValidationMessages(enum.Enum):
 class QueueName:
     """redis queue scheduler names"""
     SEND_MAIL = 'SEND_MAIL'
+    AUDIT_LOG = 'AUDIT_LOG'
+    USER_IMPORT = 'USER_IMPORT'
+
+
+class RedisDatabase:
+    """Logical redis databases, mapped to db numbers by REDIS.DATABASES of config.yml"""
+    QUEUE = 'QUEUE'
+    RATE_LIMIT = 'RATE_LIMIT'
+    CACHE = 'CACHE'
 
 
 class EmailTypes(enum.Enum):
@@ -124,6 +142,7 @@ class SortingOrder(EnumBase):
     """Enum for storing sorting parameters value."""
     ASC = 'asc'
     DESC = 'desc'
+    RELEVANCE = 'relevance'
 
 
 class SortingParams(EnumBase):
@@ -142,3 +161,44 @@ class DatabaseAction(enum.Enum):
     UPDATE = 'update'
     DELETE = 'delete'
     READ = 'read'
+
+
+class AuditGuarantee(EnumBase):
+    """
+        Durability guarantee of audit log entries.
+        - sync: entry is inserted in the same flush as the audited change (one insert per row).
+        - at_commit: entries are buffered during flush and inserted with one multi-row insert at commit.
+        - async: entries are handed to a background writer (thread or rq queue) after commit.
+    """
+    SYNC = 'sync'
+    AT_COMMIT = 'at_commit'
+    ASYNC = 'async'
+
+
+class AuditWriterBackend(EnumBase):
+    """Background writers available for async audit guarantee."""
+    THREAD = 'thread'
+    RQ = 'rq'
+
+
+class RecordFormat(EnumBase):
+    """Formats in which records are exported and imported."""
+    NDJSON = 'ndjson'
+    CSV = 'csv'
+
+
+class ImportStatus(EnumBase):
+    """Status of bulk import."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+
+
+class BulkItemStatus(EnumBase):
+    """Status of each item of bulk student api."""
+    CREATED = 'created'
+    UPDATED = 'updated'
+    DELETED = 'deleted'
+    NOT_FOUND = 'not_found'
+    INVALID = 'invalid'
@@ -1,18 +1,34 @@
 """All custom decorators are defined in this file."""
 from functools import wraps
+import hashlib
+import json
 import time
 from typing import Callable
+from typing import Iterable
 
 from app import config_data
 from app import logger
+from app.helpers.cache import get_token_digest
+from app.helpers.cache import get_view_tag_key
+from app.helpers.cache import token_cache
+from app.helpers.cache import view_cache
+from app.helpers.cache import view_version_cache
+from app.helpers.compression import SUPPORTED_ENCODINGS
 from app.helpers.constants import HttpStatusCode
 from app.helpers.constants import ResponseMessageKeys
+from app.helpers.replica import replica_router
 from app.helpers.utility import send_json_response
 from app.models.user import User
+from flask import current_app
 from flask import g
 from flask import request
 import jwt
 
+token_cache_enabled = (config_data.get('AUTH_CACHE') or {}).get('ENABLED', True)
+view_cache_enabled = (config_data.get('VIEW_CACHE') or {}).get('ENABLED', True)
+# Headers which are not stored with cached responses.
+VIEW_CACHE_SKIPPED_HEADERS = ('Content-Length', 'Set-Cookie', 'Time-Log')
+
 
 def token_required(f: Callable) -> Callable:  # type: ignore  # noqa: C901
     """To check request contains valid token.
@@ -21,7 +37,9 @@ def token_required(f: Callable) -> Callable:  # type: ignore  # noqa: C901
     3. If user is owner/crew then it verifies the db to confirm if user belongs to org_id in jwt
     5. If user is a crew in the org_id then we check if they have the permission optionally passed with the url rule: if permission if not found then we return access denied.
     4. If yes then it also cross checks the token with the token saved in the device token dict in user table
-    5. If found to match then it allows access to the api else denies access to the request"""
+    5. If found to match then it allows access to the api else denies access to the request
+    6. Verified tokens are cached in Redis (keyed by token digest) so that subsequent requests skip the user lookup,
+       cache entries are invalidated by User events when token is rotated or user is deactivated/deleted"""
     @wraps(f)
     def decorated(*args, **kwargs):
         """This method validates token with DB token."""
@@ -42,9 +60,14 @@ def token_required(f: Callable) -> Callable:  # type: ignore  # noqa: C901
             # decoding the payload to fetch the stored details
             data = jwt.decode(jwt=token, key=config_data.get(
                 'SECRET_KEY'), algorithms=['HS256'])
-            current_user = User.query \
-                .filter_by(id=data['id']) \
-                .first()
+            token_key = get_token_digest(token)
+            cached_state = token_cache.get(token_key) if token_cache_enabled else None
+            if cached_state:
+                current_user = User.from_cache_state(cached_state)
+            else:
+                current_user = User.query \
+                    .filter_by(id=data['id']) \
+                    .first()
 
             if current_user:
                 if current_user.auth_token != token:
@@ -52,6 +75,10 @@ def token_required(f: Callable) -> Callable:  # type: ignore  # noqa: C901
                                               message_key=ResponseMessageKeys.INVALID_TOKEN.value,
                                               data=None,
                                               error=None)
+                if not cached_state and token_cache_enabled:
+                    # Cached entry must not outlive the token itself.
+                    token_cache.set(token_key, current_user.to_cache_state(),
+                                    ttl=data['exp'] - time.time() if data.get('exp') else None)
 
             else:
                 return send_json_response(http_status=HttpStatusCode.UNAUTHORIZED.value, response_status=False,
@@ -83,9 +110,81 @@ def api_time_logger(method: Callable) -> Callable:
     @wraps(method)
     def wrapper(*args, **kwargs):
         """This method calculate time difference."""
-        start = time.time()
+        start = time.perf_counter()
         response = method(*args, **kwargs)
-        end = time.time()
+        end = time.perf_counter()
         g.time_log = round(end - start, 5)  # type: ignore  # noqa: FKA100
         return response
     return wrapper
+
+
+def get_view_cache_key(vary_on: Iterable, tags: Iterable) -> str:
+    """
+        Return cache key of current request: endpoint and path, parts of request listed in vary_on
+        ('user': logged in user, 'args': query string) and current versions of tags.
+    """
+    parts = [request.endpoint, request.path]
+    if 'user' in vary_on:
+        parts.append(getattr(request, 'user_id', None))
+    if 'args' in vary_on:
+        parts.append(sorted(request.args.items(multi=True)))
+    parts.append([view_version_cache.get_version(get_view_tag_key(tag)) for tag in tags])
+    return 'view:' + hashlib.sha256(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def cached_view(ttl: int = 60, vary_on: Iterable = ('user', 'args'), tags: Iterable = ()) -> Callable:
+    """To cache responses of GET api.
+    1. Successful responses are stored (body and headers) in view cache (Redis with in-process L1) for ttl seconds,
+       keyed by request parts listed in vary_on and versions of tags.
+    2. Tags are table names, AuditableEvent invalidates tags of tables written in a transaction after it commits,
+       so views cached with them are never read again.
+    3. Responses carry ETag of body, requests with matching If-None-Match are answered with 304.
+    4. Responses read from a replica are cached for DATABASE_REPLICAS.STICKY_SECONDS at most.
+    It has to be applied below token_required so that logged in user is known."""
+    def decorator(f: Callable) -> Callable:
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            """This method returns cached response or caches response of view."""
+            if request.method != 'GET' or not view_cache_enabled:
+                return f(*args, **kwargs)
+            key = get_view_cache_key(vary_on=vary_on, tags=tags)
+            cached = view_cache.get(key)
+            if cached is None:
+                response = current_app.make_response(f(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed or response.direct_passthrough:
+                    return response
+                body = response.get_data()
+                cached = {'body': body, 'etag': hashlib.sha256(body).hexdigest()[:32],
+                          'headers': [(name, value) for name, value in response.headers
+                                      if name not in VIEW_CACHE_SKIPPED_HEADERS]}
+                view_cache.set(key, cached, ttl=replica_router.get_cache_ttl(ttl))
+            # Compressed responses carry ETag with encoding suffix, see compress_response.
+            etags = [cached['etag']] + [f'{cached["etag"]}-{encoding}' for encoding in SUPPORTED_ENCODINGS]
+            if any(etag in request.if_none_match for etag in etags):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.response_class(cached['body'], headers=cached['headers'])
+            response.set_etag(cached['etag'])
+            return response
+        return decorated
+    return decorator
+
+
+def read_replica(f: Callable) -> Callable:
+    """To read from a replica in read-only api (see DATABASE_REPLICAS section of config.yml).
+    1. SELECTs of GET requests go to replica chosen once for the request (round-robin or least latency).
+    2. Reads go to primary for STICKY_SECONDS after a write of same user (or ip) and when no replica is healthy.
+    3. Writes always go to primary, and so do reads of the request after its first write.
+    It has to be applied below token_required so that logged in user is known."""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        """This method marks reads of request as safe to send to a replica."""
+        if request.method not in ('GET', 'HEAD'):
+            return f(*args, **kwargs)
+        g.read_replica = True
+        g.pop('replica_bind', None)
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.read_replica = False
+    return decorated
@@ -0,0 +1,95 @@
+"""Contains JSON provider used by flask to serialize responses, with orjson when it is installed."""
+import dataclasses
+from datetime import date
+from datetime import datetime
+from datetime import time
+import decimal
+import json
+import re
+from typing import Any
+import uuid
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+COMPACT_SEPARATORS = (',', ':')
+# stdlib writes floats below 1e-4 and from 1e16 in exponent notation ('1e-05', '1e+16') while orjson writes
+# '0.00001' and '1e16'. Patterns start with a literal so that whole response is scanned in C.
+ORJSON_EXPONENT = re.compile(rb'e-?\d+(?:[,}\]]|$)')
+ORJSON_SMALL_FLOAT = re.compile(rb'0\.0000')
+NUMBER_PREFIXES = b':,[-'
+
+
+def has_float_mismatch(data: bytes) -> bool:
+    """
+        Return True if orjson output may contain a float which stdlib writes differently, such output is
+        serialized again with stdlib (strings which look like such floats only cost that second pass).
+    """
+    if ORJSON_EXPONENT.search(data):
+        return True
+    # Fraction of seconds of ISO datetimes ('10:30:00.000011') also contain '0.0000', but after a digit.
+    return any(match.start() == 0 or data[match.start() - 1] in NUMBER_PREFIXES
+               for match in ORJSON_SMALL_FLOAT.finditer(data))
+
+
+def json_default(value: Any) -> Any:
+    """Convert value which json can not serialize natively, datetimes are written in ISO 8601 format as orjson does."""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+        JSON provider of application, compact responses are serialized with orjson if it is installed
+        (JSON.ENCODER: auto or orjson) and with stdlib json otherwise. Both encoders produce same bytes:
+        - keys are sorted, non-ASCII characters are written as UTF-8 and datetimes in ISO 8601 format.
+        - values orjson can not serialize the same way (non-string keys, integers above 64 bits, floats in
+          exponent notation) are serialized with stdlib json.
+        Pretty printed responses (debug mode) and `flask.json.dumps` with other arguments use stdlib json.
+    """
+    ensure_ascii = False
+    default = staticmethod(json_default)  # type: ignore
+
+    def __init__(self, app, encoder: str = 'auto'):
+        """Initialize provider, encoder is auto (orjson if installed), orjson or stdlib."""
+        super().__init__(app)
+        if encoder == 'orjson' and orjson is None:
+            raise ImportError('JSON.ENCODER is orjson but orjson is not installed.')
+        self.use_orjson = orjson is not None and encoder != 'stdlib'
+
+    def dumps_compact(self, obj: Any) -> bytes:
+        """Serialize obj with compact separators to UTF-8 bytes."""
+        if self.use_orjson:
+            try:
+                data = orjson.dumps(obj, default=self.default,
+                                    option=orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS)
+                if not has_float_mismatch(data):
+                    return data
+            except orjson.JSONEncodeError:
+                pass
+        return json.dumps(obj, default=self.default, ensure_ascii=self.ensure_ascii, sort_keys=self.sort_keys,
+                          separators=COMPACT_SEPARATORS).encode()
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        """Serialize obj to string, only compact output without other arguments can use orjson."""
+        if kwargs == {'separators': COMPACT_SEPARATORS}:
+            return self.dumps_compact(obj).decode()
+        return super().dumps(obj, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any) -> Any:
+        """Return JSON response, compact body is written as bytes without decoding it to string."""
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_compact(obj) + b'\n', mimetype=self.mimetype)
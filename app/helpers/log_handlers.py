@@ -0,0 +1,219 @@
+"""Contains logging handlers of application logger: queue handler and listener, JSON formatter and sampling."""
+import atexit
+import copy
+from datetime import datetime
+from datetime import timezone
+import gzip
+import json
+import logging
+from logging.handlers import QueueHandler
+from logging.handlers import QueueListener
+from logging.handlers import TimedRotatingFileHandler
+import os
+import queue
+import random
+import shutil
+import threading
+from typing import Any
+
+TEXT_FORMAT = '%(asctime)s: %(levelname)s {%(filename)s:%(lineno)d} -> %(message)s'
+# Attributes of every LogRecord, other attributes of a record are `extra` fields written by JSONFormatter.
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats record as one JSON object per line, `extra` fields of record are written as keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Return JSON line of record."""
+        data = {'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+                'level': record.levelname, 'logger': record.name, 'message': record.getMessage(),
+                'file': record.filename, 'line': record.lineno, 'process': record.process,
+                'thread': record.threadName}
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exception'] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                data[key] = value
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps `rate` fraction of records below WARNING, warnings and errors are always kept."""
+
+    def __init__(self, rate: float):
+        """Initialize filter with fraction (0 to 1) of records to keep."""
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """Return True if record is kept."""
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+        Hands records over to listener thread through a bounded queue, request threads never do file I/O.
+        When queue is full records are dropped (policy `drop`) or wait up to `block_timeout` seconds for space
+        (policy `block`) before they are dropped. Number of dropped records is logged once there is space again.
+    """
+
+    def __init__(self, log_queue: queue.Queue, policy: str = 'drop', block_timeout: float = 1):
+        """Initialize handler with queue and full queue policy."""
+        super().__init__(log_queue)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Return copy of record with message and traceback rendered, formatting (and JSON encoding) of record is
+        left to listener thread.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def put(self, record: logging.LogRecord) -> bool:
+        """Put record into queue according to policy, returns False if queue stayed full."""
+        try:
+            if self.policy == 'block':
+                self.queue.put(record, block=True, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+            return True
+        except queue.Full:
+            return False
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """Enqueue record, preceded by a warning with number of records dropped since last enqueue."""
+        if self.dropped:
+            with self.dropped_lock:
+                dropped, self.dropped = self.dropped, 0
+            warning = logging.LogRecord(record.name, logging.WARNING, __file__, 0,
+                                        f'{dropped} log records were dropped, log queue was full', None, None)
+            if not self.put(warning):
+                with self.dropped_lock:
+                    self.dropped += dropped
+        if not self.put(record):
+            with self.dropped_lock:
+                self.dropped += 1
+
+
+class QueueLogging:
+    """
+        Bounded queue handler of logger and listener thread which writes records of its queue to file handler.
+        Listener thread does not survive fork, child process starts its own with a new queue (see restart).
+    """
+
+    def __init__(self, file_handler: logging.Handler, log_config: dict):
+        """Initialize queue handler of LOGGING config, listener is started by start."""
+        self.file_handler = file_handler
+        self.queue_size = log_config.get('QUEUE_SIZE', 10000)
+        self.handler = BoundedQueueHandler(queue.Queue(maxsize=self.queue_size),
+                                           policy=log_config.get('FULL_POLICY', 'drop'),
+                                           block_timeout=log_config.get('BLOCK_TIMEOUT', 1))
+        self.listener: Any = None
+
+    def start(self) -> None:
+        """Start listener thread writing records of handler queue."""
+        self.listener = QueueListener(self.handler.queue, self.file_handler, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self) -> None:
+        """Write records still in queue and stop listener thread, it is called at exit."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def restart(self) -> None:
+        """
+        Start new queue and listener in child process after fork, queue of parent is replaced as its lock may
+        have been held by listener thread of parent.
+        """
+        self.handler.queue = queue.Queue(maxsize=self.queue_size)
+        self.listener = None
+        self.start()
+
+
+def get_free_path(path: str) -> str:
+    """Return path, or path with `.1`, `.2` ... inserted before its extension while such file exists."""
+    base, extension = os.path.splitext(path)
+    index = 0
+    while os.path.exists(path):
+        index += 1
+        path = f'{base}.{index}{extension}'
+    return path
+
+
+def get_rotated_name(name: str) -> str:
+    """
+    Namer of file handler: name of compressed rotated file. It is numbered if file of same period exists
+    (rotated by another process writing same log file), as file handler would remove it otherwise.
+    """
+    return get_free_path(name + '.gz')
+
+
+def compress_rotated(source: str, destination: str) -> None:
+    """
+    Rotator of file handler: gzip rotated log file, it runs on listener thread.
+    Processes writing same log file roll it over one after another: source is renamed first so that only one of
+    them compresses it (others find nothing to rotate) and existing compressed files are never overwritten.
+    """
+    claimed = f'{source}.{os.getpid()}.rotating'
+    try:
+        os.rename(source, claimed)
+    except FileNotFoundError:
+        return
+    while True:
+        try:
+            destination_file = gzip.open(destination, 'xb')
+            break
+        except FileExistsError:
+            destination = get_free_path(destination)
+    with open(claimed, 'rb') as source_file, destination_file:
+        shutil.copyfileobj(source_file, destination_file)
+    os.remove(claimed)
+
+
+def build_file_handler(log_file: str, log_config: dict) -> logging.Handler:
+    """Return rotating file handler of LOGGING config, rotated files are compressed if COMPRESS_ROTATED is set."""
+    handler = TimedRotatingFileHandler(log_file, when=log_config.get('ROTATION_WHEN', 'midnight'), interval=1,
+                                       backupCount=log_config.get('BACKUP_COUNT', 7), delay=True)
+    if log_config.get('COMPRESS_ROTATED', False):
+        handler.namer = get_rotated_name
+        handler.rotator = compress_rotated
+    handler.setFormatter(JSONFormatter() if log_config.get('FORMAT', 'text') == 'json'
+                         else logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def configure_logger(logger: logging.Logger, log_file: str, log_config: dict) -> Any:
+    """
+    Attach handlers of LOGGING section of config.yml to logger, returns QueueLogging of logger in queue mode:
+    - MODE `queue`: records are enqueued by logging thread and written (and rotated) by a listener thread.
+    - MODE `sync`: records are written by logging thread.
+    """
+    logger.setLevel(log_config.get('LEVEL', 'DEBUG'))
+    file_handler = build_file_handler(log_file=log_file, log_config=log_config)
+    queue_logging = None
+    if log_config.get('MODE', 'queue') != 'queue':
+        handler = file_handler
+    else:
+        queue_logging = QueueLogging(file_handler=file_handler, log_config=log_config)
+        queue_logging.start()
+        # Records still in queue are written at exit.
+        atexit.register(queue_logging.stop)
+        os.register_at_fork(after_in_child=queue_logging.restart)
+        handler = queue_logging.handler
+    if log_config.get('INFO_SAMPLE_RATE', 1) < 1:
+        handler.addFilter(SamplingFilter(rate=log_config.get('INFO_SAMPLE_RATE', 1)))
+    logger.addHandler(handler)
+    return queue_logging
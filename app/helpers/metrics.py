@@ -0,0 +1,306 @@
+"""Contains request metrics (latency histograms, in-flight gauges, byte counters) exposed at /metrics."""
+import bisect
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any
+from typing import Optional
+
+from app import config_data
+from flask import current_app
+from flask import g
+from flask import request
+
+metrics_config = config_data.get('METRICS') or {}
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+COUNTER = 'counter'
+GAUGE = 'gauge'
+
+
+class MmapValues:
+    """
+        Float values keyed by string in a memory mapped file, written by one process and read by any process.
+        Each entry is key length (4 bytes), key (padded to 8 bytes) and value (8 bytes), file starts with number
+        of used bytes which is updated after entry is written, so readers never see partial entries.
+    """
+    INITIAL_SIZE = 1 << 16
+
+    def __init__(self, path: str):
+        """Open (or create) file and index its entries."""
+        self.file = open(path, 'a+b')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            self.file.truncate(self.INITIAL_SIZE)
+        self.capacity = os.fstat(self.file.fileno()).st_size
+        self.mmap = mmap.mmap(self.file.fileno(), self.capacity)
+        self.used = struct.unpack_from('i', self.mmap, 0)[0] or 8  # type: ignore  # noqa: FKA100
+        self.positions = {key: position for key, value, position in self.read_entries(self.mmap, self.used)}
+
+    @staticmethod
+    def read_entries(data: Any, used: int) -> Any:
+        """Yields (key, value, position of value) of entries in first `used` bytes of data."""
+        position = 8
+        while position < used:
+            key_length = struct.unpack_from('i', data, position)[0]  # type: ignore  # noqa: FKA100
+            key = bytes(data[position + 4:position + 4 + key_length]).decode()
+            position += 4 + key_length + (-(4 + key_length) % 8)
+            yield key, struct.unpack_from('d', data, position)[0], position  # type: ignore  # noqa: FKA100
+            position += 8
+
+    @classmethod
+    def read_file(cls, path: str) -> Any:
+        """Yields (key, value) of entries of file written by another process."""
+        with open(path, 'rb') as values_file:
+            data = values_file.read()
+        if len(data) >= 8:
+            for key, value, position in cls.read_entries(data, struct.unpack_from('i', data, 0)[0]):  # type: ignore  # noqa: FKA100
+                yield key, value
+
+    def add_entry(self, key: str) -> int:
+        """Append entry of key with value 0, file is grown when it is full. Returns position of value."""
+        encoded = key.encode()
+        entry = struct.pack('i', len(encoded)) + encoded + b'\0' * (-(4 + len(encoded)) % 8)
+        if self.used + len(entry) + 8 > self.capacity:
+            while self.used + len(entry) + 8 > self.capacity:
+                self.capacity *= 2
+            self.mmap.close()
+            self.file.truncate(self.capacity)
+            self.mmap = mmap.mmap(self.file.fileno(), self.capacity)
+        self.mmap[self.used:self.used + len(entry) + 8] = entry + struct.pack('d', 0.0)
+        self.used += len(entry) + 8
+        struct.pack_into('i', self.mmap, 0, self.used)  # type: ignore  # noqa: FKA100
+        self.positions[key] = self.used - 8
+        return self.used - 8
+
+    def add(self, key: str, amount: float) -> None:
+        """Add amount to value of key."""
+        position = self.positions.get(key)
+        if position is None:
+            position = self.add_entry(key)
+        value = struct.unpack_from('d', self.mmap, position)[0]  # type: ignore  # noqa: FKA100
+        struct.pack_into('d', self.mmap, position, value + amount)  # type: ignore  # noqa: FKA100
+
+
+class ProcessValues(dict):
+    """Float values keyed by string in memory of this process, same interface as MmapValues."""
+
+    def add(self, key: str, amount: float) -> None:
+        """Add amount to value of key."""
+        self.setdefault(key, 0.0)
+        self[key] += amount
+
+
+class MetricsStore:
+    """
+        Counter and gauge values of this process. With a directory (shared by gunicorn workers) values are kept in
+        memory mapped files `<kind>_<pid>.db` and `collect` sums files of all processes, gauges of processes which
+        exited are skipped. Without a directory values are kept in memory of this process only.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        """Initialize store, files are opened on first write."""
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.values: dict = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self) -> None:
+        """Forget values of parent process, child process writes its own files."""
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def get_values(self, kind: str) -> Any:
+        """Return values of kind of this process."""
+        values = self.values.get(kind)
+        if values is None:
+            values = ProcessValues() if not self.directory else MmapValues(
+                os.path.join(self.directory, f'{kind}_{os.getpid()}.db'))  # type: ignore  # noqa: FKA100
+            self.values[kind] = values
+        return values
+
+    def add(self, kind: str, amounts: Any) -> None:
+        """Add amounts to counter or gauge values, amounts are (key, amount) pairs."""
+        with self.lock:
+            values = self.get_values(kind)
+            for key, amount in amounts:
+                values.add(key, amount)
+
+    def collect(self) -> dict:
+        """Return {kind: {key: value}} summed over all processes."""
+        totals: dict = {COUNTER: {}, GAUGE: {}}
+        if not self.directory:
+            with self.lock:
+                for kind, values in self.values.items():
+                    totals[kind].update(values)
+            return totals
+        for path in glob.glob(os.path.join(self.directory, '*.db')):  # type: ignore  # noqa: FKA100
+            kind, pid = os.path.basename(path)[:-3].rsplit('_', 1)
+            if kind not in totals or (kind == GAUGE and not is_process_alive(int(pid))):
+                continue
+            for key, value in MmapValues.read_file(path):
+                totals[kind][key] = totals[kind].get(key, 0.0) + value
+        return totals
+
+
+def is_process_alive(pid: int) -> bool:
+    """Return True if process with pid is running."""
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def get_key(name: str, labels: tuple) -> str:
+    """Return store key of sample name and (label, value) pairs."""
+    return json.dumps([name, labels], separators=(',', ':'))
+
+
+class RequestMetrics:
+    """
+        Request metrics of application, labelled by url rule (`unmatched` for 404s) and method:
+        - http_request_duration_seconds: histogram of latency (monotonic clock) by status as well.
+        - http_requests_in_progress: requests being handled.
+        - http_request_size_bytes_total / http_response_size_bytes_total: body bytes (response bytes as sent,
+          i.e. compressed, streamed responses of unknown length are not counted).
+    """
+
+    def __init__(self, store: MetricsStore, buckets: Any = DEFAULT_BUCKETS):
+        """Initialize metrics with store and upper bounds of histogram buckets."""
+        self.store = store
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets))
+        # Values of `le` label, last bucket (+Inf) counts requests slower than every bound.
+        self.bucket_names = tuple(str(bucket) for bucket in self.buckets) + ('+Inf',)
+        self.keys: dict = {}
+
+    def get_keys(self, labels: tuple, status: Any) -> dict:
+        """Return store keys of requests with endpoint/method labels and status, built once per combination."""
+        keys = self.keys.get((labels, status))
+        if keys is None:
+            status_labels = labels + (('status', str(status)),) if status is not None else labels
+            keys = {'in_progress': get_key(name='http_requests_in_progress', labels=labels),
+                    'buckets': tuple(get_key(name='http_request_duration_seconds_bucket',
+                                             labels=status_labels + (('le', bucket),))
+                                     for bucket in self.bucket_names),
+                    'sum': get_key(name='http_request_duration_seconds_sum', labels=status_labels),
+                    'count': get_key(name='http_request_duration_seconds_count', labels=status_labels),
+                    'request_size': get_key(name='http_request_size_bytes_total', labels=labels),
+                    'response_size': get_key(name='http_response_size_bytes_total', labels=status_labels)}
+            self.keys[(labels, status)] = keys
+        return keys
+
+    def before_request(self) -> None:
+        """Start timer of request and count it as in progress."""
+        labels = ('endpoint', request.url_rule.rule if request.url_rule else 'unmatched'), ('method', request.method)
+        g.request_metrics = {'started_at': time.perf_counter(), 'labels': labels, 'status': 500,
+                             'response_size': None}
+        self.store.add(GAUGE, ((self.get_keys(labels=labels, status=None)['in_progress'], 1),))
+
+    def after_request(self, response: Any) -> Any:
+        """Keep status and size of response, it is registered before compression so compressed size is counted."""
+        state = g.get('request_metrics')
+        if state is not None:
+            state['status'] = response.status_code
+            state['response_size'] = None if response.is_streamed else response.calculate_content_length()
+        return response
+
+    def teardown_request(self, exception_error: Any = None) -> None:
+        """Observe latency and bytes of request, requests which raised are counted with status 500."""
+        state = g.pop('request_metrics', None)
+        if state is None:
+            return
+        duration = time.perf_counter() - state['started_at']
+        self.store.add(GAUGE, ((self.get_keys(labels=state['labels'], status=None)['in_progress'], -1),))
+        keys = self.get_keys(labels=state['labels'], status=state['status'])
+        amounts = [(keys['buckets'][bisect.bisect_left(self.buckets, duration)], 1), (keys['sum'], duration),
+                   (keys['count'], 1)]
+        if request.content_length:
+            amounts.append((keys['request_size'], request.content_length))
+        if state['response_size']:
+            amounts.append((keys['response_size'], state['response_size']))
+        self.store.add(COUNTER, amounts)
+
+    def render(self) -> str:
+        """Return all metrics in Prometheus text format, histogram buckets are made cumulative."""
+        totals = self.store.collect()
+        samples: dict = {}
+        histograms: dict = {}
+        for kind in (COUNTER, GAUGE):
+            for key, value in sorted(totals[kind].items()):
+                name, labels = json.loads(key)
+                labels = tuple(tuple(label) for label in labels)
+                if name == 'http_request_duration_seconds_bucket':
+                    histograms.setdefault(labels[:-1], {})[labels[-1][1]] = value
+                else:
+                    samples.setdefault(name, []).append((labels, value))
+        for labels, counts in sorted(histograms.items()):
+            cumulative = 0.0
+            for bucket in self.bucket_names:
+                cumulative += counts.get(bucket, 0.0)
+                samples.setdefault('http_request_duration_seconds_bucket', []).append(
+                    (labels + (('le', bucket),), cumulative))
+        lines = []
+        for name, metric_type, description, sample_names in METRIC_FAMILIES:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for sample_name in sample_names:
+                for labels, value in samples.get(sample_name, []):
+                    label_text = ','.join(f'{label}="{escape_label(label_value)}"' for label, label_value in labels)
+                    lines.append(f'{sample_name}{{{label_text}}} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+METRIC_FAMILIES = (
+    ('http_request_duration_seconds', 'histogram', 'Latency of requests by endpoint, method and status.',
+     ('http_request_duration_seconds_bucket', 'http_request_duration_seconds_sum',
+      'http_request_duration_seconds_count')),
+    ('http_requests_in_progress', 'gauge', 'Requests being handled by endpoint and method.',
+     ('http_requests_in_progress',)),
+    ('http_request_size_bytes_total', 'counter', 'Bytes of request bodies by endpoint and method.',
+     ('http_request_size_bytes_total',)),
+    ('http_response_size_bytes_total', 'counter', 'Bytes of response bodies sent by endpoint, method and status.',
+     ('http_response_size_bytes_total',)),
+)
+
+
+def escape_label(value: Any) -> str:
+    """Escape label value for Prometheus text format."""
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_value(value: float) -> str:
+    """Return sample value, integral values without fraction and non-finite ones as +Inf, -Inf and NaN."""
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def metrics_view() -> Any:
+    """Returns metrics of all worker processes in Prometheus text format."""
+    return current_app.response_class(request_metrics.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+request_metrics = RequestMetrics(
+    store=MetricsStore(directory=os.environ.get('PROMETHEUS_MULTIPROC_DIR') or metrics_config.get('MULTIPROCESS_DIR')),
+    buckets=metrics_config.get('BUCKETS') or DEFAULT_BUCKETS)
+
+
+def init_metrics(application) -> None:
+    """Register request hooks and /metrics view (see METRICS section of config.yml)."""
+    if not metrics_config.get('ENABLED', True):
+        return
+    application.before_request(request_metrics.before_request)
+    application.after_request(request_metrics.after_request)
+    application.teardown_request(request_metrics.teardown_request)
+    application.add_url_rule(metrics_config.get('PATH', '/metrics'), endpoint='metrics', view_func=metrics_view)
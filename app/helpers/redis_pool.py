@@ -0,0 +1,131 @@
+"""Contains registry of shared Redis connection pools, one bounded pool per logical database."""
+import threading
+from typing import Any
+
+from app import config_data
+from app import logger
+from app.helpers.constants import RedisDatabase
+import redis
+from redis.exceptions import ConnectionError
+
+
+class MonitoredConnectionPool(redis.BlockingConnectionPool):
+    """
+        Bounded pool which waits up to `timeout` seconds for a free connection instead of opening more than
+        `max_connections`, and keeps utilization counters of this process.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        """Initialize pool and its counters."""
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.peak_in_use = 0
+        self.exhausted = 0
+
+    def get_in_use(self) -> int:
+        """Return number of connections of this process which are checked out of pool."""
+        idle = sum(1 for connection in list(self.pool.queue) if connection is not None)
+        return len(self._connections) - idle
+
+    def get_connection(self, command_name: Any, *keys: Any, **options: Any) -> Any:
+        """Return connection of pool, counts requests which could not get one within timeout."""
+        try:
+            connection = super().get_connection(command_name, *keys, **options)
+        except ConnectionError as exception_error:
+            if str(exception_error) == 'No connection available.':
+                with self.stats_lock:
+                    self.exhausted += 1
+                logger.warning(f'Redis pool of db {self.connection_kwargs.get("db")} exhausted '
+                               f'({self.max_connections} connections)')
+            raise
+        in_use = self.get_in_use()
+        with self.stats_lock:
+            self.peak_in_use = max(self.peak_in_use, in_use)
+        return connection
+
+    def get_stats(self) -> dict:
+        """Return utilization of pool in this process."""
+        in_use = self.get_in_use()
+        return {'db': self.connection_kwargs.get('db'), 'max_connections': self.max_connections,
+                'created': len(self._connections), 'in_use': in_use, 'idle': len(self._connections) - in_use,
+                'peak_in_use': self.peak_in_use, 'exhausted': self.exhausted}
+
+
+class RedisPoolRegistry:
+    """
+        Hands out Redis clients of logical databases (RedisDatabase) configured in REDIS section of config.yml.
+        Logical databases mapped to same db number share one pool, so every process keeps at most
+        REDIS.MAX_CONNECTIONS connections per db number. Connections idle for more than
+        REDIS.HEALTH_CHECK_INTERVAL seconds are pinged before use.
+    """
+
+    def __init__(self, redis_config: dict):
+        """Keep config, pools are created on first use."""
+        self.redis_config = redis_config
+        self.lock = threading.Lock()
+        self.pools: dict = {}
+        self.databases: dict = {}
+
+    def get_db(self, database: str) -> int:
+        """Return db number of logical database, REDIS.DB if it is not listed in REDIS.DATABASES."""
+        databases = self.redis_config.get('DATABASES') or {}
+        if database == RedisDatabase.RATE_LIMIT and database not in databases:
+            # Rate limit db used to be configured in RATE_LIMIT section.
+            return (config_data.get('RATE_LIMIT') or {}).get('REDIS_DB', self.redis_config.get('DB', 0))
+        return databases.get(database, self.redis_config.get('DB', 0))
+
+    def get_pool(self, database: str) -> MonitoredConnectionPool:
+        """Return shared pool of db number of logical database."""
+        db = self.get_db(database)
+        self.databases[database] = db
+        pool = self.pools.get(db)
+        if pool is None:
+            with self.lock:
+                pool = self.pools.get(db)
+                if pool is None:
+                    pool = MonitoredConnectionPool(
+                        max_connections=self.redis_config.get('MAX_CONNECTIONS', 20),
+                        timeout=self.redis_config.get('POOL_TIMEOUT', 5),
+                        host=self.redis_config.get('HOST', 'localhost'), port=self.redis_config.get('PORT', 6379),
+                        db=db, password=self.redis_config.get('PASSWORD'),
+                        socket_connect_timeout=self.redis_config.get('SOCKET_CONNECT_TIMEOUT', 5),
+                        socket_timeout=self.redis_config.get('SOCKET_TIMEOUT'),
+                        health_check_interval=self.redis_config.get('HEALTH_CHECK_INTERVAL', 30))
+                    self.pools[db] = pool
+        return pool
+
+    def get_client(self, database: str) -> redis.Redis:
+        """Return client of logical database using shared pool."""
+        return redis.Redis(connection_pool=self.get_pool(database))
+
+    def get_url(self, database: str) -> str:
+        """Return redis url of logical database, used by libraries which need a storage uri."""
+        return 'redis://{}:{}/{}'.format(self.redis_config.get('HOST', 'localhost'),
+                                         self.redis_config.get('PORT', 6379), self.get_db(database))
+
+    def check_health(self) -> dict:
+        """Ping every created pool, returns {db: True/False}."""
+        health = {}
+        for db, pool in list(self.pools.items()):
+            try:
+                health[str(db)] = bool(redis.Redis(connection_pool=pool).ping())
+            except Exception as exception_error:
+                logger.error(f'Redis db {db} is unavailable : {exception_error}')
+                health[str(db)] = False
+        return health
+
+    def get_stats(self) -> dict:
+        """Return utilization of pools of this process and logical databases using them."""
+        stats = {}
+        for db, pool in list(self.pools.items()):
+            stats[str(db)] = dict(pool.get_stats(), databases=sorted(
+                database for database, database_db in self.databases.items() if database_db == db))
+        return stats
+
+
+redis_pools = RedisPoolRegistry(redis_config=config_data.get('REDIS') or {})
+
+
+def get_redis_client(database: str) -> redis.Redis:
+    """Return client of logical database (RedisDatabase) using shared pool."""
+    return redis_pools.get_client(database)
@@ -0,0 +1,150 @@
+"""Contains routing of reads of read-only views to read replicas (binds listed in DATABASE_REPLICAS)."""
+import itertools
+import threading
+import time
+from typing import Any
+from typing import Optional
+
+from app import logger
+from app.helpers.cache import build_tiered_cache
+from flask import current_app
+from flask import g
+from flask import has_request_context
+from flask import request
+from sqlalchemy import event
+from sqlalchemy import text
+
+# Write timestamps of users, reads of a user go to primary for STICKY_SECONDS after the user's own write.
+write_cache = build_tiered_cache(config_key='DATABASE_REPLICAS', default_prefix='DB_WRITE')
+
+
+class ReplicaRouter:
+    """
+        Chooses replica bind for reads of current request (views marked with read_replica decorator):
+        - Replicas are chosen round-robin or by lowest ping latency (DATABASE_REPLICAS.STRATEGY).
+        - Replicas are pinged every HEALTH_CHECK_INTERVAL seconds, replica whose ping or connection fails is
+          skipped for RETRY_AFTER seconds. Reads go to primary when no replica is healthy.
+        - Reads of a user go to primary for STICKY_SECONDS after the user's own write (read-your-writes).
+    """
+
+    def __init__(self):
+        """Initialize health state of replicas, filled as replicas are used."""
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.states: dict = {}
+        self.monitored_engines: set = set()
+
+    @staticmethod
+    def get_config() -> dict:
+        """Return DATABASE_REPLICAS section of config of current application."""
+        return current_app.config.get('DATABASE_REPLICAS') or {}
+
+    def get_state(self, bind: str) -> dict:
+        """Return health state of replica bind."""
+        state = self.states.get(bind)
+        if state is None:
+            state = self.states.setdefault(bind, {'checked_at': None, 'down_until': 0.0, 'latency': None,
+                                                  'failures': 0})
+        return state
+
+    def mark_down(self, bind: str, error: Any) -> None:
+        """Skip replica for RETRY_AFTER seconds."""
+        state = self.get_state(bind)
+        state['down_until'] = time.monotonic() + self.get_config().get('RETRY_AFTER', 30)
+        state['failures'] += 1
+        logger.error(f'Replica {bind} is unavailable, reads go to other replicas or primary : {error}')
+
+    def monitor(self, bind: str, engine: Any) -> None:
+        """Mark replica down when a connection of its engine is lost while a query runs."""
+        if engine in self.monitored_engines:
+            return
+        with self.lock:
+            if engine in self.monitored_engines:
+                return
+
+            def handle_error(context: Any) -> None:
+                """Mark replica down on disconnect errors."""
+                if context.is_disconnect:
+                    self.mark_down(bind=bind, error=context.original_exception)
+            event.listen(engine, 'handle_error', handle_error)
+            self.monitored_engines.add(engine)
+
+    def is_healthy(self, bind: str, engine: Any) -> bool:
+        """Return True if replica is not marked down, pinging it if its last check is older than interval."""
+        state = self.get_state(bind)
+        now = time.monotonic()
+        if now < state['down_until']:
+            return False
+        if state['checked_at'] is not None and now - state['checked_at'] < self.get_config().get(
+                'HEALTH_CHECK_INTERVAL', 10):
+            return True
+        state['checked_at'] = now
+        try:
+            started_at = time.perf_counter()
+            with engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            latency = time.perf_counter() - started_at
+            # Moving average, so a single slow ping does not move all reads to other replica.
+            state['latency'] = latency if state['latency'] is None else 0.7 * state['latency'] + 0.3 * latency
+            return True
+        except Exception as exception_error:
+            self.mark_down(bind=bind, error=exception_error)
+            return False
+
+    def choose_bind(self, get_engine: Any) -> Optional[str]:
+        """Return healthy replica bind chosen by configured strategy, None if no replica is healthy."""
+        replica_config = self.get_config()
+        healthy = []
+        for bind in replica_config.get('BINDS') or []:
+            engine = get_engine(bind)
+            self.monitor(bind=bind, engine=engine)
+            if self.is_healthy(bind=bind, engine=engine):
+                healthy.append(bind)
+        if not healthy:
+            return None
+        if replica_config.get('STRATEGY', 'round_robin') == 'least_latency':
+            return min(healthy, key=lambda bind: self.get_state(bind)['latency'] or 0)
+        return healthy[next(self.counter) % len(healthy)]
+
+    @staticmethod
+    def get_writer_key() -> str:
+        """Return key of client of current request, logged in user or ip address."""
+        user_id = getattr(request, 'user_id', None)
+        return f'user:{user_id}' if user_id is not None else f'ip:{request.remote_addr}'
+
+    def mark_write(self) -> None:
+        """Send reads of client of current request to primary for STICKY_SECONDS."""
+        replica_config = self.get_config()
+        if not replica_config.get('ENABLED', False) or not replica_config.get('STICKY_SECONDS', 5):
+            return
+        write_cache.set(self.get_writer_key(), time.time(), ttl=replica_config.get('STICKY_SECONDS', 5))
+        # Rest of current request reads from primary as well.
+        g.replica_bind = None
+
+    def is_sticky(self) -> bool:
+        """Return True if client of current request wrote within STICKY_SECONDS."""
+        written_at = write_cache.get(self.get_writer_key(), record_stats=False)
+        return written_at is not None and time.time() - written_at < self.get_config().get('STICKY_SECONDS', 5)
+
+    def get_request_bind(self, get_engine: Any) -> Optional[str]:
+        """Return replica bind for reads of current request, None if reads go to primary. Chosen once per request."""
+        if not has_request_context() or not g.get('read_replica'):
+            return None
+        if 'replica_bind' not in g:
+            g.replica_bind = None
+            if self.get_config().get('ENABLED', False) and not self.is_sticky():
+                g.replica_bind = self.choose_bind(get_engine)
+        return g.replica_bind
+
+    def get_cache_ttl(self, ttl: Any) -> Any:
+        """
+        Return ttl of cache entry built by current request, at most STICKY_SECONDS if it was read from a replica
+        which may not have writes that invalidated previous entry yet.
+        """
+        if has_request_context() and g.get('replica_bind'):
+            sticky_seconds = self.get_config().get('STICKY_SECONDS', 5)
+            return sticky_seconds if ttl is None else min(ttl, sticky_seconds)
+        return ttl
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,39 @@
+"""Contains serializer which converts ORM objects or selected rows to dictionaries."""
+from operator import attrgetter
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Optional
+
+
+class RowSerializer:
+    """
+        Converts ORM objects or rows of column-projected queries (anything exposing values as attributes) to
+        dictionaries. Getters are built once at declaration so that per-row work is one attribute fetch per field:
+        - fields: output key -> attribute name of row.
+        - converters: output key -> function applied on fetched value.
+        - computed: output key -> function called with the row itself.
+    """
+
+    def __init__(self, fields: dict, converters: Optional[dict] = None, computed: Optional[dict] = None):
+        """Precompile getters of fields."""
+        self.keys = tuple(fields)
+        self.columns = tuple(fields.values())
+        getter = attrgetter(*self.columns)
+        # attrgetter returns a single value instead of tuple when it is built with one attribute.
+        self.getter: Callable = getter if len(self.columns) > 1 else (lambda row: (getter(row),))
+        self.converters = tuple((converters or {}).items())
+        self.computed = tuple((computed or {}).items())
+
+    def serialize(self, row: Any) -> dict:
+        """Return dictionary of one row."""
+        data = dict(zip(self.keys, self.getter(row)))
+        for key, converter in self.converters:
+            data[key] = converter(data[key])
+        for key, function in self.computed:
+            data[key] = function(row)
+        return data
+
+    def serialize_all(self, rows: Iterable) -> list:
+        """Return list of dictionaries of rows."""
+        return list(map(self.serialize, rows))
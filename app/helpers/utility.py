@@ -1,20 +1,42 @@
 """Common methods is defined here."""
+import base64
+from contextlib import contextmanager
+from datetime import date
 from datetime import datetime
 from datetime import timezone
+import hashlib
+import json
 import math
 import random
 from random import randint
 import re
 import string
 from typing import Any
+from typing import Iterable
+from typing import Iterator
+import zlib
 
 from app import config_data
+from app import db
+from app import logger
+from app.helpers.cache import build_tiered_cache
 from app.helpers.constants import ValidationMessages
 from flask import jsonify
 from hashids import Hashids
 import jwt
+from sqlalchemy import func
+from sqlalchemy.orm import Query
+from sqlalchemy.orm import Session
 
 hash_id = Hashids(min_length=7, salt=config_data.get('HASH_ID_SALT'))
+pagination_config = config_data.get('PAGINATION') or {}
+count_cache = build_tiered_cache(config_key='PAGINATION', default_prefix='PAGINATION_COUNT')
+
+
+def add_months(value: Any, months: int) -> date:
+    """Returns first day of the month which is `months` months after month of given date."""
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
 
 
 def days_to_seconds(days: int) -> int:
@@ -85,53 +107,127 @@ def is_token_valid(token: bytes) -> bool:
         return False
 
 
+class RequestSchema:
+    """
+    Validation schema of request data, compiled once (at import time of view) instead of on every request:
+    - field_types: field -> type, values of int/float fields are converted before type check.
+    - required_fields: fields which must not be missing or empty.
+    Error messages of every field are built at compile time, request data is walked once by `validate`.
+    """
+    REQUIRED_EMPTY_VALUES = (None, '')
+
+    def __init__(self, field_types: Any = None, required_fields: Any = None, prefix: Any = None,
+                 module_name: Any = None):
+        """Compile type checks and required checks of fields."""
+        self.field_types = dict(field_types or {})
+        self.required_fields = list(required_fields or [])
+        self.type_checks = tuple((field, self.get_converter(field_type), field_type,
+                                  self.get_type_message(field=field, field_type=field_type, prefix=prefix))
+                                 for field, field_type in self.field_types.items())
+        self.required_checks = tuple((field, self.get_required_message(field=field, prefix=prefix,
+                                                                       module_name=module_name))
+                                     for field in self.required_fields)
+        # Fields checked by validate in one pass: (field, type check or None, required message or None).
+        type_check_by_field = {check[0]: check for check in self.type_checks}
+        messages = dict(self.required_checks)
+        self.checks = tuple((field, type_check_by_field.get(field), messages.get(field))
+                            for field in list(self.field_types) + [field for field in self.required_fields
+                                                                   if field not in self.field_types])
+
+    @staticmethod
+    def get_converter(field_type: Any) -> Any:
+        """Return function converting value of int/float field, None for other types."""
+        if field_type not in (int, float):
+            return None
+
+        def convert(value: Any) -> Any:
+            try:
+                return field_type(value)
+            except Exception:
+                return value
+        return convert
+
+    @staticmethod
+    def get_type_message(field: str, field_type: Any, prefix: Any = None) -> str:
+        """Return message of value of field which is not of field_type."""
+        type_name = TYPE_NAMES.get(field_type, field_type.__name__)  # type: ignore  # noqa: FKA100
+        if prefix:
+            return f'{prefix} {field} should be {type_name} value.'
+        formatted_field = field.replace('_', ' ').title()  # type: ignore  # noqa: FKA100
+        return f'{formatted_field} should be {type_name} value.'
+
+    @staticmethod
+    def get_required_message(field: str, prefix: Any = None, module_name: Any = None) -> str:
+        """Return message of missing field."""
+        try:
+            message = ValidationMessages[field.upper()].value
+            if module_name and field == ValidationMessages.NAME.name.lower():
+                message = module_name.replace(  # type: ignore  # noqa: FKA100
+                    '_', ' ').capitalize() + ' ' + message
+            return message
+        except Exception:
+            if prefix:
+                return f'{prefix} {field} is required.'
+            formatted_field = re.sub(r'(_uuids)|(_ids)|(_uuid)|(_id)', '',  # type: ignore  # noqa: FKA100
+                                     field)
+            formatted_field = formatted_field.replace('_', ' ').title()  # type: ignore  # noqa: FKA100
+            return f'{formatted_field} is required.'
+
+    def check_types(self, request_data: Any) -> dict:
+        """Check types of fields, returns errors or data with converted values (see field_type_validator)."""
+        cleaned_data = {}
+        errors = {}
+        for field, converter, field_type, message in self.type_checks:
+            field_value = request_data.get(field)
+            if field_value is not None:
+                if converter is not None:
+                    field_value = converter(field_value)
+                if type(field_value) is not field_type:
+                    errors[field] = message
+            cleaned_data[field] = field_value
+        return {'is_error': bool(errors), 'data': errors or cleaned_data}
+
+    def check_required(self, request_data: Any) -> dict:
+        """Check required fields, returns errors of missing fields (see required_validator)."""
+        errors = {field: message for field, message in self.required_checks
+                  if request_data.get(field) in self.REQUIRED_EMPTY_VALUES}
+        return {'is_error': bool(errors), 'data': errors}
+
+    def validate(self, request_data: Any) -> dict:
+        """
+        Check types and then required fields in one pass over fields:
+        type errors if any, else errors of missing fields if any, else data with converted values.
+        """
+        cleaned_data = {}
+        type_errors = {}
+        required_errors = {}
+        for field, type_check, required_message in self.checks:
+            field_value = request_data.get(field)
+            if required_message is not None and field_value in self.REQUIRED_EMPTY_VALUES:
+                required_errors[field] = required_message
+            if type_check is None:
+                continue
+            if field_value is not None:
+                if type_check[1] is not None:
+                    field_value = type_check[1](field_value)
+                if type(field_value) is not type_check[2]:
+                    type_errors[field] = type_check[3]
+            cleaned_data[field] = field_value
+        if type_errors:
+            return {'is_error': True, 'data': type_errors}
+        if required_errors:
+            return {'is_error': True, 'data': required_errors}
+        return {'is_error': False, 'data': cleaned_data}
+
+
 def field_type_validator(request_data: dict = {}, field_types: dict = {}, prefix: str = '') -> dict:
     """
     Validate given dict of fields and their types:
     Iterates over field_types keys and checks if the values received from the request match the values specified in the api function
     If one does not match it returns and error with the field name
+    Views declare RequestSchema once instead, this compiles schema on every call.
     """
-    cleaned_data = {}
-    errors = {}
-    is_error = False
-    for field in field_types.keys():
-        field_value = request_data.get(field)
-
-        if field_value is not None:
-            field_type = field_types[field]
-
-            if field_type == float:
-                try:
-                    field_value = float(field_value)
-                except Exception as e:  # type: ignore  # noqa: F841
-                    pass
-            if field_type == int:
-                try:
-                    field_value = int(field_value)
-                except Exception as e:  # type: ignore  # noqa: F841
-                    pass
-            if field_type == int:
-                try:
-                    field_value = int(field_value)
-                except Exception as e:  # type: ignore  # noqa: F841
-                    pass
-            if type(field_value) != field_type:
-                type_name = TYPE_NAMES.get(field_type, field_type.__name__)  # type: ignore  # noqa: FKA100
-
-                if prefix:
-                    message = f'{prefix} {field} should be {type_name} value.'
-                else:
-                    formatted_field = field.replace('_', ' ').title()  # type: ignore  # noqa: FKA100
-                    message = f'{formatted_field} should be {type_name} value.'
-
-                errors[field] = message
-
-                if is_error is False:
-                    is_error = True
-
-        cleaned_data[field] = field_value
-
-    return {'is_error': is_error, 'data': errors if is_error else cleaned_data}
+    return RequestSchema(field_types=field_types, prefix=prefix).check_types(request_data)
 
 
 def required_validator(request_data: dict = {}, required_fields: list = [], prefix: Any = None,
@@ -140,32 +236,10 @@ def required_validator(request_data: dict = {}, required_fields: list = [], pref
     Validate required fields of given dict of data:
     Iterates over required fields list and checks if that key is present in request
     If one also is not found it returns and error with the field name
-
+    Views declare RequestSchema once instead, this compiles schema on every call.
     """
-    errors = {}
-    is_error = False
-    for field in required_fields:
-        if request_data.get(field) in [None, '']:
-            try:
-                message = ValidationMessages[field.upper()].value
-                if module_name and field == ValidationMessages.NAME.name.lower():
-                    message = module_name.replace(  # type: ignore  # noqa: FKA100
-                        '_', ' ').capitalize() + ' ' + message
-            except Exception:
-                if prefix:
-                    message = f'{prefix} {field} is required.'
-                else:
-                    formatted_field = re.sub(r'(_uuids)|(_ids)|(_uuid)|(_id)', '',  # type: ignore  # noqa: FKA100
-                                             field)
-                    formatted_field = formatted_field.replace('_', ' ').title()  # type: ignore  # noqa: FKA100
-                    message = f'{formatted_field} is required.'
-
-            errors[field] = message
-
-            if is_error is False:
-                is_error = True
-
-    return {'is_error': is_error, 'data': errors}
+    return RequestSchema(required_fields=required_fields, prefix=prefix,
+                         module_name=module_name).check_required(request_data)
 
 
 def send_json_response(http_status: int, response_status: bool, message_key: str, data: Any = None,
@@ -210,3 +284,120 @@ def get_pagination_meta(current_page: int, page_size: int, total_items: int) ->
         'next_page': next_page,
         'previous_page': previous_page
     }
+
+
+def get_count_key(query: Query) -> str:
+    """
+        This method returns cache key of total count of given (un-paginated) query.
+    """
+    compiled = query.order_by(None).statement.compile(dialect=db.engine.dialect,
+                                                       compile_kwargs={'render_postcompile': True})
+    return hashlib.sha256((str(compiled) + repr(sorted(compiled.params.items(), key=str))).encode()).hexdigest()
+
+
+def get_estimated_count(query: Query) -> Any:
+    """
+        This method returns row estimate of planner for given query, None if database is not postgres.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name != 'postgresql':
+        return None
+    compiled = query.order_by(None).statement.compile(dialect=connection.dialect,
+                                                       compile_kwargs={'render_postcompile': True})
+    plan = connection.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + str(compiled), compiled.params).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def get_paginated_result(query: Query, page: Any = None, size: Any = None) -> tuple:
+    """
+        This method returns rows of requested page and total count of query in one round-trip:
+        - Total count is selected with rows using `count(*) OVER ()` window function.
+        - Once total count passes PAGINATION.COUNT_THRESHOLD it is cached for PAGINATION.TTL seconds and
+          pages are fetched without counting, if PAGINATION.USE_PLANNER_ESTIMATE is set planner estimate is
+          used (postgres only) instead of counting big results.
+        - Without page and size all rows are returned and total count is number of rows.
+    """
+    if not (page and size):
+        rows = query.all()
+        return rows, len(rows)
+
+    size = int(size)
+    offset = (int(page) - 1) * size
+    threshold = pagination_config.get('COUNT_THRESHOLD', 100000)
+    count_key = get_count_key(query)
+    total_count = count_cache.get(count_key)
+    if total_count is None and pagination_config.get('USE_PLANNER_ESTIMATE', False):
+        try:
+            estimated_count = get_estimated_count(query)
+        except Exception as exception_error:
+            logger.error(f'Unable to estimate count of query : {exception_error}')
+            estimated_count = None
+        if estimated_count is not None and estimated_count >= threshold:
+            total_count = estimated_count
+            count_cache.set(count_key, total_count)
+
+    if total_count is not None:
+        return query.limit(size).offset(offset).all(), total_count
+
+    rows = query.add_columns(func.count().over().label('total_count')).limit(size).offset(offset).all()
+    if rows:
+        total_count = rows[0].total_count
+        # Entity queries return entity, column-projected queries return row (with extra total_count column).
+        rows = [row[0] for row in rows] if len(query.column_descriptions) == 1 else rows
+    else:
+        # Page is beyond last row so window count is not available.
+        total_count = query.order_by(None).count()
+    if total_count >= threshold:
+        count_cache.set(count_key, total_count)
+    return rows, total_count
+
+
+def encode_cursor(values: list) -> str:
+    """
+        This method generates opaque cursor for keyset pagination from values of last row of page.
+        Datetime values are stored in ISO format.
+    """
+    values = [{'dt': value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> list:
+    """
+        This method returns values stored in cursor generated by encode_cursor.
+        Raises ValueError if cursor is not valid.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return [datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value for value in values]
+    except Exception as exception_error:
+        raise ValueError(f'Invalid cursor : {cursor}') from exception_error
+
+
+def gzip_stream(chunks: Iterable, level: int = 6) -> Iterator[bytes]:
+    """
+        This method gzip encodes stream of str/bytes chunks on the fly, compressed data is yielded as soon as
+        compressor emits it so response is never buffered as a whole.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # type: ignore  # noqa: FKA100
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@contextmanager
+def transaction_session(**execution_options: Any) -> Iterator[Session]:
+    """
+        This method yields session bound to a dedicated connection inside a transaction, committed on exit and
+        rolled back on error. Engine runs in AUTOCOMMIT (SQLALCHEMY_ENGINE_OPTIONS) where statements run outside
+        of a transaction, so the connection uses default isolation level of database instead (needed by named
+        server-side cursors of `stream_results` and by statements which have to be applied together).
+    """
+    with db.engine.connect() as connection:
+        connection = connection.execution_options(isolation_level=db.engine.dialect.default_isolation_level,
+                                                  **execution_options)
+        with connection.begin():
+            with Session(bind=connection) as session:
+                yield session
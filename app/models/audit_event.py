@@ -1,31 +1,177 @@
 from datetime import datetime
+from typing import Any
 
+from app import config_data
+from app import logger
+from app import r
+from app.helpers.cache import invalidate_view_tags
+from app.helpers.constants import AuditGuarantee
+from app.helpers.constants import AuditWriterBackend
 from app.helpers.constants import DatabaseAction
+from app.helpers.constants import QueueName
 from app.models.audit_log import AuditLog
+from app.models.audit_request import AuditRequest
+from dateutil import tz
+from flask import has_request_context
+from flask import request
+from flask import request_tearing_down
+from rq import Queue
+from sqlalchemy import DateTime
 from sqlalchemy import event
 from sqlalchemy import inspect
 from sqlalchemy.orm import class_mapper
-from sqlalchemy.orm.attributes import get_history
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import PASSIVE_NO_INITIALIZE
+from workers.audit_worker import audit_log_writer
+from workers.audit_worker import AuditWorker
+
+AUDIT_CONFIG = config_data.get('AUDIT_LOG') or {}
+AUDIT_GUARANTEE = AUDIT_CONFIG.get('GUARANTEE', AuditGuarantee.SYNC.value)
+AUDIT_BUFFER_KEY = 'audit_log_buffer'
+AUDIT_ENGINE_KEY = 'audit_log_engine'
+AUDIT_REQUEST_KEY = 'audit_request_row'
+VIEW_TAGS_KEY = 'cached_view_tags'
+audit_log_q = Queue(QueueName.AUDIT_LOG, connection=r)
 
 
 class AuditableEvent:
     """ Allow a model to be automatically audited """
 
     @staticmethod
-    def create_audit(connection, object_type, object_id, action, state_before=None, state_after=None):
-        """ Method to create audit log """
+    def create_audit(connection, object_type, object_id, action, state_before=None, state_after=None, session=None):
+        """
+            Method to create audit log
+            - sync guarantee (or no session): insert audit log in the current flush.
+            - at_commit/async guarantee: buffer audit log in session, it is written by session commit events.
+            Request details are written once per request in audit_request and referenced by request_id.
+        """
+        AuditableEvent.tag_changed_table(session=session, table_name=object_type)
         audit = AuditLog(
             table_name=object_type,
             object_id=object_id,
             action=action,
             state_before=state_before,
-            state_after=state_after
+            state_after=state_after,
+            request_id=getattr(request, 'audit_request_id', None) if has_request_context() else None
         )
-        audit.save(connection)
+        if AUDIT_GUARANTEE == AuditGuarantee.SYNC.value or session is None:
+            if audit.request_id is None:
+                audit.request_id = AuditableEvent.save_request(connection=connection)
+            audit.save(connection)
+            return
+        # Entry may be written after request ends, so creation time is captured now.
+        audit.created_at = datetime.now(tz=tz.tzlocal())
+        if audit.request_id is None and AUDIT_REQUEST_KEY not in session.info and not (
+                has_request_context() and getattr(request, 'audit_pending', None)):
+            session.info[AUDIT_REQUEST_KEY] = AuditRequest.build_row()
+        session.info.setdefault(AUDIT_BUFFER_KEY, []).append(audit.to_row())  # noqa: FKA100
+        session.info[AUDIT_ENGINE_KEY] = connection.engine
+
+    @staticmethod
+    def tag_changed_table(session, table_name: str) -> None:
+        """
+            Remember tags of changed table and audit_log (see cached_view), views cached with them are
+            invalidated once transaction commits. Without session they are invalidated right away.
+        """
+        if session is None:
+            invalidate_view_tags(table_name, AuditLog.__tablename__)
+            return
+        session.info.setdefault(VIEW_TAGS_KEY, set()).update((table_name, AuditLog.__tablename__))  # noqa: FKA100
+
+    @staticmethod
+    def invalidate_cached_views(session) -> None:
+        """ Invalidate cached views of tables changed in committed transaction """
+        tags = session.info.pop(VIEW_TAGS_KEY, None)  # noqa: FKA100
+        if tags:
+            invalidate_view_tags(*tags)
+
+    @staticmethod
+    def save_request(connection) -> Any:
+        """ Insert details of current request once and remember its id on request """
+        request_row = AuditRequest.build_row()
+        if request_row is None:
+            return None
+        request.audit_request_id = AuditRequest.save(connection=connection, row=request_row)
+        return request.audit_request_id
+
+    @staticmethod
+    def write_buffered_audits(session) -> None:
+        """ Flush pending changes and insert buffered audit logs with one multi-row insert (at_commit guarantee) """
+        if AUDIT_GUARANTEE != AuditGuarantee.AT_COMMIT.value:
+            return
+        session.flush()
+        rows = session.info.pop(AUDIT_BUFFER_KEY, None)  # noqa: FKA100
+        request_row = session.info.pop(AUDIT_REQUEST_KEY, None)  # noqa: FKA100
+        session.info.pop(AUDIT_ENGINE_KEY, None)  # noqa: FKA100
+        if rows:
+            request_id = AuditLog.save_all(connection=session.connection(), rows=rows, request_row=request_row,
+                                           batch_size=AUDIT_CONFIG.get('BATCH_SIZE', 500))
+            if request_id and has_request_context():
+                request.audit_request_id = request_id
+
+    @staticmethod
+    def hand_off_buffered_audits(session) -> None:
+        """
+            Hand buffered audit logs of committed transaction to background writer (async guarantee). Within a
+            request they are collected until request ends and handed off together (see hand_off_request_audits),
+            so request is written once in audit_request however many transactions it commits.
+        """
+        rows = session.info.pop(AUDIT_BUFFER_KEY, None)  # noqa: FKA100
+        request_row = session.info.pop(AUDIT_REQUEST_KEY, None)  # noqa: FKA100
+        engine = session.info.pop(AUDIT_ENGINE_KEY, None)  # noqa: FKA100
+        if not rows or AUDIT_GUARANTEE != AuditGuarantee.ASYNC.value:
+            return
+        if has_request_context():
+            pending = getattr(request, 'audit_pending', None)
+            if pending is None:
+                pending = request.audit_pending = {}
+            batch = pending.setdefault(engine, {'request_row': request_row, 'rows': []})  # noqa: FKA100
+            batch['rows'].extend(rows)
+            return
+        AuditableEvent.submit_audits(engine=engine, rows=rows, request_row=request_row)
+
+    @staticmethod
+    def hand_off_request_audits(sender, **kwargs) -> None:  # noqa: F841
+        """ Listen for `request_tearing_down` signal and hand audit logs committed by request to background writer """
+        pending = getattr(request, 'audit_pending', None)
+        request.audit_pending = None
+        for engine, batch in (pending or {}).items():
+            try:
+                AuditableEvent.submit_audits(engine=engine, rows=batch['rows'], request_row=batch['request_row'])
+            except Exception as exception_error:
+                logger.error(f'Unable to write {len(batch["rows"])} audit log entries : {exception_error}')
+
+    @staticmethod
+    def submit_audits(engine, rows: list, request_row: Any = None) -> None:
+        """ Hand audit logs to thread or rq writer (ASYNC_BACKEND), written synchronously when rq queue is full """
+        if AUDIT_CONFIG.get('ASYNC_BACKEND', AuditWriterBackend.THREAD.value) == AuditWriterBackend.RQ.value:
+            try:
+                if audit_log_q.count < AUDIT_CONFIG.get('QUEUE_MAX_SIZE', 1000):
+                    audit_log_q.enqueue(AuditWorker.write,  # type: ignore  # noqa: FKA100
+                                        rows, request_row, job_timeout=config_data['RQ_JOB_TIMEOUT'])
+                    return
+                logger.warning('Audit log queue is full, writing {} entries synchronously'.format(len(rows)))
+            except Exception as exception_error:
+                logger.error(f'Unable to enqueue audit logs, writing them synchronously : {exception_error}')
+            audit_log_writer.write(engine=engine, batches=[(request_row, rows)])
+            return
+        audit_log_writer.submit(engine=engine, rows=rows, request_row=request_row)
+
+    @staticmethod
+    def discard_buffered_audits(session) -> None:
+        """ Drop buffered audit logs of rolled back transaction, request row is rolled back as well """
+        session.info.pop(AUDIT_BUFFER_KEY, None)  # noqa: FKA100
+        session.info.pop(AUDIT_REQUEST_KEY, None)  # noqa: FKA100
+        session.info.pop(AUDIT_ENGINE_KEY, None)  # noqa: FKA100
+        session.info.pop(VIEW_TAGS_KEY, None)  # noqa: FKA100
+        if has_request_context():
+            request.audit_request_id = None
 
     @classmethod
     def __declare_last__(cls):
-        """ Declare database events on which audit has to listen """
+        """ Declare database events on which audit has to listen and prepare audit plan of model """
+        AuditPlan.for_mapper(class_mapper(cls))
         event.listen(cls, 'after_insert', cls.audit_insert)  # noqa: FKA100
         event.listen(cls, 'after_delete', cls.audit_delete)  # noqa: FKA100
         event.listen(cls, 'after_update', cls.audit_update)  # noqa: FKA100
@@ -33,63 +179,99 @@ class AuditableEvent:
     @staticmethod
     def audit_insert(mapper, connection, target):  # noqa: F841
         """Listen for the `after_insert` event and create an AuditLog entry"""
-        state_after = {}
-        attrs = class_mapper(target.__class__).column_attrs
-        for attr in attrs:
-            state_after[attr.key] = getattr(target, attr.key)
-        obj_as_dict = AuditableEvent.convert_obj_to_dict(target)
-        state_after = AuditableEvent.dict_remove_datetime(state_after)
-
-        target.create_audit(connection=connection, object_type=target.__tablename__,
-                            object_id=target.id if obj_as_dict.get(
-                                'id') else target.uuid,
-                            action=DatabaseAction.CREATE.value, state_before={}, state_after=state_after)
+        plan = AuditPlan.for_mapper(mapper)
+        target.create_audit(connection=connection, object_type=plan.table_name,
+                            object_id=plan.get_object_id(target),
+                            action=DatabaseAction.CREATE.value, state_before={},
+                            state_after=plan.get_state(target), session=object_session(target))
 
     @staticmethod
     def audit_delete(mapper, connection, target):  # noqa: F841
         """Listen for the `after_delete` event and create an AuditLog entry"""
-        obj_as_dict = AuditableEvent.convert_obj_to_dict(target)
-        target.create_audit(connection=connection, object_type=target.__tablename__,
-                            object_id=target.id if obj_as_dict.get(
-                                'id') else target.uuid,
-                            action=DatabaseAction.DELETE.value)
+        plan = AuditPlan.for_mapper(mapper)
+        target.create_audit(connection=connection, object_type=plan.table_name,
+                            object_id=plan.get_object_id(target),
+                            action=DatabaseAction.DELETE.value, session=object_session(target))
 
     @staticmethod
-    def dict_remove_datetime(data):
-        """
-            This method checks for datetime objecy in dictionary and converts it to string.
-        """
-        return {key: value.strftime('%Y/%m/%d %H:%M:%S') if isinstance(value, datetime) else value for (key, value)
-                in data.items()}
+    def audit_update(mapper, connection, target):  # noqa: F841
+        """ Listen for the `after_update` event and create an AuditLog entry with before and after state changes"""
+        plan = AuditPlan.for_mapper(mapper)
+        state_before, state_after = plan.get_changes(target)
+        if state_after != state_before:
+            target.create_audit(connection=connection, object_type=plan.table_name,
+                                object_id=plan.get_object_id(target),
+                                action=DatabaseAction.UPDATE.value,
+                                state_before=state_before, state_after=state_after,
+                                session=object_session(target))
 
-    @staticmethod
-    def convert_obj_to_dict(obj):
+
+class AuditPlan:
+    """
+        Mapper details needed by audit listeners, computed once per model (at `__declare_last__`)
+        instead of inspecting mapper on every flushed object.
+    """
+    DATETIME_FORMAT = '%Y/%m/%d %H:%M:%S'
+    plans: dict = {}
+
+    def __init__(self, mapper):
+        """ Collect column keys, identity column and datetime columns of mapper """
+        self.table_name = mapper.class_.__tablename__
+        # Generated columns are derived from other columns and are not loaded back after flush, so they are skipped.
+        self.column_keys = tuple(attr.key for attr in mapper.column_attrs
+                                 if all(getattr(column, 'computed', None) is None for column in attr.columns))
+        # Objects are identified by id, models without id (or rows without id value) use uuid.
+        self.has_id = 'id' in self.column_keys
+        self.datetime_keys = frozenset(attr.key for attr in mapper.column_attrs
+                                       if any(isinstance(column.type, DateTime) for column in attr.columns))
+
+    @classmethod
+    def for_mapper(cls, mapper) -> 'AuditPlan':
+        """ Return audit plan of mapper, it is built on first use if model was not declared yet """
+        plan = cls.plans.get(mapper)
+        if plan is None:
+            plan = cls.plans[mapper] = cls(mapper)
+        return plan
+
+    def get_object_id(self, target) -> Any:
+        """ Return value identifying target in audit log """
+        return target.id if self.has_id and target.id else target.uuid
+
+    def format_value(self, key: str, value: Any) -> Any:
+        """ Convert datetime value of datetime column to string """
+        if key in self.datetime_keys and isinstance(value, datetime):
+            return value.strftime(self.DATETIME_FORMAT)
+        return value
+
+    def get_state(self, target) -> dict:
+        """ Return values of all columns of target """
+        return {key: self.format_value(key, getattr(target, key)) for key in self.column_keys}  # noqa: FKA100
+
+    def get_values_state(self, values: dict) -> dict:
+        """ Return values of all columns from dictionary of column values, used for rows inserted without ORM """
+        return {key: self.format_value(key, values.get(key)) for key in self.column_keys}  # noqa: FKA100
+
+    def get_changes(self, target) -> tuple:
         """
-            This method converts given model object to dictionary.
+            Return (state before, state after) of changed columns of target, history is looked up once and
+            only for columns which were assigned since object was loaded.
         """
-        return {c.key: getattr(obj, c.key) for c in inspect(obj).mapper.column_attrs}
-
-    @staticmethod
-    def audit_update(mapper, connection, target):  # noqa: F841
-        """ Listen for the `after_update` event and create an AuditLog entry with before and after state changes"""
         state_before = {}
         state_after = {}
-        inspr = inspect(target)
-        attrs = class_mapper(target.__class__).column_attrs
-        for attr in attrs:
-            hist = getattr(inspr.attrs, attr.key).history
-            if hist.has_changes():
-                try:
-                    state_before[attr.key] = get_history(target, attr.key)[2].pop()  # noqa: FKA100
-                except Exception:
-                    state_before[attr.key] = get_history(target, attr.key)[2]  # noqa: FKA100
-                state_after[attr.key] = getattr(target, attr.key)
-        state_before = AuditableEvent.dict_remove_datetime(state_before)
-        state_after = AuditableEvent.dict_remove_datetime(state_after)
-        obj_as_dict = AuditableEvent.convert_obj_to_dict(target)
-        if state_after != state_before:
-            target.create_audit(connection=connection, object_type=target.__tablename__,
-                                object_id=target.id if obj_as_dict.get(
-                                    'id') else target.uuid,
-                                action=DatabaseAction.UPDATE.value,
-                                state_before=state_before, state_after=state_after)
+        state = inspect(target)
+        for key in self.column_keys:
+            if key not in state.committed_state:
+                continue
+            history = state.get_history(key, PASSIVE_NO_INITIALIZE)  # noqa: FKA100
+            if history.has_changes():
+                deleted = history.deleted
+                state_before[key] = self.format_value(key, deleted[-1] if deleted else [])  # noqa: FKA100
+                state_after[key] = self.format_value(key, getattr(target, key))  # noqa: FKA100
+        return state_before, state_after
+
+
+event.listen(Session, 'before_commit', AuditableEvent.write_buffered_audits)  # noqa: FKA100
+event.listen(Session, 'after_commit', AuditableEvent.hand_off_buffered_audits)  # noqa: FKA100
+event.listen(Session, 'after_commit', AuditableEvent.invalidate_cached_views)  # noqa: FKA100
+event.listen(Session, 'after_rollback', AuditableEvent.discard_buffered_audits)  # noqa: FKA100
+request_tearing_down.connect(AuditableEvent.hand_off_request_audits)
@@ -5,15 +5,34 @@ from datetime import datetime
 from typing import Any
 
 from app import db
-from app import logger
 from app.helpers.constants import DataLevel
 from app.helpers.constants import SortingOrder
+from app.helpers.serializer import RowSerializer
+from app.models.audit_request import AuditRequest
+from app.models.audit_rollup import AuditRollup
 from dateutil import tz
+from flask import has_request_context
+from flask import request
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
 
 
 class AuditLog(db.Model):
-    """ An audit log for other model's actions """
+    """
+        An audit log for other model's actions
+        On postgres table is range partitioned by month on created_at (migration 0005) with primary key
+        (id, created_at), partitions are created ahead and archived by AuditPartitionWorker.
+    """
     __tablename__ = 'audit_log'
+    # Columns of export, request headers and body are not exported as they may carry tokens and pins.
+    EXPORT_COLUMNS = ('id', 'user_id', 'user_name', 'table_name', 'object_id', 'action', 'state_before',
+                      'state_after', 'method', 'url', 'ip', 'created_at')
+    EXPORT_REQUEST_COLUMNS = ('method', 'url', 'ip')
+    __table_args__ = (
+        db.Index('ix_audit_log_created_at_id', 'created_at', 'id'),
+        db.Index('ix_audit_log_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_audit_log_action_created_at_id', 'action', 'created_at', 'id'),
+    )
 
     id = db.Column(db.BigInteger, primary_key=True)
     user_id = db.Column(db.BigInteger)
@@ -22,40 +41,22 @@ class AuditLog(db.Model):
     action = db.Column(db.String)
     state_before = db.Column(db.JSON)
     state_after = db.Column(db.JSON)
+    request_id = db.Column(db.BigInteger, index=True)
+    # Legacy request columns, filled only for rows written before audit_request table (migration 0006).
     method = db.Column(db.String)
     url = db.Column(db.String)
     headers = db.Column(db.JSON)
     body = db.Column(db.JSON)
     args = db.Column(db.JSON)
     ip = db.Column(db.String)
-    created_at = db.Column(db.DateTime(timezone=True),
-                           default=datetime.now(tz=tz.tzlocal()))
+    # Partition key, default is evaluated on every insert so that rows are routed to partition of their month.
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           default=lambda: datetime.now(tz=tz.tzlocal()))
     updated_at = db.Column(db.DateTime(timezone=True),
-                           default=datetime.now(tz=tz.tzlocal()))
-
-    @classmethod
-    def get_request_info(cls):
-        """
-            This method is used to access request.
-            - if database action is performed using api, it will return request as it is.
-            - if database action is perform without api [e.g. insert from testing without api call'],
-                then it will set request with empty values as request is not present at that time.
-        """
-        try:
-            """ Return request if access  """
-            from flask import request
-            hasattr(request, 'user')
-            return request
-        except Exception:
-            from types import SimpleNamespace
-            from werkzeug.datastructures import ImmutableMultiDict
-            request = {'headers': {},
-                       'method': None,
-                       'url': '',
-                       'args': ImmutableMultiDict(),  # immutable dict
-                       'form': ImmutableMultiDict(),  # immutable dict
-                       }
-            return SimpleNamespace(**request)
+                           default=lambda: datetime.now(tz=tz.tzlocal()))
+    # No foreign key as both tables are partitioned and archived independently.
+    audit_request = db.relationship(AuditRequest, primaryjoin='AuditLog.request_id == AuditRequest.id',
+                                    foreign_keys=[request_id], viewonly=True)
 
     @classmethod
     def get_user_id(cls, request):
@@ -71,41 +72,42 @@ class AuditLog(db.Model):
         return db.session.query(cls).filter(cls.id == id).first()
 
     @classmethod
-    def get_request_body(cls, request):
-        """ Method to get request body """
-        body = {}
-
-        try:
-            body = request.get_json(force=True)
-        except Exception:
-            body = request.form.to_dict(flat=False)
-
-        return body
-
-    def __init__(self, table_name, object_id, action, state_before, state_after):
-        """ Initialize audit_log object """
-        request = AuditLog.get_request_info()
-        try:
-            if request.environ.get('HTTP_X_FORWARDED_FOR') is None:
-                client_ip = request.environ['REMOTE_ADDR']
-            else:
-                client_ip = str(request.environ.get(
-                    'HTTP_X_FORWARDED_FOR')).split(',')[0].strip()
-        except Exception as exception_error:
-            logger.error(f'Failed to Get Client IP - > {exception_error}')
-            client_ip = ''
-        self.user_id = AuditLog.get_user_id(request)
+    def get_details(cls, id: int) -> Any:
+        """Filter record by id along with its request details."""
+        return db.session.query(cls).options(joinedload(cls.audit_request)).filter(cls.id == id).first()
+
+    def __init__(self, table_name, object_id, action, state_before, state_after, request_id=None):
+        """ Initialize audit_log object, request details are stored once per request in audit_request """
+        self.user_id = AuditLog.get_user_id(request) if has_request_context() else None
+        self.request_id = request_id
         self.table_name = table_name
         self.object_id = object_id
         self.action = action
         self.state_before = state_before
         self.state_after = state_after
-        self.method = request.method
-        self.url = request.url
-        self.headers = dict(request.headers.items())
-        self.body = AuditLog.get_request_body(request)
-        self.args = request.args.to_dict(flat=False)
-        self.ip = client_ip  # pylint: disable=C0103
+
+    def get_request_ip(self) -> Any:
+        """ Return ip of request which created audit log """
+        if self.request_id:
+            return self.audit_request.ip if self.audit_request else None
+        return self.ip
+
+    def get_request_details(self) -> dict:
+        """
+            Return details of request which created audit log, rows written before audit_request table
+            existed keep them in legacy columns of audit_log.
+        """
+        source = self.audit_request if self.request_id else self
+        if source is None:
+            return {'method': None, 'url': None, 'headers': None, 'body': None, 'args': None, 'ip': None}
+        return {
+            'method': source.method,
+            'url': source.url,
+            'headers': source.headers,
+            'body': source.body,
+            'args': source.args,
+            'ip': source.ip
+        }
 
     def __repr__(self):
         """
@@ -113,31 +115,99 @@ class AuditLog(db.Model):
         """
         return '<AuditLog %r: %r -> %r>' % (self.user_id, self.table_name, self.action)
 
+    def to_row(self) -> dict:
+        """ Return column values of audit log which are written to table """
+        row = {
+            'user_id': self.user_id,
+            'table_name': self.table_name,
+            'object_id': self.object_id,
+            'action': self.action,
+            'state_before': self.state_before,
+            'state_after': self.state_after,
+            'request_id': self.request_id
+        }
+        if self.created_at is not None:
+            row.update(created_at=self.created_at, updated_at=self.created_at)
+        return row
+
     def save(self, connection):
-        """ Insert data into table """
-
-        connection.execute(
-            self.__table__.insert(),
-            user_id=self.user_id,
-            table_name=self.table_name,
-            object_id=self.object_id,
-            action=self.action,
-            state_before=self.state_before,
-            state_after=self.state_after,
-            method=self.method,
-            url=self.url,
-            headers=self.headers,
-            body=self.body,
-            args=self.args,
-            ip=self.ip
-        )
+        """ Insert data into table and count it in audit rollup """
+        if self.created_at is None:
+            # Stamped here so that audit log and its rollup row fall on the same day.
+            self.created_at = datetime.now(tz=tz.tzlocal())
+        row = self.to_row()
+        connection.execute(self.__table__.insert(), row)
+        AuditRollup.add(connection=connection, rows=[row])
+
+    @classmethod
+    def save_all(cls, connection, rows: list, batch_size: int = 500, request_row: Any = None) -> Any:
+        """
+            Insert rows (see `to_row`) into table using one multi-row insert per batch and count them in
+            audit rollup.
+            If request_row (see `AuditRequest.build_row`) is passed it is inserted first and referenced by rows,
+            its id is returned.
+        """
+        request_id = None
+        if request_row:
+            request_id = AuditRequest.save(connection=connection, row=request_row)
+            rows = [dict(row, request_id=request_id) if row['request_id'] is None else row for row in rows]
+        for index in range(0, len(rows), batch_size):
+            connection.execute(cls.__table__.insert().values(rows[index:index + batch_size]))
+        AuditRollup.add(connection=connection, rows=rows)
+        return request_id
 
     @classmethod
     def get_logs(cls, action: Any = None, user_id: Any = None,
                  page: Any = None, pagination: Any = None, sort: Any = None,
-                 start_date: Any = None, end_date: Any = None):
-        """ Collect audit logs from table """
-        query = db.session.query(cls)
+                 start_date: Any = None, end_date: Any = None, cursor: Any = None, request_columns: tuple = ('ip',)):
+        """
+            Collect audit logs from table, request_columns of audit_request are loaded with same query
+            - page/pagination: offset pagination ordered by id.
+            - cursor: keyset pagination ordered by (created_at, id), cursor is (created_at, id) of last row of
+              previous page or empty list for first page. One extra row is fetched to know if next page exists.
+        """
+        if cursor is not None:
+            return cls.get_logs_after(cursor=cursor, action=action, user_id=user_id, pagination=pagination,
+                                      sort=sort, start_date=start_date, end_date=end_date)
+        query = cls.filter_logs(action=action, user_id=user_id, start_date=start_date, end_date=end_date,
+                                request_columns=request_columns)
+
+        if sort == SortingOrder.ASC.value:
+            query = query.order_by(cls.id.asc())
+        else:
+            query = query.order_by(cls.id.desc())
+
+        if page and pagination and sort:
+            offset = (int(page) - 1) * int(pagination)
+            query = query.limit(pagination)
+            query = query.offset(offset)
+
+        return query
+
+    @classmethod
+    def get_logs_after(cls, cursor: list, action: Any = None, user_id: Any = None, pagination: Any = None,
+                       sort: Any = None, start_date: Any = None, end_date: Any = None):
+        """ Collect page of audit logs after cursor using (created_at, id) index """
+        query = cls.filter_logs(action=action, user_id=user_id, start_date=start_date, end_date=end_date)
+        # Plain created_at condition is repeated next to row comparison so that partitions can be pruned.
+        if sort == SortingOrder.ASC.value:
+            if cursor:
+                query = query.filter(cls.created_at >= cursor[0],
+                                     tuple_(cls.created_at, cls.id) > tuple_(*cursor))
+            query = query.order_by(cls.created_at.asc(), cls.id.asc())
+        else:
+            if cursor:
+                query = query.filter(cls.created_at <= cursor[0],
+                                     tuple_(cls.created_at, cls.id) < tuple_(*cursor))
+            query = query.order_by(cls.created_at.desc(), cls.id.desc())
+        return query.limit(int(pagination) + 1)
+
+    @classmethod
+    def filter_logs(cls, action: Any = None, user_id: Any = None, start_date: Any = None, end_date: Any = None,
+                    request_columns: tuple = ('ip',)):
+        """ Apply filters on audit logs query, request_columns of audit_request are loaded with same query """
+        query = db.session.query(cls).options(joinedload(cls.audit_request).load_only(
+            *[getattr(AuditRequest, column) for column in request_columns]))  # type: ignore  # noqa: FKA100
 
         if action:
             query = query.filter(cls.action.in_(action))
@@ -151,47 +221,45 @@ class AuditLog(db.Model):
         if end_date:
             query = query.filter(cls.created_at <= end_date)
 
-        if sort == SortingOrder.ASC.value:
-            query = query.order_by(cls.id.asc())
-        else:
-            query = query.order_by(cls.id.desc())
-
-        if page and pagination and sort:
-            offset = (int(page) - 1) * int(pagination)
-            query = query.limit(pagination)
-            query = query.offset(offset)
-
         return query
 
+    def to_export_row(self, user_dict: dict) -> dict:
+        """ Return audit log as row of export, see EXPORT_COLUMNS """
+        request_details = self.get_request_details()
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'user_name': user_dict[self.user_id]['full_name'] if self.user_id in user_dict else '',
+            'table_name': self.table_name,
+            'object_id': self.object_id,
+            'action': self.action,
+            'state_before': self.state_before,
+            'state_after': self.state_after,
+            'method': request_details['method'],
+            'url': request_details['url'],
+            'ip': request_details['ip'],
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
     @classmethod
     def serialize(cls, audit_logs: list, data_level: str = DataLevel.INFO.value, user_dict: Any = None) -> list:
         """ Make a list of Audit Log objects."""
+        if data_level == DataLevel.INFO.value:
+            return audit_log_info_serializer.serialize_all(audit_logs)
         data = []
         for audit_log in audit_logs:
-            if data_level == DataLevel.INFO.value:
-                data_dict = {
-                    'id': audit_log.id,
-                    'user_id': audit_log.user_id,
-                    'table_name': audit_log.table_name,
-                    'action': audit_log.action,
-                    'ip': audit_log.ip,
-                    'created_at': audit_log.created_at
-                }
-            if data_level == DataLevel.DETAIL.value:
-                data_dict = {
-
-                    'user_name': user_dict[audit_log.user_id]['full_name'] if audit_log.user_id else '',
-                    'table_name': audit_log.table_name.replace('_', ' '),  # type: ignore  # noqa: FKA100
-                    'action': audit_log.action,
-                    'state_before': audit_log.state_before,
-                    'state_after': audit_log.state_after,
-                    'method': audit_log.method,
-                    'url': audit_log.url,
-                    'headers': audit_log.headers,
-                    'body': audit_log.body,
-                    'args': audit_log.args,
-                    'ip': audit_log.ip,
-                    'created_at': audit_log.created_at
-                }
+            data_dict = audit_log_detail_serializer.serialize(audit_log)
+            data_dict.update(audit_log.get_request_details())
+            data_dict['user_name'] = user_dict[audit_log.user_id]['full_name'] if audit_log.user_id else ''
             data.append(data_dict)
         return data
+
+
+audit_log_info_serializer = RowSerializer(
+    fields={'id': 'id', 'user_id': 'user_id', 'table_name': 'table_name', 'action': 'action',
+            'created_at': 'created_at'},
+    computed={'ip': lambda audit_log: audit_log.get_request_ip()})
+audit_log_detail_serializer = RowSerializer(
+    fields={'table_name': 'table_name', 'action': 'action', 'state_before': 'state_before',
+            'state_after': 'state_after', 'created_at': 'created_at'},
+    converters={'table_name': lambda table_name: table_name.replace('_', ' ')})  # type: ignore  # noqa: FKA100
@@ -0,0 +1,83 @@
+"""
+    Database model for storing request details of audit logs is written in this File along with its methods.
+"""
+from datetime import datetime
+from typing import Any
+
+from app import db
+from app import logger
+from dateutil import tz
+from flask import has_request_context
+from flask import request
+
+
+class AuditRequest(db.Model):
+    """
+        Request which performed audited database actions, stored once per request and referenced by
+        audit_log.request_id instead of copying request details into every audit log.
+        On postgres table is range partitioned by month on created_at (migration 0006) like audit_log.
+    """
+    __tablename__ = 'audit_request'
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    method = db.Column(db.String)
+    url = db.Column(db.String)
+    headers = db.Column(db.JSON)
+    body = db.Column(db.JSON)
+    args = db.Column(db.JSON)
+    ip = db.Column(db.String)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           default=lambda: datetime.now(tz=tz.tzlocal()))
+
+    def __repr__(self):
+        """
+            Object Representation Method for custom object representation on console or log
+        """
+        return '<AuditRequest %r: %r %r>' % (self.id, self.method, self.url)
+
+    @classmethod
+    def get_request_body(cls) -> Any:
+        """ Method to get request body """
+        body = {}
+
+        try:
+            body = request.get_json(force=True)
+        except Exception:
+            body = request.form.to_dict(flat=False)
+
+        return body
+
+    @classmethod
+    def get_client_ip(cls) -> str:
+        """ Method to get ip of client, first address of X-Forwarded-For is used behind proxy """
+        try:
+            if request.environ.get('HTTP_X_FORWARDED_FOR') is None:
+                return request.environ['REMOTE_ADDR']
+            return str(request.environ.get(
+                'HTTP_X_FORWARDED_FOR')).split(',')[0].strip()
+        except Exception as exception_error:
+            logger.error(f'Failed to Get Client IP - > {exception_error}')
+            return ''
+
+    @classmethod
+    def build_row(cls) -> Any:
+        """
+            Return column values of current request, None if database action is performed without api
+            [e.g. from manage.py command or rq worker].
+        """
+        if not has_request_context():
+            return None
+        return {
+            'method': request.method,
+            'url': request.url,
+            'headers': dict(request.headers.items()),
+            'body': cls.get_request_body(),
+            'args': request.args.to_dict(flat=False),
+            'ip': cls.get_client_ip(),
+            'created_at': datetime.now(tz=tz.tzlocal())
+        }
+
+    @classmethod
+    def save(cls, connection, row: dict) -> int:
+        """ Insert request row and return its id """
+        return connection.execute(cls.__table__.insert(), row).inserted_primary_key[0]
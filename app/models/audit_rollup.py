@@ -0,0 +1,127 @@
+"""
+    Database model for daily counts of audit logs is written in this File along with its methods.
+"""
+from datetime import datetime
+from typing import Any
+
+from app import db
+from dateutil import tz
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+
+class AuditRollup(db.Model):
+    """
+        Number of audit logs per (day, table_name, action, user_id), updated in the same transaction in which
+        audit logs are written so that summaries never scan audit_log. Audit logs written without logged in
+        user are counted with user_id 0 as columns of primary key can not be null.
+        Counts are kept when audit_log partitions are archived.
+    """
+    __tablename__ = 'audit_rollup'
+    GROUP_BY_COLUMNS = ('day', 'table_name', 'action', 'user_id')
+
+    day = db.Column(db.Date, primary_key=True)
+    table_name = db.Column(db.Text, primary_key=True)
+    action = db.Column(db.String, primary_key=True)
+    user_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        """
+            Object Representation Method for custom object representation on console or log
+        """
+        return '<AuditRollup %r: %r %r %r>' % (self.day, self.table_name, self.action, self.count)
+
+    @classmethod
+    def get_counts(cls, rows: list) -> dict:
+        """ Count audit log rows (see `AuditLog.to_row`) by rollup key """
+        counts: dict = {}
+        for row in rows:
+            created_at = row.get('created_at') or datetime.now(tz=tz.tzlocal())
+            key = (created_at.date(), row['table_name'], row['action'] or '', row['user_id'] or 0)
+            counts[key] = counts.get(key, 0) + 1  # noqa: FKA100
+        return counts
+
+    @classmethod
+    def add(cls, connection, rows: list) -> None:
+        """
+            Add audit log rows to rollup with one upsert per batch, rows with same key are aggregated first
+            so that a batch touches each rollup row once.
+        """
+        counts = cls.get_counts(rows=rows)
+        if not counts:
+            return
+        # Keys are sorted so that concurrent transactions lock rollup rows in the same order.
+        values = [dict(zip(cls.GROUP_BY_COLUMNS, key), count=count)  # type: ignore  # noqa: FKA100
+                  for key, count in sorted(counts.items(), key=lambda item: repr(item[0]))]
+        dialect = connection.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+            statement = insert(cls.__table__).values(values)
+            connection.execute(statement.on_conflict_do_update(
+                index_elements=list(cls.GROUP_BY_COLUMNS),
+                set_={'count': cls.__table__.c.count + statement.excluded.count}))
+            return
+        # Other databases do not support upsert, rows which are not updated are inserted.
+        table = cls.__table__
+        for value in values:
+            updated = connection.execute(table.update().where(
+                table.c.day == value['day'], table.c.table_name == value['table_name'],
+                table.c.action == value['action'], table.c.user_id == value['user_id']).values(
+                count=table.c.count + value['count'])).rowcount
+            if not updated:
+                connection.execute(table.insert(), value)
+
+    @classmethod
+    def get_summary(cls, group_by: list, table_name: Any = None, action: Any = None, user_id: Any = None,
+                    start_date: Any = None, end_date: Any = None):
+        """ Total audit logs grouped by given rollup columns, ordered by day (latest first) when grouped by day """
+        group_columns = [getattr(cls, column) for column in group_by]
+        query = db.session.query(*group_columns, func.sum(cls.count).label('count'))  # type: ignore  # noqa: FKA100
+
+        if table_name:
+            query = query.filter(cls.table_name.in_(table_name))
+
+        if action:
+            query = query.filter(cls.action.in_(action))
+
+        if user_id:
+            query = query.filter(cls.user_id.in_(user_id))
+
+        if start_date:
+            query = query.filter(cls.day >= start_date)
+
+        if end_date:
+            query = query.filter(cls.day <= end_date)
+
+        query = query.group_by(*group_columns)
+        if 'day' in group_by:
+            query = query.order_by(cls.day.desc())
+        return query.order_by(*[column for column in group_columns if column is not cls.day])
+
+    @classmethod
+    def backfill(cls, connection, start_date: Any = None, end_date: Any = None) -> int:
+        """
+            Recompute rollup of given days (all days if not passed) from audit_log, returns number of rollup rows.
+            Rollup rows of recomputed days are replaced, days whose audit_log partitions are archived should
+            not be passed as their counts would be lost.
+        """
+        from app.models.audit_log import AuditLog
+
+        day = func.date(AuditLog.created_at)
+        query = db.select(day.label('day'), AuditLog.table_name, func.coalesce(AuditLog.action, '').label('action'),  # type: ignore  # noqa: FKA100
+                          func.coalesce(AuditLog.user_id, 0).label('user_id'),  # type: ignore  # noqa: FKA100
+                          func.count().label('count'))
+        delete = cls.__table__.delete()
+        if start_date:
+            query = query.where(AuditLog.created_at >= start_date)
+            delete = delete.where(cls.day >= start_date)
+        if end_date:
+            query = query.where(AuditLog.created_at < end_date)
+            delete = delete.where(cls.day < end_date)
+        query = query.group_by(day, AuditLog.table_name, func.coalesce(AuditLog.action, ''),  # type: ignore  # noqa: FKA100
+                               func.coalesce(AuditLog.user_id, 0))  # type: ignore  # noqa: FKA100
+        connection.execute(delete)
+        return connection.execute(cls.__table__.insert().from_select(
+            list(cls.GROUP_BY_COLUMNS) + ['count'], query)).rowcount
@@ -1,20 +1,47 @@
 """Contains student table definitions."""
 from __future__ import annotations
 
+from contextlib import contextmanager
+import json
 from typing import Any
+from typing import Callable
 
+from app import config_data
 from app import db
+from app.helpers.cache import student_cache
+from app.helpers.cache import student_version_cache
+from app.helpers.constants import BulkItemStatus
+from app.helpers.constants import ResponseMessageKeys
 from app.helpers.constants import SortingOrder
+from app.helpers.replica import replica_router
+from app.helpers.utility import decode_cursor
+from app.helpers.utility import encode_cursor
+from app.helpers.utility import get_paginated_result
+from app.helpers.utility import RequestSchema
 from app.models.base import Base
-from flask_restful import Resource,marshal_with,fields
+from flask_restful import Resource,marshal_with,fields,abort
 from flask import request
 from sqlalchemy import asc
+from sqlalchemy import bindparam
 from sqlalchemy import desc
 from sqlalchemy.ext import hybrid
 
+pagination_config = config_data.get('PAGINATION') or {}
+cache_config = config_data.get('CACHE') or {}
+STUDENT_LIST_VERSION_KEY = 'list_version'
+STUDENT_FIELD_TYPES = {'name': str, 'clas': int, 'division': str}
+BULK_BATCH_SIZE = 500
+BULK_CREATE_SCHEMA = RequestSchema(field_types=STUDENT_FIELD_TYPES, required_fields=list(STUDENT_FIELD_TYPES))
+BULK_UPDATE_SCHEMA = RequestSchema(field_types={'sid': int, **STUDENT_FIELD_TYPES},
+                                   required_fields=['sid'] + list(STUDENT_FIELD_TYPES))
+BULK_DELETE_SCHEMA = RequestSchema(field_types={'sid': int}, required_fields=['sid'])
 
 
 class SMS(db.Model):
+    __table_args__ = (
+        db.Index('ix_sms_clas_division_sid', 'clas', 'division', 'sid'),
+        db.Index('ix_sms_division_sid', 'division', 'sid'),
+    )
     sid=db.Column(db.Integer,primary_key=True)
     name=db.Column(db.String,nullable=False)
     clas=db.Column(db.Integer,nullable=False)
@@ -22,40 +49,211 @@ class SMS(db.Model):
 
     def __repr__(self):
         return f"{self.name}:{self.clas}-{self.division}"
-    
-    
-    
+
+    def to_dict(self) -> dict:
+        """Column values of student, this is what is cached and marshalled by studentFields."""
+        return {'sid': self.sid, 'name': self.name, 'clas': self.clas, 'division': self.division}
+
+    @classmethod
+    def get_cached(cls, sid: int) -> Any:
+        """
+            Student (as dict) of sid read through `id:<sid>:<version>` entry of student cache, None if it does not
+            exist. Version of sid is bumped on every write, so a row read before a write is stored under previous
+            version and never read again.
+        """
+        if not cache_config.get('ENABLED', True):
+            return cls.query.filter_by(sid=sid).first()
+        key = 'id:{}:{}'.format(sid, student_version_cache.get_version(f'version:{sid}'))
+        student = student_cache.get(key)
+        if student is None:
+            row = cls.query.filter_by(sid=sid).first()
+            if row is None:
+                return None
+            student = row.to_dict()
+            student_cache.set(key, student, ttl=replica_router.get_cache_ttl(None))
+        return student
+
+    @classmethod
+    def get_cached_list(cls, params: dict, loader: Callable) -> Any:
+        """
+            Result of loader read through `list:<version>:<params>` entry of student cache.
+            Version is bumped on every write, so list entries are never invalidated one by one.
+        """
+        if not cache_config.get('ENABLED', True):
+            return loader()
+        key = 'list:{}:{}'.format(student_version_cache.get_version(STUDENT_LIST_VERSION_KEY),
+                                  json.dumps(params, sort_keys=True, separators=(',', ':')))
+        result = student_cache.get(key)
+        if result is None:
+            result = loader()
+            student_cache.set(key, result, ttl=replica_router.get_cache_ttl(None))
+        return result
+
+    @classmethod
+    def invalidate_cache(cls, sids: Any = ()) -> None:
+        """Bump versions of sids and list version, called after writes are committed."""
+        student_version_cache.bump_versions(STUDENT_LIST_VERSION_KEY, *[f'version:{sid}' for sid in sids])
+
+    @classmethod
+    def get_page(cls, clas: Any, division: Any, page: int, size: Any, cursor: Any = None) -> tuple:
+        """
+            Returns (students as dicts, response headers) of requested page.
+            cursor is decoded cursor (list with sid of last student of previous page, empty for first page).
+            size None returns all filtered students without pagination headers.
+        """
+        query = cls.filter_students(clas=clas, division=division)
+        if size is None:
+            return [student.to_dict() for student in query.all()], {}
+        if cursor is not None:
+            if cursor:
+                query = query.filter(cls.sid > cursor[0])
+            students = query.limit(size + 1).all()
+            headers = {}
+            if len(students) > size:
+                students = students[:size]
+                headers['X-Next-Cursor'] = encode_cursor([students[-1].sid])
+            return [student.to_dict() for student in students], headers
+
+        students, total_count = get_paginated_result(query=query, page=page, size=size)
+        return [student.to_dict() for student in students], {
+            'X-Total-Count': str(total_count), 'X-Page': str(page), 'X-Page-Size': str(size)}
+
+    @classmethod
+    def filter_students(cls, clas: Any = None, division: Any = None):
+        """Students filtered by class and division, ordered by sid (served by sms indexes)."""
+        query = cls.query
+        if clas is not None:
+            query = query.filter(cls.clas == clas)
+        if division:
+            query = query.filter(cls.division == division)
+        return query.order_by(cls.sid)
+
+    @classmethod
+    def get_existing_sids(cls, connection: Any, sids: list) -> set:
+        """
+            Sids out of given sids which exist in table, looked up with one query per batch. Rows are locked
+            (FOR UPDATE) till end of transaction of connection, so they are not deleted before they are written.
+        """
+        existing = set()
+        for index in range(0, len(sids), BULK_BATCH_SIZE):
+            existing.update(connection.execute(db.select(cls.sid).where(
+                cls.sid.in_(sids[index:index + BULK_BATCH_SIZE])).with_for_update()).scalars())
+        return existing
+
+    @staticmethod
+    @contextmanager
+    def bulk_transaction():
+        """
+            Connection for bulk writes, committed on exit and rolled back (with nothing written) on error.
+            Engine runs in AUTOCOMMIT (SQLALCHEMY_ENGINE_OPTIONS) where every statement commits on its own,
+            so the connection uses default isolation level of database to get a real transaction.
+        """
+        with db.engine.connect() as connection:
+            connection = connection.execution_options(isolation_level=db.engine.dialect.default_isolation_level)
+            with connection.begin():
+                yield connection
+        replica_router.mark_write()
+
+    @classmethod
+    def bulk_create(cls, connection: Any, rows: list) -> list:
+        """
+            Insert rows with one multi-row insert per batch and return their sids in order of rows.
+            Order of RETURNING rows is not guaranteed, so inserted values are returned along with sids and matched
+            back to rows (rows with same values get sids of each other, which makes no difference).
+            Databases without INSERT .. RETURNING (sqlite) insert rows one by one in the same transaction.
+        """
+        if not connection.dialect.implicit_returning:
+            return [connection.execute(cls.__table__.insert(), row).inserted_primary_key[0] for row in rows]
+        columns = [cls.__table__.c[field] for field in STUDENT_FIELD_TYPES]
+        sids = []
+        for index in range(0, len(rows), BULK_BATCH_SIZE):
+            batch = rows[index:index + BULK_BATCH_SIZE]
+            sids_by_values = {}
+            for row in connection.execute(cls.__table__.insert().values(batch).returning(cls.sid, *columns)):
+                sids_by_values.setdefault(tuple(row[1:]), []).append(row[0])  # noqa: FKA100
+            sids.extend(sids_by_values[tuple(row[field] for field in STUDENT_FIELD_TYPES)].pop() for row in batch)
+        return sids
+
+    @classmethod
+    def bulk_update(cls, connection: Any, rows: list) -> None:
+        """Update rows (dicts with sid and all student fields) with one executemany per batch."""
+        statement = cls.__table__.update().where(cls.sid == bindparam('b_sid')).values(
+            {field: bindparam(f'b_{field}') for field in STUDENT_FIELD_TYPES})
+        for index in range(0, len(rows), BULK_BATCH_SIZE):
+            connection.execute(statement, [{f'b_{key}': value for key, value in row.items()}
+                                           for row in rows[index:index + BULK_BATCH_SIZE]])
+
+    @classmethod
+    def bulk_delete(cls, connection: Any, sids: list) -> None:
+        """Delete students of given sids with one statement per batch."""
+        for index in range(0, len(sids), BULK_BATCH_SIZE):
+            connection.execute(cls.__table__.delete().where(cls.sid.in_(sids[index:index + BULK_BATCH_SIZE])))
+
+
+
 studentFields={
     'sid':fields.Integer,
     'name':fields.String,
     'clas':fields.Integer,
     'division':fields.String
-}    
+}
+
+
+def is_full_table_requested() -> bool:
+    """Write apis return only affected student unless `return_all=true` is passed."""
+    return request.args.get('return_all', default='').lower() == 'true'
 
 
 # Students class
 class Students(Resource):
     @marshal_with(studentFields)
     def get():
-        students=SMS.query.all()
-        return students
-    
+        """
+        Page of students filtered by `clas` and `division`.
+        - page/size: offset pagination, total count is returned in X-Total-Count header.
+        - cursor: keyset pagination on sid, pass empty cursor for first page and X-Next-Cursor header of previous
+          response for next page.
+        Without page, size and cursor all filtered students are returned, as before pagination was added.
+        size defaults to PAGINATION.DEFAULT_PAGE_SIZE and is capped at PAGINATION.MAX_PAGE_SIZE.
+        Pages are read through student cache. Arguments are type checked by the view.
+        """
+        clas = request.args.get('clas', type=int)
+        division = request.args.get('division')
+        page = max(request.args.get('page', default=1, type=int), 1)
+        size = None
+        if any(key in request.args for key in ('page', 'size', 'cursor')):
+            size = request.args.get('size', default=pagination_config.get('DEFAULT_PAGE_SIZE', 20), type=int)
+            size = min(max(size, 1), pagination_config.get('MAX_PAGE_SIZE', 100))
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            try:
+                cursor = decode_cursor(cursor) if cursor else []
+            except ValueError:
+                abort(400, message='Please enter valid cursor.')
+
+        params = {'clas': clas, 'division': division, 'page': page, 'size': size, 'cursor': cursor}
+        students, headers = SMS.get_cached_list(params=params, loader=lambda: SMS.get_page(**params))
+        return students, 200, headers
+
     @marshal_with(studentFields)
     def post():
+        """Add student and return it, whole table is returned only with `return_all=true`."""
         data=request.json
         student=SMS(name=data['name'],clas=data['clas'],division=data['division'])
         db.session.add(student)
         db.session.commit()
-        
-        students=SMS.query.all()
-        
-        return students
-    
+        SMS.invalidate_cache()
+
+        if is_full_table_requested():
+            return SMS.query.all()
+        return student
+
 class Student(Resource):
-    
+
     @marshal_with(studentFields)
     def get(sid):
-        student=SMS.query.filter_by(sid=sid).first()
+        """Student of sid, read through student cache."""
+        student=SMS.get_cached(sid)
         return student
 
 
@@ -63,21 +261,125 @@ class Student(Resource):
     def put(sid):
         data=request.json
         student=SMS.query.filter_by(sid=sid).first()
+        if student is None:
+            abort(404, message=ResponseMessageKeys.STUDENT_NOT_FOUND.value)
         # student.id=data['sid']
         student.name=data['name']
         student.clas=data['clas']
         student.division=data['division']
         db.session.commit()
-        
+        SMS.invalidate_cache(sids=[sid])
+
         return student
-        
-    
-    
+
+
+
     @marshal_with(studentFields)
     def delete(sid):
+        """Delete student and return it, whole table is returned only with `return_all=true`."""
         student=SMS.query.filter_by(sid=sid).first()
+        if student is None:
+            abort(404, message=ResponseMessageKeys.STUDENT_NOT_FOUND.value)
         db.session.delete(student)
         db.session.commit()
-        students=SMS.query.all()
-        
-        return students
\ No newline at end of file
+        SMS.invalidate_cache(sids=[sid])
+
+        if is_full_table_requested():
+            return SMS.query.all()
+        return student
+
+
+class StudentsBulk(Resource):
+    """
+        Create, update or delete list of students in one transaction (see SMS.bulk_transaction).
+        - All items are validated first, invalid items (and updates/deletes of unknown sids) are reported and skipped.
+        - Valid items are applied with multi-row statements and committed together.
+        - Response has result of each item in order of request: index, status, sid and errors of invalid item.
+    """
+
+    @staticmethod
+    def get_items() -> Any:
+        """List of students from request body, either list itself or `students` key of object."""
+        data = request.get_json(silent=True)
+        items = data.get('students') if isinstance(data, dict) else data
+        return items if isinstance(items, list) and items else None
+
+    @staticmethod
+    def validate(items: list, schema: RequestSchema) -> tuple:
+        """
+        Validate items in one pass, types are checked before missing fields (as field_type_validator
+        and required_validator of other apis). Returns (results, {index: cleaned values} of valid items).
+        """
+        results = []
+        valid_items = {}
+        for index, item in enumerate(items):
+            result = {'index': index, 'sid': item.get('sid') if isinstance(item, dict) else None}
+            results.append(result)
+            if not isinstance(item, dict):
+                result.update(status=BulkItemStatus.INVALID.value, errors={'item': 'Item should be an object.'})
+                continue
+            is_valid = schema.validate(item)
+            if is_valid['is_error']:
+                result.update(status=BulkItemStatus.INVALID.value, errors=is_valid['data'])
+                continue
+            valid_items[index] = is_valid['data']
+            result['sid'] = is_valid['data'].get('sid')
+        return results, valid_items
+
+    @staticmethod
+    def mark_missing(connection: Any, results: list, valid_items: dict) -> dict:
+        """
+            Report items whose sid does not exist as not found and return remaining valid items.
+            Sids are looked up (and locked) in transaction of connection which writes remaining items.
+        """
+        existing = SMS.get_existing_sids(connection=connection,
+                                         sids=list({values['sid'] for values in valid_items.values()}))
+        for index in [index for index, values in valid_items.items() if values['sid'] not in existing]:
+            results[index]['status'] = BulkItemStatus.NOT_FOUND.value
+            del valid_items[index]
+        return valid_items
+
+    @staticmethod
+    def post():
+        """Create students."""
+        items = StudentsBulk.get_items()
+        if items is None:
+            return {'message': ResponseMessageKeys.BULK_ITEMS_REQUIRED.value}, 400
+        results, valid_items = StudentsBulk.validate(items=items, schema=BULK_CREATE_SCHEMA)
+        with SMS.bulk_transaction() as connection:
+            sids = SMS.bulk_create(connection=connection, rows=list(valid_items.values()))
+        SMS.invalidate_cache()
+        for index, sid in zip(valid_items, sids):  # type: ignore  # noqa: FKA100
+            results[index].update(status=BulkItemStatus.CREATED.value, sid=sid)
+        return {'results': results}
+
+    @staticmethod
+    def put():
+        """Update students, each item needs sid and all student fields."""
+        items = StudentsBulk.get_items()
+        if items is None:
+            return {'message': ResponseMessageKeys.BULK_ITEMS_REQUIRED.value}, 400
+        results, valid_items = StudentsBulk.validate(items=items, schema=BULK_UPDATE_SCHEMA)
+        with SMS.bulk_transaction() as connection:
+            valid_items = StudentsBulk.mark_missing(connection=connection, results=results, valid_items=valid_items)
+            SMS.bulk_update(connection=connection, rows=list(valid_items.values()))
+        SMS.invalidate_cache(sids={values['sid'] for values in valid_items.values()})
+        for index in valid_items:
+            results[index]['status'] = BulkItemStatus.UPDATED.value
+        return {'results': results}
+
+    @staticmethod
+    def delete():
+        """Delete students, each item needs sid."""
+        items = StudentsBulk.get_items()
+        if items is None:
+            return {'message': ResponseMessageKeys.BULK_ITEMS_REQUIRED.value}, 400
+        results, valid_items = StudentsBulk.validate(items=items, schema=BULK_DELETE_SCHEMA)
+        with SMS.bulk_transaction() as connection:
+            valid_items = StudentsBulk.mark_missing(connection=connection, results=results, valid_items=valid_items)
+            sids = list({values['sid'] for values in valid_items.values()})
+            SMS.bulk_delete(connection=connection, sids=sids)
+        SMS.invalidate_cache(sids=sids)
+        for index in valid_items:
+            results[index]['status'] = BulkItemStatus.DELETED.value
+        return {'results': results}
@@ -4,17 +4,37 @@ from __future__ import annotations
 from typing import Any
 
 from app import db
+from app.helpers.cache import get_token_digest
+from app.helpers.cache import token_cache
+from app.helpers.cache import user_summary_cache
 from app.helpers.constants import SortingOrder
+from app.helpers.serializer import RowSerializer
 from app.models.base import Base
 from sqlalchemy import asc
+from sqlalchemy import case
+from sqlalchemy import DDL
 from sqlalchemy import desc
+from sqlalchemy import event
+from sqlalchemy import func
+from sqlalchemy import inspect
 from sqlalchemy.ext import hybrid
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+# Key of session.info under which digests of tokens to drop from token cache are kept until transaction commits.
+TOKEN_DIGESTS_KEY = 'invalidated_token_digests'
 
 
 class User(Base):
     """Stores only personal details related to user like first name, last name, primary email, primary phone,
     country code, pin, device tokens, etc."""
     __tablename__ = 'user'
+    __table_args__ = (
+        # Trigram index serves substring (ILIKE '%q%') search on postgres, see migration 0008.
+        db.Index('ix_user_search_name_trgm', 'search_name', postgresql_using='gin',
+                 postgresql_ops={'search_name': 'gin_trgm_ops'}),
+    )
     id = db.Column(db.BigInteger, primary_key=True, autoincrement=True)
     first_name = db.Column(db.String(20), nullable=False)
     last_name = db.Column(db.String, nullable=True)
@@ -30,9 +50,69 @@ class User(Base):
     deleted_at = db.Column(db.DateTime)
     created_by = db.Column(db.BigInteger)
     updated_by = db.Column(db.BigInteger)
+    # Full name stored by database for indexed search, it is never written by application.
+    search_name = db.Column(db.Text, db.Computed("first_name || coalesce(' ' || nullif(last_name, ''), '')"))
 
     # org = relationship(Organization)
 
+    @classmethod
+    def __declare_last__(cls):
+        """ Declare audit events along with events which invalidate cached auth tokens """
+        super().__declare_last__()
+        event.listen(cls, 'after_update', cls.collect_cached_token)  # noqa: FKA100
+        event.listen(cls, 'after_delete', cls.collect_cached_token)  # noqa: FKA100
+        event.listen(cls, 'after_update', cls.invalidate_cached_summary)  # noqa: FKA100
+        event.listen(cls, 'after_delete', cls.invalidate_cached_summary)  # noqa: FKA100
+
+    @staticmethod
+    def collect_cached_token(mapper, connection, target):  # noqa: F841
+        """
+            Listen for `after_update`/`after_delete` events and remember cached tokens of user to drop when
+            auth_token is rotated, user is deactivated or user is deleted. Events run during flush, so tokens
+            are dropped once transaction commits (see invalidate_cached_tokens), otherwise a request could
+            cache the old state again before the change is visible to it.
+        """
+        tokens = set()
+        if inspect(target).deleted:
+            tokens.add(target.auth_token)
+        else:
+            tokens.update(get_history(target, 'auth_token').deleted)  # noqa: FKA100
+            for key in ('deactivated_at', 'deleted_at'):
+                if get_history(target, key).has_changes():  # noqa: FKA100
+                    tokens.add(target.auth_token)
+        digests = {get_token_digest(token) for token in tokens if token}
+        session = inspect(target).session
+        if session is None:
+            token_cache.delete(*digests)
+        elif digests:
+            session.info.setdefault(TOKEN_DIGESTS_KEY, set()).update(digests)  # noqa: FKA100
+
+    @staticmethod
+    def invalidate_cached_tokens(session) -> None:
+        """
+            Drop cached tokens collected in transaction once it ends. They are dropped after rollback as well, with
+            AUTOCOMMIT engines flushed changes are not rolled back and dropping a cached token is always safe.
+        """
+        digests = session.info.pop(TOKEN_DIGESTS_KEY, None)  # noqa: FKA100
+        if digests:
+            token_cache.delete(*digests)
+
+    @staticmethod
+    def invalidate_cached_summary(mapper, connection, target):  # noqa: F841
+        """Listen for `after_update`/`after_delete` events and drop cached basic details of user."""
+        user_summary_cache.delete(str(target.id))
+
+    def to_cache_state(self) -> dict:
+        """Return column values of user which can be stored in cache."""
+        return {attr.key: getattr(self, attr.key) for attr in inspect(self).mapper.column_attrs}
+
+    @classmethod
+    def from_cache_state(cls, state: dict) -> User:
+        """Return user attached to current session from cached column values without querying database."""
+        user = cls(**state)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
     @hybrid.hybrid_property
     def full_name(self) -> str:
         """Return full name."""
@@ -52,30 +132,45 @@ class User(Base):
                                  User.country_code, User.primary_phone).all()
         return {r.id: r._asdict() for r in query}
 
+    @staticmethod
+    def get_user_detail_by_ids(user_ids: Any) -> dict:
+        """
+            Return basic details (same as get_all_user_detail) of given user ids only.
+            Details are served from shared user summary cache, missing ids are fetched with one IN query.
+        """
+        user_ids = {int(user_id) for user_id in user_ids if user_id}
+        if not user_ids:
+            return {}
+        cached = user_summary_cache.get_many([str(user_id) for user_id in user_ids])
+        user_dict = {int(key): value for key, value in cached.items()}
+        missing_ids = user_ids.difference(user_dict)
+        if missing_ids:
+            query = db.session.query(User.id, User.first_name, User.full_name, User.last_name, User.primary_email,  # type: ignore  # noqa: FKA100
+                                     User.country_code, User.primary_phone).filter(User.id.in_(missing_ids)).all()
+            fetched = {r.id: r._asdict() for r in query}
+            user_summary_cache.set_many({str(key): value for key, value in fetched.items()})
+            user_dict.update(fetched)
+        return user_dict
+
+    @staticmethod
+    def get_user_objects_by_ids(user_ids: Any) -> dict:
+        """
+            Details of get_user_detail_by_ids keyed by string user ids, as `objects.user` of responses.
+            String keys are serialized by orjson directly, int keys made whole response fall back to stdlib json.
+        """
+        return {str(user_id): details for user_id, details in User.get_user_detail_by_ids(user_ids).items()}
+
     @classmethod
     def serialize_user(cls, details: list) -> list:
-        """ Make a list of User objects for crew members."""
-        data = []
-        for single_data in details:
-            single_data_obj = {
-                'id': single_data.id,
-                'address': single_data.address,
-                'zip_code': single_data.zip_code,
-                'name': single_data.full_name,
-                'first_name': single_data.first_name,
-                'last_name': single_data.last_name,
-                'email': single_data.primary_email,
-                'phone': single_data.primary_phone,
-                'country_code': single_data.country_code,
-                'deactivated_at': single_data.deactivated_at if single_data.deactivated_at else '',
-                'deleted_at': single_data.deleted_at,
-                'created_at': single_data.created_at,
-                'updated_at': single_data.updated_at,
-            }
-
-            data.append(single_data_obj)
-
-        return data
+        """ Make a list of User objects (or rows selected with get_serialized_columns) for crew members."""
+        return user_serializer.serialize_all(details)
+
+    @staticmethod
+    def get_serialized_columns() -> list:
+        """Return columns used by serialize_user, full name is read from generated search_name column."""
+        return [User.id, User.address, User.zip_code, User.search_name.label('full_name'), User.first_name,
+                User.last_name, User.primary_email, User.primary_phone, User.country_code, User.deactivated_at,
+                User.deleted_at, User.created_at, User.updated_at]
 
     @classmethod
     def get_by_email(cls, email: str) -> Any:
@@ -83,19 +178,52 @@ class User(Base):
         return db.session.query(User).filter(User.primary_email == email).first()
 
     @staticmethod
-    def get_user_list(org_id: Any = None, q: Any = None, sort: Any = None, page: Any = None, size: Any = None) -> str:
+    def get_search_rank(q: str) -> list:
+        """
+            Return order by clauses which rank users by how well full name matches q.
+            Postgres uses trigram similarity (pg_trgm), other databases rank full name starting with q first
+            and then by position of q in full name.
+        """
+        if db.engine.dialect.name == 'postgresql':
+            return [desc(func.similarity(User.search_name, q))]
+        search_name = func.lower(User.search_name)
+        return [asc(case((search_name.like('{}%'.format(q.lower())), 0), else_=1)),  # type: ignore  # noqa: FKA100
+                asc(func.instr(search_name, q.lower())), asc(func.length(User.search_name))]  # type: ignore  # noqa: FKA100
+
+    @staticmethod
+    def get_user_list(org_id: Any = None, q: Any = None, sort: Any = None, page: Any = None, size: Any = None,
+                      columns: Any = None) -> str:
         """Filter records by query params and sorts them based on page, size,
-        sort(sorting parameter)."""
+        sort(sorting parameter), sort `relevance` orders users matching q by rank (see get_search_rank).
+        If columns are passed only those columns are selected as rows instead of loading User objects."""
+        entities = columns or [User]
         if sort == SortingOrder.ASC.value:
-            query = db.session.query(User).filter(
+            query = db.session.query(*entities).filter(
                 User.deleted_at == None).order_by(asc(User.created_at))
         else:
-            query = db.session.query(User).filter(
+            query = db.session.query(*entities).filter(
                 User.deleted_at == None).order_by(desc(User.created_at))
         if q:
-            query = query.filter(User.full_name.ilike('%{}%'.format(q)))
+            query = query.filter(User.search_name.ilike('%{}%'.format(q)))
+            if sort == SortingOrder.RELEVANCE.value:
+                query = query.order_by(None).order_by(*User.get_search_rank(q=q), desc(User.created_at))
         if page and size:
             offset = (int(page) - 1) * int(size)
             query = query.limit(size)
             query = query.offset(offset)
         return query
+
+
+user_serializer = RowSerializer(
+    fields={'id': 'id', 'address': 'address', 'zip_code': 'zip_code', 'name': 'full_name', 'first_name': 'first_name',
+            'last_name': 'last_name', 'email': 'primary_email', 'phone': 'primary_phone',
+            'country_code': 'country_code', 'deactivated_at': 'deactivated_at', 'deleted_at': 'deleted_at',
+            'created_at': 'created_at', 'updated_at': 'updated_at'},
+    converters={'deactivated_at': lambda deactivated_at: deactivated_at if deactivated_at else ''})
+
+event.listen(Session, 'after_commit', User.invalidate_cached_tokens)  # noqa: FKA100
+event.listen(Session, 'after_rollback', User.invalidate_cached_tokens)  # noqa: FKA100
+
+# Operator class of search index is provided by pg_trgm extension, so it is enabled before table is created.
+event.listen(User.__table__, 'before_create',  # noqa: FKA100
+             DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
@@ -0,0 +1,119 @@
+"""
+    Database model for tracking bulk user imports is written in this File along with its methods.
+"""
+from datetime import datetime
+from datetime import timedelta
+from typing import Any
+
+from app import config_data
+from app import db
+from app.helpers.constants import ImportStatus
+from app.helpers.constants import RecordFormat
+from dateutil import tz
+
+
+class UserImport(db.Model):
+    """
+        Bulk import of users from a CSV/NDJSON file. File is processed in chunks of chunk_size records, each chunk
+        is committed together with its counters and last_chunk so an interrupted import resumes after last
+        committed chunk.
+    """
+    __tablename__ = 'user_import'
+    # Errors of first rows are kept so that progress row stays small for big files.
+    MAX_ERRORS = 100
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    file_path = db.Column(db.String, nullable=False)
+    file_format = db.Column(db.String, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String, nullable=False, default=ImportStatus.PENDING.value)
+    last_chunk = db.Column(db.Integer, nullable=False, default=-1)
+    imported_rows = db.Column(db.BigInteger, nullable=False, default=0)
+    skipped_rows = db.Column(db.BigInteger, nullable=False, default=0)
+    failed_rows = db.Column(db.BigInteger, nullable=False, default=0)
+    errors = db.Column(db.JSON, nullable=False, default=list)
+    created_by = db.Column(db.BigInteger)
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(tz=tz.tzlocal()))
+    updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(tz=tz.tzlocal()),
+                           onupdate=lambda: datetime.now(tz=tz.tzlocal()))
+
+    def __repr__(self):
+        """
+            Object Representation Method for custom object representation on console or log
+        """
+        return '<UserImport %r: %r %r>' % (self.id, self.file_path, self.status)
+
+    @classmethod
+    def get_file_format(cls, file_name: str, file_format: Any = None) -> Any:
+        """Return format of import file (passed format or format from file extension), None if not supported."""
+        if not file_format:
+            extension = file_name.rsplit('.', 1)[-1].lower()  # type: ignore  # noqa: FKA100
+            file_format = {'jsonl': RecordFormat.NDJSON.value, 'json': RecordFormat.NDJSON.value}.get(  # type: ignore  # noqa: FKA100
+                extension, extension)
+        return RecordFormat.get_name(file_format)
+
+    @classmethod
+    def create(cls, file_path: str, file_format: str, chunk_size: int, created_by: Any = None) -> Any:
+        """Add pending import of file."""
+        user_import = cls(file_path=file_path, file_format=file_format, chunk_size=chunk_size,
+                          created_by=created_by, status=ImportStatus.PENDING.value, last_chunk=-1, imported_rows=0,
+                          skipped_rows=0, failed_rows=0, errors=[])
+        db.session.add(user_import)
+        db.session.commit()
+        return user_import
+
+    @classmethod
+    def get_by_id(cls, id: int) -> Any:
+        """Filter record by id."""
+        return db.session.query(cls).filter(cls.id == id).first()
+
+    @classmethod
+    def get_stale_before(cls) -> datetime:
+        """Return time before which last progress of running import means its worker was interrupted."""
+        stale_after = (config_data.get('USER_IMPORT') or {}).get('STALE_AFTER', 600)
+        return datetime.now(tz=tz.tzlocal()) - timedelta(seconds=stale_after)
+
+    @classmethod
+    def is_running(cls, id: int) -> bool:
+        """Return True if import is being run by a worker which made progress recently."""
+        return db.session.query(cls.id).filter(cls.id == id, cls.status == ImportStatus.RUNNING.value,
+                                               cls.updated_at >= cls.get_stale_before()).first() is not None
+
+    @classmethod
+    def claim(cls, connection, import_id: int) -> bool:
+        """
+            Mark import running unless it is completed or run by another worker (see is_running), returns True if it
+            was claimed. Status is checked and changed by one UPDATE, so two workers never claim same import.
+        """
+        table = cls.__table__
+        return connection.execute(table.update().where(
+            table.c.id == import_id, table.c.status != ImportStatus.COMPLETED.value,
+            (table.c.status != ImportStatus.RUNNING.value) | (table.c.updated_at < cls.get_stale_before())
+        ).values(status=ImportStatus.RUNNING.value, updated_at=datetime.now(tz=tz.tzlocal()))).rowcount == 1
+
+    @classmethod
+    def get_progress(cls, connection, import_id: int) -> Any:
+        """Return progress row of import read with given connection (used outside of flask application)."""
+        return connection.execute(cls.__table__.select().where(cls.__table__.c.id == import_id)).first()
+
+    @classmethod
+    def update_progress(cls, connection, import_id: int, **values) -> None:
+        """Update progress columns of import."""
+        connection.execute(cls.__table__.update().where(cls.__table__.c.id == import_id).values(
+            updated_at=datetime.now(tz=tz.tzlocal()), **values))
+
+    def serialize(self) -> dict:
+        """Return progress of import."""
+        return {
+            'id': self.id,
+            'file_format': self.file_format,
+            'chunk_size': self.chunk_size,
+            'status': self.status,
+            'completed_chunks': self.last_chunk + 1,
+            'imported_rows': self.imported_rows,
+            'skipped_rows': self.skipped_rows,
+            'failed_rows': self.failed_rows,
+            'errors': self.errors,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
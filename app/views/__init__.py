@@ -1,6 +1,7 @@
 """Contain all the urls of apis"""
 from app.views.common_view import AuditView
 from app.views.common_view import FileView
+from app.views.common_view import RedisView
 from app.views.user_view import UserView
 from app.views.student_view import StudentsView,StudentView
 from flask import Blueprint
@@ -30,12 +31,26 @@ v1_blueprints.add_url_rule(
     '/user/auth', view_func=UserView.login, methods=['POST'])
 v1_blueprints.add_url_rule(
     '/user/get', view_func=UserView.search, methods=['GET'])
+v1_blueprints.add_url_rule(
+    '/user/import', view_func=UserView.import_users, methods=['POST'])
+v1_blueprints.add_url_rule(
+    '/user/import/<int:import_id>', view_func=UserView.import_progress, methods=['GET'])
+v1_blueprints.add_url_rule(
+    '/user/import/<int:import_id>/resume', view_func=UserView.resume_import, methods=['POST'])
+v1_blueprints.add_url_rule(
+    '/user/token-cache/stats', view_func=UserView.get_token_cache_stats, methods=['GET'])
 v1_blueprints.add_url_rule(
     '/common/upload-file', view_func=FileView.as_view('upload'), methods=['POST'])
 v1_blueprints.add_url_rule(
     '/log/audit', view_func=AuditView.list, methods=['GET'])
 v1_blueprints.add_url_rule(
     '/log/audit-detail', view_func=AuditView.details, methods=['GET'])
+v1_blueprints.add_url_rule(
+    '/log/audit/export', view_func=AuditView.export, methods=['GET'])
+v1_blueprints.add_url_rule(
+    '/log/audit/summary', view_func=AuditView.summary, methods=['GET'])
+v1_blueprints.add_url_rule(
+    '/redis/pools', view_func=RedisView.pool_stats, methods=['GET'])
 v1_blueprints.add_url_rule(
     '/get', view_func=StudentsView.get_students, methods=['GET'])
 v1_blueprints.add_url_rule(
@@ -46,3 +61,11 @@ v1_blueprints.add_url_rule(
     '/put/<int:sid>', view_func=StudentsView.update_student_by_id, methods=['PUT'])
 v1_blueprints.add_url_rule(
     '/delete/<int:sid>', view_func=StudentsView.delete_student_by_id, methods=['DELETE'])
+v1_blueprints.add_url_rule(
+    '/students/bulk', view_func=StudentsView.bulk_add_students, methods=['POST'])
+v1_blueprints.add_url_rule(
+    '/students/bulk', view_func=StudentsView.bulk_update_students, methods=['PUT'])
+v1_blueprints.add_url_rule(
+    '/students/bulk', view_func=StudentsView.bulk_delete_students, methods=['DELETE'])
+v1_blueprints.add_url_rule(
+    '/students/cache/stats', view_func=StudentsView.get_cache_stats, methods=['GET'])
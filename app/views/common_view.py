@@ -1,24 +1,46 @@
 """common view functions required by all modules"""
+import csv
 from datetime import datetime
+import io
+from itertools import islice
+import json
 import os
+from typing import Any
 
 from app import config_data
 from app import logger
 from app.helpers.constants import HttpStatusCode
+from app.helpers.constants import RecordFormat
 from app.helpers.constants import ResponseMessageKeys
 from app.helpers.constants import SupportedFileTypes
 from app.helpers.decorators import api_time_logger
+from app.helpers.decorators import cached_view
+from app.helpers.decorators import read_replica
 from app.helpers.decorators import token_required
-from app.helpers.utility import required_validator
+from app.helpers.redis_pool import redis_pools
+from app.helpers.utility import decode_cursor
+from app.helpers.utility import encode_cursor
+from app.helpers.utility import get_paginated_result
+from app.helpers.utility import gzip_stream
+from app.helpers.utility import RequestSchema
 from app.helpers.utility import send_json_response
+from app.helpers.utility import transaction_session
 from app.models.audit_log import AuditLog
+from app.models.audit_rollup import AuditRollup
 from app.models.user import User
 from flask import request
+from flask import Response
+from flask import stream_with_context
 from flask.views import View
 from magic import Magic
 from workers.s3_worker import get_presigned_url
 from workers.s3_worker import upload_file_and_get_object_details
 
+DEFAULT_CURSOR_PAGE_SIZE = 20
+MAX_CURSOR_PAGE_SIZE = (config_data.get('PAGINATION') or {}).get('MAX_PAGE_SIZE', 100)
+EXPORT_BATCH_SIZE = (config_data.get('AUDIT_LOG') or {}).get('EXPORT_BATCH_SIZE', 1000)
+upload_schema = RequestSchema(required_fields=['upload'])
+
 
 class FileView(View):
     """Contains file upload view"""
@@ -27,9 +49,7 @@ class FileView(View):
     def dispatch_request(self, logged_in_user: User) -> tuple:
         """Adds/ Uploads file to s3 """
         data = request.files
-        required_fields = ['upload']
-        is_valid = required_validator(
-            request_data=data, required_fields=required_fields)
+        is_valid = upload_schema.check_required(data)
         if is_valid['is_error']:
             return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
                                       message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
@@ -60,15 +80,11 @@ class FileView(View):
 class AuditView(View):
     """Contains all views for accessing audit logs"""
     @staticmethod
-    @api_time_logger    
-    @token_required
-    def list(logged_in_user: User) -> tuple:
+    def get_filters() -> tuple:
         """
-        Returns list of audit logs with details like user_name, table_name, ip_address, etc. from audit log table.
+        Returns (filters of AuditLog.get_logs, error response) parsed from request args user_id, action,
+        start_date and end_date, error response is None if args are valid.
         """
-        page = request.args.get(key='page', default=None)
-        pagination = request.args.get(key='pagination', default=None)
-        sort = request.args.get(key='sort', default=None)
         user_id = request.args.get(key='user_id', default=None)
         action = request.args.get(key='action', default=None)
         start_date = request.args.get(key='start_date', default=None)
@@ -85,11 +101,11 @@ class AuditView(View):
             except Exception as error:
                 logger.error(
                     'Error while fetching Audit Log details : {}'.format(error))
-                return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
-                                          message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
-                                          error={
-                                              'user_id': 'Please enter valid user_id.'
-                                          })
+                return None, send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                                message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
+                                                error={
+                                                    'user_id': 'Please enter valid user_id.'
+                                                })
 
         if action:
             try:
@@ -97,11 +113,11 @@ class AuditView(View):
             except Exception as error:
                 logger.error(
                     'Error while fetching Audit Log details : {}'.format(error))
-                return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
-                                          message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
-                                          error={
-                                              'action': 'Please enter valid action.'
-                                          })
+                return None, send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                                message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
+                                                error={
+                                                    'action': 'Please enter valid action.'
+                                                })
 
         if start_date:
             try:
@@ -110,35 +126,90 @@ class AuditView(View):
             except Exception as error:
                 logger.error(
                     'Error while fetching Audit Log details : {}'.format(error))
-                logger.error('Error while fetching Audit Log details for user id  : {}'.format(
-                    logged_in_user.id))
-                return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
-                                          message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
-                                          error={
-                                              'start_date': 'Please enter valid start_Date.'
-                                          })
+                return None, send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                                message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
+                                                error={
+                                                    'start_date': 'Please enter valid start_Date.'
+                                                })
         if end_date:
             try:
                 end_date = datetime.strptime(end_date + 'T23:59:59',    # type: ignore  # noqa: FKA100
                                              '%d/%m/%YT%H:%M:%S')
+            except Exception as error:
+                logger.error(
+                    'Error while fetching Audit Log details : {}'.format(error))
+                return None, send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                                message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
+                                                error={
+                                                    'end_date': 'Please enter valid end_date.'
+                                                })
+        return {'action': action, 'user_id': user_ids, 'start_date': start_date, 'end_date': end_date}, None
+
+    @staticmethod
+    @api_time_logger    
+    @token_required
+    @cached_view(ttl=30, vary_on=['user', 'args'], tags=[AuditLog.__tablename__, User.__tablename__])
+    @read_replica
+    def list(logged_in_user: User) -> tuple:
+        """
+        Returns list of audit logs with details like user_name, table_name, ip_address, etc. from audit log table.
+        Pass `cursor` (empty for first page, then `next_cursor` of previous response) to use keyset pagination
+        instead of page/pagination offset pagination.
+        """
+        cursor = request.args.get(key='cursor', default=None)
+        page = request.args.get(key='page', default=None)
+        pagination = request.args.get(key='pagination', default=None)
+        sort = request.args.get(key='sort', default=None)
+        filters, error_response = AuditView.get_filters()
+        if error_response:
+            return error_response
+        action = filters['action']
+        user_ids = filters['user_id']
+        start_date = filters['start_date']
+        end_date = filters['end_date']
+        if cursor is not None:
+            try:
+                cursor = decode_cursor(cursor) if cursor else []
+                pagination = int(pagination) if pagination else DEFAULT_CURSOR_PAGE_SIZE
+                # Cursor is [created_at, id] of last audit log of previous page, see encode_cursor below.
+                if cursor and (len(cursor) != 2 or not isinstance(cursor[0], datetime)
+                               or not isinstance(cursor[1], int)):
+                    raise ValueError(f'Invalid cursor : {cursor}')
+                if not 0 < pagination <= MAX_CURSOR_PAGE_SIZE:
+                    raise ValueError(f'Invalid pagination : {pagination}')
             except Exception as error:
                 logger.error(
                     'Error while fetching Audit Log details : {}'.format(error))
                 return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
                                           message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
                                           error={
-                                              'end_date': 'Please enter valid end_date.'
+                                              'cursor': 'Please enter valid cursor.'
                                           })
-        audit_logs = AuditLog.get_logs(sort=sort, page=page, pagination=pagination, action=action,
-                                       user_id=user_ids, start_date=start_date, end_date=end_date)
+            audit_logs = AuditLog.get_logs(sort=sort, pagination=pagination, action=action, user_id=user_ids,
+                                           start_date=start_date, end_date=end_date, cursor=cursor).all()
+            next_cursor = None
+            if len(audit_logs) > pagination:
+                audit_logs = audit_logs[:pagination]
+                next_cursor = encode_cursor([audit_logs[-1].created_at, audit_logs[-1].id])
+            user_dict = User.get_user_objects_by_ids(
+                {audit_log.user_id for audit_log in audit_logs})
+            audit_log_list = AuditLog.serialize(audit_logs=audit_logs)
+            data = {'result': audit_log_list, 'objects': {'user': user_dict},
+                    'current_page_count': len(audit_log_list),
+                    'next_cursor': next_cursor} if audit_log_list else None
+            return send_json_response(http_status=HttpStatusCode.OK.value, response_status=True,
+                                      message_key=ResponseMessageKeys.SUCCESS.value, data=data, error=None)
 
-        current_page_count = audit_logs.count()
-        audit_logs = audit_logs.all()
-        user_dict = User.get_all_user_detail()
-        audit_log_list = AuditLog.serialize(audit_logs=audit_logs)
+        # Offset pagination is applied only when page, pagination and sort are passed.
+        audit_logs, total_count = get_paginated_result(
+            query=AuditLog.get_logs(sort=sort, action=action, user_id=user_ids,
+                                    start_date=start_date, end_date=end_date),
+            page=page if sort else None, size=pagination if sort else None)
 
-        total_count = AuditLog.get_logs(
-            action=action, user_id=user_id, start_date=start_date, end_date=end_date).count()
+        current_page_count = len(audit_logs)
+        user_dict = User.get_user_objects_by_ids(
+            {audit_log.user_id for audit_log in audit_logs})
+        audit_log_list = AuditLog.serialize(audit_logs=audit_logs)
         data = {'result': audit_log_list, 'objects': {'user': user_dict}, 'current_page_count': current_page_count,
                 'current_page': 1 if page is None else int(page),
                 'next_page': '' if page is None else int(page) + 1,
@@ -150,6 +221,116 @@ class AuditView(View):
     @staticmethod
     @api_time_logger
     @token_required
+    def export(logged_in_user: User) -> Any:
+        """
+        Streams all audit logs matching filters of audit log list (user_id, action, start_date, end_date, sort)
+        as NDJSON (default) or CSV (`format=csv`). Rows are read with server-side cursor in batches of
+        AUDIT_LOG.EXPORT_BATCH_SIZE so memory stays constant regardless of result size.
+        Response is gzip encoded on the fly when client accepts gzip.
+        """
+        export_format = request.args.get(key='format', default=RecordFormat.NDJSON.value)
+        sort = request.args.get(key='sort', default=None)
+        if RecordFormat.get_name(export_format) is None:
+            return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                      message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
+                                      error={
+                                          'format': 'Please enter valid format.'
+                                      })
+        filters, error_response = AuditView.get_filters()
+        if error_response:
+            return error_response
+
+        query = AuditLog.get_logs(sort=sort, request_columns=AuditLog.EXPORT_REQUEST_COLUMNS, **filters)
+        chunks = AuditView.generate_export(query=query, export_format=export_format)
+        headers = {
+            'Content-Disposition': f'attachment; filename=audit_log.{export_format}',
+            'Vary': 'Accept-Encoding'
+        }
+        if request.accept_encodings['gzip']:
+            chunks = gzip_stream(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        mimetype = 'text/csv' if export_format == RecordFormat.CSV.value else 'application/x-ndjson'
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
+    @staticmethod
+    def generate_export(query: Any, export_format: str) -> Any:
+        """
+        Yields exported audit logs of query, one chunk per batch. User names are fetched for each batch
+        instead of loading whole user table.
+        """
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=AuditLog.EXPORT_COLUMNS)
+        if export_format == RecordFormat.CSV.value:
+            writer.writeheader()
+        # Server-side cursor of yield_per needs a transaction, which connections of AUTOCOMMIT engine do not have.
+        with transaction_session(stream_results=True) as session:
+            audit_logs = iter(query.with_session(session).yield_per(EXPORT_BATCH_SIZE))
+            while True:
+                batch = list(islice(audit_logs, EXPORT_BATCH_SIZE))  # type: ignore  # noqa: FKA100
+                if not batch:
+                    break
+                user_dict = User.get_user_detail_by_ids({audit_log.user_id for audit_log in batch})
+                for audit_log in batch:
+                    row = audit_log.to_export_row(user_dict=user_dict)
+                    if export_format == RecordFormat.CSV.value:
+                        row['state_before'] = json.dumps(row['state_before'])
+                        row['state_after'] = json.dumps(row['state_after'])
+                        writer.writerow(row)
+                    else:
+                        buffer.write(json.dumps(row, default=str) + '\n')
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    @staticmethod
+    @api_time_logger
+    @token_required
+    @cached_view(ttl=60, vary_on=['user', 'args'], tags=[AuditLog.__tablename__])
+    def summary(logged_in_user: User) -> tuple:
+        """
+        Returns number of audit logs grouped by `group_by` (comma separated day, table_name, action, user_id,
+        default is day,table_name,action). Counts are read from audit rollup only, filters are same as audit log
+        list along with comma separated table_name.
+        """
+        group_by = request.args.get(key='group_by', default='day,table_name,action')
+        table_name = request.args.get(key='table_name', default=None)
+        group_by = [column for column in group_by.split(',') if column]
+        if not group_by or any(column not in AuditRollup.GROUP_BY_COLUMNS for column in group_by):
+            return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                      message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
+                                      error={
+                                          'group_by': 'Please enter valid group_by.'
+                                      })
+        filters, error_response = AuditView.get_filters()
+        if error_response:
+            return error_response
+
+        rows = AuditRollup.get_summary(group_by=group_by, table_name=table_name.split(',') if table_name else None,
+                                       action=filters['action'], user_id=filters['user_id'],
+                                       start_date=filters['start_date'].date() if filters['start_date'] else None,
+                                       end_date=filters['end_date'].date() if filters['end_date'] else None).all()
+        result = []
+        for row in rows:
+            data_dict = row._asdict()
+            data_dict['count'] = int(data_dict['count'])
+            if 'day' in data_dict:
+                data_dict['day'] = data_dict['day'].isoformat()
+            if 'user_id' in data_dict:
+                # Audit logs without logged in user are counted with user_id 0.
+                data_dict['user_id'] = data_dict['user_id'] or None
+            result.append(data_dict)
+        user_dict = User.get_user_objects_by_ids(
+            {data_dict['user_id'] for data_dict in result if data_dict.get('user_id')})
+        data = {'result': result, 'objects': {'user': user_dict}} if result else None
+        return send_json_response(http_status=HttpStatusCode.OK.value, response_status=True,
+                                  message_key=ResponseMessageKeys.SUCCESS.value, data=data, error=None)
+
+    @staticmethod
+    @api_time_logger
+    @token_required
+    @read_replica
     def details(logged_in_user: User) -> tuple:
         """
         Returns audit log details like action, args, body, created_at, headers, ip, method, object_id, etc.
@@ -162,7 +343,7 @@ class AuditView(View):
                 'audit_log_id': 'audit_log_id is required.'
             })
 
-        audit_log = AuditLog.get_by_id(int(audit_log_id))
+        audit_log = AuditLog.get_details(int(audit_log_id))
         user = ''
         if audit_log:
             if audit_log.user_id:
@@ -174,12 +355,7 @@ class AuditView(View):
                 'action': audit_log.action,
                 'state_before': audit_log.state_before,
                 'state_after': audit_log.state_after,
-                'method': audit_log.method,
-                'url': audit_log.url,
-                'headers': audit_log.headers,
-                'body': audit_log.body,
-                'args': audit_log.args,
-                'ip': audit_log.ip,
+                **audit_log.get_request_details(),
                 'created_at': audit_log.created_at
             }
 
@@ -192,6 +368,22 @@ class AuditView(View):
                                   message_key=ResponseMessageKeys.SUCCESS.value, data={'api_log_data': data_dict}, error=None)
 
 
+class RedisView(View):
+    """Contains redis connection pool views"""
+    @staticmethod
+    @api_time_logger
+    @token_required
+    def pool_stats(logged_in_user: User) -> tuple:
+        """
+        Returns utilization of redis connection pools of this process (created, in use, idle, peak in use and
+        number of requests which waited longer than REDIS.POOL_TIMEOUT) and result of ping of each pool.
+        Used to size REDIS.MAX_CONNECTIONS and maxclients of redis (max connections x pools x processes).
+        """
+        data = {'pools': redis_pools.get_stats(), 'health': redis_pools.check_health()}
+        return send_json_response(http_status=HttpStatusCode.OK.value, response_status=True,
+                                  message_key=ResponseMessageKeys.SUCCESS.value, data=data, error=None)
+
+
 from flask_restful import Resource,Api
 
 class HelloWorld(Resource):
@@ -6,29 +6,39 @@ from typing import Any
 from app import config_data
 from app import db
 from app import logger
+from app.helpers.cache import student_cache
 from app.helpers.constants import HttpStatusCode
 from app.helpers.constants import ResponseMessageKeys
 from app.helpers.decorators import api_time_logger
+from app.helpers.decorators import read_replica
 from app.helpers.decorators import token_required
 from app.helpers.utility import field_type_validator
 from app.helpers.utility import get_pagination_meta
+from app.helpers.utility import RequestSchema
 from app.helpers.utility import required_validator
 from app.helpers.utility import send_json_response
-from app.models.student import Students,SMS,Student
+from app.models.student import Students,SMS,Student,StudentsBulk
 from flask import request
 from flask.views import View
 import jwt
 from werkzeug.security import check_password_hash
 
+list_schema = RequestSchema(field_types={'clas': int, 'page': int, 'size': int})
 
 class StudentsView(View):
     """Contains all user related functions"""
     
     @staticmethod
     @api_time_logger
+    @read_replica
     def get_students():
         """Login api for admin user to check pin and email and return login response with access token"""
 
+        is_valid = list_schema.check_types(request.args)
+        if is_valid['is_error']:
+            return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                      message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
+                                      error=is_valid['data'])
         # print(request)
         Students_data=Students.get()
         
@@ -64,6 +74,31 @@ class StudentsView(View):
         deleted_student=Student.delete(sid)
         return deleted_student
 
+    @staticmethod
+    @api_time_logger
+    def bulk_add_students():
+        """Create list of students in one transaction."""
+        return StudentsBulk.post()
+
+    @staticmethod
+    @api_time_logger
+    def bulk_update_students():
+        """Update list of students in one transaction."""
+        return StudentsBulk.put()
+
+    @staticmethod
+    @api_time_logger
+    def bulk_delete_students():
+        """Delete list of students in one transaction."""
+        return StudentsBulk.delete()
+
+    @staticmethod
+    @api_time_logger
+    def get_cache_stats():
+        """Hit/miss counters of student cache in this process."""
+        return send_json_response(http_status=HttpStatusCode.OK.value, response_status=True,
+                                  message_key=ResponseMessageKeys.SUCCESS.value, data=student_cache.get_stats())
+
 class StudentView(View):
     """Contains all user related functions"""
 
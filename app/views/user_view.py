@@ -1,24 +1,43 @@
 """Contains user related API definitions."""
 from datetime import datetime
 from datetime import timedelta
+import os
 from typing import Any
+from uuid import uuid4
 
 from app import config_data
 from app import db
 from app import logger
+from app import r
+from app.helpers.cache import token_cache
 from app.helpers.constants import HttpStatusCode
+from app.helpers.constants import ImportStatus
+from app.helpers.constants import QueueName
+from app.helpers.constants import RecordFormat
 from app.helpers.constants import ResponseMessageKeys
 from app.helpers.decorators import api_time_logger
+from app.helpers.decorators import cached_view
+from app.helpers.decorators import read_replica
 from app.helpers.decorators import token_required
-from app.helpers.utility import field_type_validator
+from app.helpers.utility import get_paginated_result
 from app.helpers.utility import get_pagination_meta
-from app.helpers.utility import required_validator
+from app.helpers.utility import RequestSchema
 from app.helpers.utility import send_json_response
 from app.models.user import User
+from app.models.user_import import UserImport
 from flask import request
 from flask.views import View
 import jwt
+from rq import Queue
 from werkzeug.security import check_password_hash
+from workers.user_import_worker import UserImportWorker
+
+user_import_q = Queue(QueueName.USER_IMPORT, connection=r)
+search_schema = RequestSchema(field_types={'page': int, 'size': int, 'q': str, 'sort': str, 'user_type': str},
+                              required_fields=['page', 'size'])
+login_schema = RequestSchema(field_types={'email': str, 'pin': str}, required_fields=['email', 'pin'])
+import_upload_schema = RequestSchema(required_fields=['upload'])
+import_options_schema = RequestSchema(field_types={'chunk_size': int, 'format': str})
 
 
 class UserView(View):
@@ -57,23 +76,13 @@ class UserView(View):
     @staticmethod
     @api_time_logger
     @token_required
+    @cached_view(ttl=60, vary_on=['user', 'args'], tags=[User.__tablename__])
+    @read_replica
     def search(logged_in_user: User) -> tuple:
         """Used to return the list of all users based on search , pagination and sorting
             with pagination metadata.
         """
-        data = request.args
-        field_types = {'page': int, 'size': int,
-                       'q': str, 'sort': str, 'user_type': str}
-        required_fields = ['page', 'size']
-        post_data = field_type_validator(
-            request_data=data, field_types=field_types)
-        if post_data['is_error']:
-            return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
-                                      message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
-                                      error=post_data['data'])
-
-        is_valid = required_validator(
-            request_data=data, required_fields=required_fields)
+        is_valid = search_schema.validate(request.args)
         if is_valid['is_error']:
             return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
                                       message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
@@ -83,11 +92,9 @@ class UserView(View):
         q = request.args.get('q')
         sort = request.args.get('sort')
 
-        user_list = User.get_user_list(
-            q=q, sort=sort, page=page, size=size).all()
-        user_count = User.get_user_list(q=q, sort=sort).count()
+        user_list, total_count = get_paginated_result(
+            query=User.get_user_list(q=q, sort=sort, columns=User.get_serialized_columns()), page=page, size=size)
         user_data_ = User.serialize_user(user_list)
-        total_count = user_count
         data = {'result': user_data_,
                 'pagination_metadata': get_pagination_meta(current_page=1 if page is None else int(page),
                                                            page_size=int(size),
@@ -102,17 +109,7 @@ class UserView(View):
         """Login api for admin user to check pin and email and return login response with access token"""
 
         data = request.get_json(force=True)
-        field_types = {'email': str, 'pin': str}
-        required_fields = ['email', 'pin']
-        post_data = field_type_validator(
-            request_data=data, field_types=field_types)
-        if post_data['is_error']:
-            return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
-                                      message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value,
-                                      data=None, error=post_data['data'])
-
-        is_valid = required_validator(
-            request_data=data, required_fields=required_fields)
+        is_valid = login_schema.validate(data)
         if is_valid['is_error']:
             return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
                                       message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
@@ -152,3 +149,97 @@ class UserView(View):
             return send_json_response(http_status=HttpStatusCode.OK.value, response_status=False,
                                       message_key=ResponseMessageKeys.LOGIN_FAILED.value,
                                       data=None, error=None)
+
+    @staticmethod
+    @api_time_logger
+    @token_required
+    def import_users(logged_in_user: User) -> tuple:
+        """
+        Starts bulk import of users from uploaded CSV/NDJSON file (`upload`) in background rq job.
+        File is saved to UPLOAD_FOLDER and imported in chunks of `chunk_size` (USER_IMPORT.CHUNK_SIZE by default)
+        records, progress is returned by import progress api.
+        """
+        data = request.form
+        is_valid = import_upload_schema.check_required(request.files)
+        if is_valid['is_error']:
+            return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                      message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
+                                      error=is_valid['data'])
+        post_data = import_options_schema.check_types(data)
+        if post_data['is_error']:
+            return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                      message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
+                                      error=post_data['data'])
+
+        uploaded_file = request.files['upload']
+        file_format = UserImport.get_file_format(file_name=uploaded_file.filename or '',
+                                                 file_format=data.get('format'))
+        if file_format is None:
+            return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                      message_key=ResponseMessageKeys.ENTER_CORRECT_INPUT.value, data=None,
+                                      error={
+                                          'upload': ResponseMessageKeys.INVALID_FILE_TYPE.value.format(   # type: ignore  # noqa: FKA100
+                                              'Upload', [record_format.value for record_format in RecordFormat])
+                                      })
+        file_path = os.path.join(config_data['UPLOAD_FOLDER'], f'user_import_{uuid4().hex}.{file_format}')  # type: ignore  # noqa: FKA100
+        uploaded_file.save(file_path)
+        chunk_size = max(1, post_data['data']['chunk_size'] or config_data['USER_IMPORT']['CHUNK_SIZE'])  # type: ignore  # noqa: FKA100
+        user_import = UserImport.create(file_path=file_path, file_format=file_format, chunk_size=chunk_size,
+                                        created_by=logged_in_user.id)
+        return UserView.enqueue_import(user_import=user_import)
+
+    @staticmethod
+    @api_time_logger
+    @token_required
+    def import_progress(logged_in_user: User, import_id: int) -> tuple:
+        """Returns progress of bulk user import."""
+        user_import = UserImport.get_by_id(import_id)
+        if user_import is None:
+            return send_json_response(http_status=HttpStatusCode.NOT_FOUND.value, response_status=False,
+                                      message_key=ResponseMessageKeys.IMPORT_NOT_FOUND.value, data=None, error=None)
+        return send_json_response(http_status=HttpStatusCode.OK.value, response_status=True,
+                                  message_key=ResponseMessageKeys.SUCCESS.value, data=user_import.serialize(),
+                                  error=None)
+
+    @staticmethod
+    @api_time_logger
+    @token_required
+    def resume_import(logged_in_user: User, import_id: int) -> tuple:
+        """
+            Resumes interrupted bulk user import after its last committed chunk. Import which is still running
+            (made progress within USER_IMPORT.STALE_AFTER) is not enqueued again.
+        """
+        user_import = UserImport.get_by_id(import_id)
+        if user_import is None:
+            return send_json_response(http_status=HttpStatusCode.NOT_FOUND.value, response_status=False,
+                                      message_key=ResponseMessageKeys.IMPORT_NOT_FOUND.value, data=None, error=None)
+        if user_import.status == ImportStatus.COMPLETED.value:
+            return send_json_response(http_status=HttpStatusCode.BAD_REQUEST.value, response_status=False,
+                                      message_key=ResponseMessageKeys.IMPORT_ALREADY_COMPLETED.value, data=None,
+                                      error=None)
+        if UserImport.is_running(import_id):
+            return send_json_response(http_status=HttpStatusCode.CONFLICT.value, response_status=False,
+                                      message_key=ResponseMessageKeys.IMPORT_ALREADY_RUNNING.value, data=None,
+                                      error=None)
+        return UserView.enqueue_import(user_import=user_import)
+
+    @staticmethod
+    def enqueue_import(user_import: UserImport) -> tuple:
+        """Enqueue rq job which runs import."""
+        try:
+            user_import_q.enqueue(UserImportWorker.run,  # type: ignore  # noqa: FKA100
+                                  user_import.id, job_timeout=config_data['RQ_JOB_TIMEOUT'])
+        except Exception as exception_error:
+            logger.error(f'Unable to enqueue user import {user_import.id} : {exception_error}')
+            return send_json_response(http_status=HttpStatusCode.INTERNAL_SERVER_ERROR.value, response_status=False,
+                                      message_key=ResponseMessageKeys.FAILED.value, data=None, error=None)
+        return send_json_response(http_status=HttpStatusCode.OK.value, response_status=True,
+                                  message_key=ResponseMessageKeys.IMPORT_STARTED.value,
+                                  data=user_import.serialize(), error=None)
+
+    @staticmethod
+    @api_time_logger
+    def get_token_cache_stats():
+        """Hit/miss counters of auth token cache in this process."""
+        return send_json_response(http_status=HttpStatusCode.OK.value, response_status=True,
+                                  message_key=ResponseMessageKeys.SUCCESS.value, data=token_cache.get_stats())
@@ -0,0 +1,110 @@
+"""
+    Micro-benchmark of per-object overhead of audit listeners.
+    Compares capturing audit state with mapper inspection on every object (previous implementation, kept
+    here as reference) against precomputed AuditPlan. Database is not used, objects are detached instances
+    with attribute history.
+
+    Usage: python benchmarks/audit_event_benchmark.py [number of objects]
+"""
+from datetime import datetime
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models.audit_event import AuditPlan  # noqa: E402
+from app.models.user import User  # noqa: E402
+from sqlalchemy import inspect  # noqa: E402
+from sqlalchemy.orm import class_mapper  # noqa: E402
+from sqlalchemy.orm import configure_mappers  # noqa: E402
+from sqlalchemy.orm import make_transient_to_detached  # noqa: E402
+from sqlalchemy.orm.attributes import get_history  # noqa: E402
+
+
+def dict_remove_datetime(data):
+    """Previous datetime conversion of audit states."""
+    return {key: value.strftime('%Y/%m/%d %H:%M:%S') if isinstance(value, datetime) else value for (key, value)
+            in data.items()}
+
+
+def convert_obj_to_dict(obj):
+    """Previous dictionary copy of object used to find identity of object."""
+    return {c.key: getattr(obj, c.key) for c in inspect(obj).mapper.column_attrs}
+
+
+def legacy_insert(target):
+    """Previous `after_insert` state capture."""
+    state_after = {}
+    for attr in class_mapper(target.__class__).column_attrs:
+        state_after[attr.key] = getattr(target, attr.key)
+    obj_as_dict = convert_obj_to_dict(target)
+    return target.id if obj_as_dict.get('id') else target.uuid, dict_remove_datetime(state_after)
+
+
+def legacy_update(target):
+    """Previous `after_update` state capture."""
+    state_before = {}
+    state_after = {}
+    inspr = inspect(target)
+    for attr in class_mapper(target.__class__).column_attrs:
+        hist = getattr(inspr.attrs, attr.key).history
+        if hist.has_changes():
+            try:
+                state_before[attr.key] = get_history(target, attr.key)[2].pop()  # noqa: FKA100
+            except Exception:
+                state_before[attr.key] = get_history(target, attr.key)[2]  # noqa: FKA100
+            state_after[attr.key] = getattr(target, attr.key)
+    obj_as_dict = convert_obj_to_dict(target)
+    return (target.id if obj_as_dict.get('id') else target.uuid, dict_remove_datetime(state_before),
+            dict_remove_datetime(state_after))
+
+
+def plan_insert(target):
+    """AuditPlan `after_insert` state capture."""
+    plan = AuditPlan.for_mapper(class_mapper(User))
+    return plan.get_object_id(target), plan.get_state(target)
+
+
+def plan_update(target):
+    """AuditPlan `after_update` state capture."""
+    plan = AuditPlan.for_mapper(class_mapper(User))
+    return (plan.get_object_id(target), *plan.get_changes(target))
+
+
+def build_users(count: int) -> list:
+    """Detached users with two changed columns, as they are in `after_update`."""
+    users = []
+    column_keys = [attr.key for attr in class_mapper(User).column_attrs]
+    for index in range(count):
+        user = User(**dict.fromkeys(column_keys))
+        user.id = index + 1
+        user.uuid = f'uuid-{index}'
+        user.first_name = 'First'
+        user.primary_email = f'user{index}@example.com'
+        user.last_login_at = user.created_at = user.updated_at = datetime(2024, 1, 1)  # noqa: FKA100
+        # Loaded values become committed state, so later assignments are recorded in history.
+        make_transient_to_detached(user)
+        user.first_name = 'Changed'
+        user.updated_at = datetime(2024, 1, 2)
+        users.append(user)
+    return users
+
+
+def run(count: int = 10000, repeat: int = 5) -> None:
+    """Print best per-object time of each implementation."""
+    configure_mappers()
+    users = build_users(count=count)
+    # Legacy update pops from attribute history, so update outputs are compared on fresh objects.
+    assert [legacy_insert(user) for user in users[:10]] == [plan_insert(user) for user in users[:10]]
+    assert ([legacy_update(user) for user in build_users(count=10)]
+            == [plan_update(user) for user in build_users(count=10)])
+
+    for name, function in (('insert (legacy)', legacy_insert), ('insert (plan)', plan_insert),
+                           ('update (legacy)', legacy_update), ('update (plan)', plan_update)):
+        best = min(timeit.repeat(lambda: [function(user) for user in users], number=1, repeat=repeat))
+        print(f'{name:<16} {best / count * 1e6:8.2f} us/object')
+
+
+if __name__ == '__main__':
+    run(count=int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
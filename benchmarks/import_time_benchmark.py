@@ -0,0 +1,65 @@
+"""
+    Benchmark of cold-start cost of application subsystems.
+    Every run uses a new interpreter which imports app and then initializes each lazy subsystem (TASK_ID, config,
+    logger, redis client, S3 resource, media directory) and the views, so each step pays its import and setup cost once.
+    Previous eager initialization of TASK_ID (curl to ECS metadata piped to jq) is measured as reference.
+
+    Usage: python benchmarks/import_time_benchmark.py [number of runs]
+"""
+import json
+import os
+import subprocess
+import sys
+
+base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Previous TASK_ID lookup executed on every import of app.
+LEGACY_TASK_ID_COMMAND = 'curl -s "$ECS_CONTAINER_METADATA_URI_V4/task" | jq -r ".TaskARN" | cut -d "/" -f 3'
+
+STEPS_SCRIPT = '''
+import json
+import subprocess
+import sys
+import time
+import warnings
+
+warnings.simplefilter('ignore')
+sys.path.insert(0, {base_dir!r})
+timings = {{}}
+
+
+def measure(name, function):
+    started_at = time.perf_counter()
+    function()
+    timings[name] = time.perf_counter() - started_at
+
+
+measure('import app', lambda: __import__('app'))
+import app
+measure('config.yml', app.config_data.load)
+measure('logger', app.init_logger)
+measure('TASK_ID', app.get_task_id)
+measure('legacy TASK_ID (curl | jq)', lambda: subprocess.getoutput({command!r}))
+measure('redis client', app.get_redis)
+measure('S3 resource', app.get_s3_resource)
+measure('media directory', app.get_media_dir)
+measure('import app.views', lambda: __import__('app.views'))
+print(json.dumps(timings))
+'''
+
+
+def run(runs: int = 5) -> None:
+    """Print best time of each step over fresh interpreters."""
+    script = STEPS_SCRIPT.format(base_dir=base_dir, command=LEGACY_TASK_ID_COMMAND)
+    best: dict = {}
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', script], cwd=base_dir, check=True, capture_output=True,
+                                text=True).stdout
+        for name, seconds in json.loads(output.strip().splitlines()[-1]).items():
+            best[name] = min(seconds, best.get(name, seconds))  # type: ignore  # noqa: FKA100
+    for name, seconds in best.items():
+        print(f'{name:<28} {seconds * 1e3:8.2f} ms')
+
+
+if __name__ == '__main__':
+    run(runs=int(sys.argv[1]) if len(sys.argv) > 1 else 5)
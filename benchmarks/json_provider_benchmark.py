@@ -0,0 +1,93 @@
+"""
+    Benchmark of response serialization of large `/user/get` and `/log/audit` payloads.
+    Compares flask default JSON provider (previous implementation, datetimes as RFC 822 strings) against
+    FastJSONProvider with stdlib json and with orjson (if installed), and checks that both encoders of
+    FastJSONProvider write same bytes. Payloads are built with serializers of the views, database is not used.
+
+    Usage: python benchmarks/json_provider_benchmark.py [number of rows]
+"""
+from datetime import datetime
+from datetime import timedelta
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.helpers.json_provider import FastJSONProvider  # noqa: E402
+from app.helpers.json_provider import has_float_mismatch  # noqa: E402
+from app.helpers.json_provider import json_default  # noqa: E402
+from app.helpers.json_provider import orjson  # noqa: E402
+from app.models.audit_log import audit_log_detail_serializer  # noqa: E402
+from app.models.user import user_serializer  # noqa: E402
+from dateutil import tz  # noqa: E402
+from flask import Flask  # noqa: E402
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+
+
+def build_user_payload(count: int) -> dict:
+    """Response body of `/user/get` with `count` users."""
+    created_at = datetime(2024, 1, 1, 10, 30, tzinfo=tz.tzutc())
+    rows = [SimpleNamespace(id=index, address='221B Baker Street', zip_code='560001', full_name=f'First{index} Last',
+                            first_name=f'First{index}', last_name='Last', primary_email=f'user{index}@example.com',
+                            primary_phone='9876543210', country_code='+91', deactivated_at=None, deleted_at=None,
+                            created_at=created_at + timedelta(seconds=index),
+                            updated_at=created_at + timedelta(seconds=index, microseconds=index))
+            for index in range(count)]
+    return {'status': True, 'message': 'Details Fetched Successfully.',
+            'data': {'result': user_serializer.serialize_all(rows),
+                     'pagination_metadata': {'current_page': 1, 'page_size': count, 'total_items': count}}}
+
+
+def build_audit_payload(count: int, user_count: int = 50) -> dict:
+    """
+        Response body of `/log/audit` with `count` detailed audit logs of `user_count` users, `objects.user` is
+        keyed by string user ids as User.get_user_objects_by_ids returns it.
+    """
+    created_at = datetime(2024, 1, 1, 10, 30, tzinfo=tz.tzutc())
+    users = {str(user_id): {'id': user_id, 'first_name': f'First{user_id}', 'full_name': f'First{user_id} Last',
+                            'last_name': 'Last', 'primary_email': f'user{user_id}@example.com',
+                            'country_code': '+91', 'primary_phone': '9876543210'}
+             for user_id in range(1, user_count + 1)}
+    data = []
+    for index in range(count):
+        row = SimpleNamespace(table_name='user', action='update', created_at=created_at + timedelta(seconds=index),
+                              state_before={'first_name': f'First{index}', 'updated_at': '2024/01/01 10:30:00'},
+                              state_after={'first_name': f'Changed{index}', 'updated_at': '2024/01/02 10:30:00'})
+        audit_log = audit_log_detail_serializer.serialize(row)
+        audit_log.update(method='PUT', url=f'http://localhost/api/v1/user/{index}', ip='127.0.0.1',
+                         headers={'Content-Type': 'application/json', 'User-Agent': 'benchmark'},
+                         body={'first_name': f'Changed{index}'}, args={}, user_name='InitialUser')
+        audit_log['user_id'] = index % user_count + 1
+        data.append(audit_log)
+    return {'status': True, 'message': 'Details Fetched Successfully.',
+            'data': {'result': data, 'objects': {'user': users}, 'current_page_count': count,
+                     'current_page': 1, 'next_page': 2, 'total_count': count}}
+
+
+def run(count: int = 5000, repeat: int = 5) -> None:
+    """Print best time of serializing each payload with each provider."""
+    application = Flask(__name__)
+    providers = [('flask default', DefaultJSONProvider(application)),
+                 ('fast (stdlib)', FastJSONProvider(application, encoder='stdlib'))]
+    if orjson is not None:
+        providers.append(('fast (orjson)', FastJSONProvider(application, encoder='orjson')))  # noqa: FKA100
+    else:
+        print('orjson is not installed, only stdlib encoder is measured.')
+
+    for name, payload in (('/user/get', build_user_payload(count)), ('/log/audit', build_audit_payload(count))):
+        bodies = {provider_name: provider.dumps(payload, separators=(',', ':')).encode()
+                  for provider_name, provider in providers}
+        assert len({body for provider_name, body in bodies.items() if provider_name != 'flask default'}) == 1
+        if orjson is not None:
+            # Payload has to be written by orjson itself, not by stdlib json fallback of dumps_compact.
+            assert not has_float_mismatch(orjson.dumps(payload, default=json_default, option=orjson.OPT_SORT_KEYS))
+        for provider_name, provider in providers:
+            best = min(timeit.repeat(lambda: provider.dumps(payload, separators=(',', ':')), number=1,
+                                     repeat=repeat))
+            print(f'{name:<11} {provider_name:<14} {best * 1e3:8.2f} ms ({len(bodies[provider_name]) / 1024:.0f} KiB)')
+
+
+if __name__ == '__main__':
+    run(count=int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
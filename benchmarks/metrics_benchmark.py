@@ -0,0 +1,41 @@
+"""
+    Micro-benchmark of per-request cost of request metrics (app/helpers/metrics.py): before_request, after_request
+    and teardown_request hooks of a `/user/get` request, with values kept in memory of the process and in memory
+    mapped files shared by worker processes (METRICS.MULTIPROCESS_DIR), and cost of rendering /metrics.
+
+    Usage: python benchmarks/metrics_benchmark.py [number of requests]
+"""
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.helpers.metrics import MetricsStore  # noqa: E402
+from app.helpers.metrics import RequestMetrics  # noqa: E402
+from flask import Flask  # noqa: E402
+
+
+def run(number: int = 20000, repeat: int = 5) -> None:
+    """Print best per-request time of metrics hooks with each store."""
+    application = Flask(__name__)
+    application.add_url_rule('/api/v1/user/get', endpoint='search', view_func=lambda: '')
+    response = application.response_class('{"data": []}', mimetype='application/json')
+    with tempfile.TemporaryDirectory() as directory:
+        for name, store in (('in-process', MetricsStore()), ('multiprocess', MetricsStore(directory=directory))):
+            metrics = RequestMetrics(store=store)
+            with application.test_request_context('/api/v1/user/get?page=1&size=20'):
+                def observe() -> None:
+                    """Run hooks of one request."""
+                    metrics.before_request()
+                    metrics.after_request(response)
+                    metrics.teardown_request()
+                best = min(timeit.repeat(observe, number=number, repeat=repeat))
+                print(f'{name:<13} hooks  {best / number * 1e6:8.3f} us per request')
+            best = min(timeit.repeat(metrics.render, number=100, repeat=repeat))
+            print(f'{name:<13} render {best / 100 * 1e3:8.3f} ms per scrape')
+
+
+if __name__ == '__main__':
+    run(number=int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
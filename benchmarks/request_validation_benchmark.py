@@ -0,0 +1,122 @@
+"""
+    Micro-benchmark of per-request validation cost of `/user/auth` (JSON body) and `/user/get` (query string).
+    Compares field_type_validator and required_validator (previous implementation, kept here as reference)
+    against RequestSchema compiled once as views do, and checks that both return same errors and data for
+    valid, missing and wrongly typed requests.
+
+    Usage: python benchmarks/request_validation_benchmark.py [number of calls]
+"""
+import os
+import re
+import sys
+import timeit
+from typing import Any
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.helpers.constants import ValidationMessages  # noqa: E402
+from app.helpers.utility import TYPE_NAMES  # noqa: E402
+from app.views.user_view import login_schema  # noqa: E402
+from app.views.user_view import search_schema  # noqa: E402
+from werkzeug.datastructures import MultiDict  # noqa: E402
+
+
+def legacy_field_type_validator(request_data: dict = {}, field_types: dict = {}, prefix: str = '') -> dict:
+    """Previous type validation, messages are built on every call."""
+    cleaned_data = {}
+    errors = {}
+    is_error = False
+    for field in field_types.keys():
+        field_value = request_data.get(field)
+        if field_value is not None:
+            field_type = field_types[field]
+            if field_type == float:
+                try:
+                    field_value = float(field_value)
+                except Exception:
+                    pass
+            if field_type == int:
+                try:
+                    field_value = int(field_value)
+                except Exception:
+                    pass
+            if field_type == int:
+                try:
+                    field_value = int(field_value)
+                except Exception:
+                    pass
+            if type(field_value) != field_type:
+                type_name = TYPE_NAMES.get(field_type, field_type.__name__)  # type: ignore  # noqa: FKA100
+                if prefix:
+                    message = f'{prefix} {field} should be {type_name} value.'
+                else:
+                    formatted_field = field.replace('_', ' ').title()  # type: ignore  # noqa: FKA100
+                    message = f'{formatted_field} should be {type_name} value.'
+                errors[field] = message
+                is_error = True
+        cleaned_data[field] = field_value
+    return {'is_error': is_error, 'data': errors if is_error else cleaned_data}
+
+
+def legacy_required_validator(request_data: dict = {}, required_fields: list = [], prefix: Any = None,
+                              module_name: Any = None) -> dict:
+    """Previous required validation, messages are looked up on every call."""
+    errors = {}
+    is_error = False
+    for field in required_fields:
+        if request_data.get(field) in [None, '']:
+            try:
+                message = ValidationMessages[field.upper()].value
+                if module_name and field == ValidationMessages.NAME.name.lower():
+                    message = module_name.replace(  # type: ignore  # noqa: FKA100
+                        '_', ' ').capitalize() + ' ' + message
+            except Exception:
+                if prefix:
+                    message = f'{prefix} {field} is required.'
+                else:
+                    formatted_field = re.sub(r'(_uuids)|(_ids)|(_uuid)|(_id)', '',  # type: ignore  # noqa: FKA100
+                                             field)
+                    formatted_field = formatted_field.replace('_', ' ').title()  # type: ignore  # noqa: FKA100
+                    message = f'{formatted_field} is required.'
+            errors[field] = message
+            is_error = True
+    return {'is_error': is_error, 'data': errors}
+
+
+def legacy_validate(data: Any, field_types: dict, required_fields: list) -> dict:
+    """Previous validation of views: types and then required fields, data with converted values if valid."""
+    post_data = legacy_field_type_validator(request_data=data, field_types=field_types)
+    if post_data['is_error']:
+        return post_data
+    is_valid = legacy_required_validator(request_data=data, required_fields=required_fields)
+    return is_valid if is_valid['is_error'] else post_data
+
+
+def run(number: int = 100000, repeat: int = 5) -> None:
+    """Print best per-request time of validating each request with each implementation."""
+    endpoints = (
+        ('/user/auth', login_schema, {'email': str, 'pin': str}, ['email', 'pin'],
+         [{'email': 'user@example.com', 'pin': '1234'}, {'email': 'user@example.com'}, {'email': 1234, 'pin': ''}]),
+        ('/user/get', search_schema, {'page': int, 'size': int, 'q': str, 'sort': str, 'user_type': str},
+         ['page', 'size'],
+         [MultiDict({'page': '1', 'size': '20', 'q': 'first', 'sort': 'created_at'}), MultiDict({'page': '1'}),
+          MultiDict({'page': 'one', 'size': '20'})]),
+    )
+    for name, schema, field_types, required_fields, requests in endpoints:
+        for data in requests:
+            legacy = legacy_validate(data=data, field_types=field_types, required_fields=required_fields)
+            assert schema.validate(data) == legacy, (name, data)
+            if legacy['is_error']:
+                legacy = legacy_required_validator(request_data=data, required_fields=required_fields)
+                assert schema.check_required(data) == legacy, (name, data)
+        data = requests[0]
+        for implementation, validate in (
+                ('legacy', lambda: legacy_validate(data=data, field_types=field_types,
+                                                   required_fields=required_fields)),
+                ('RequestSchema', lambda: schema.validate(data))):
+            best = min(timeit.repeat(validate, number=number, repeat=repeat))
+            print(f'{name:<11} {implementation:<14} {best / number * 1e6:8.3f} us per request')
+
+
+if __name__ == '__main__':
+    run(number=int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -1,26 +1,34 @@
 """This file used to define custom commands.
     ex. python manage.py seed_default_category
 """
-from app import app
+from datetime import datetime
+from datetime import timedelta
+
 from app import config_data
+from app import create_app
 from app import db
-from app import send_mail_q
+from app import get_redis
 from app.helpers.constants import EmailSubject
 from app.helpers.constants import EmailTypes
+from app.helpers.constants import QueueName
+from app.models.audit_rollup import AuditRollup
 from app.models.user import User
-from flask_migrate import Migrate
-from flask_migrate import MigrateCommand
-from flask_script import Manager
+from app.models.user_import import UserImport
+import click
+from flask.cli import FlaskGroup
+from rq import Queue
+from rq_scheduler import Scheduler
 from werkzeug.security import generate_password_hash
 from workers import email_worker
+from workers.audit_worker import AuditPartitionWorker
+from workers.user_import_worker import UserImportWorker
 
-migrate = Migrate(app=app, db=db)
-# keeps track of all the commands and handles how they are called from the command line
-manager = Manager(app)
-manager.add_command('db', MigrateCommand)  # type: ignore  # noqa: FKA100
+# keeps track of all the commands and handles how they are called from the command line, commands run in
+# context of application built by create_app and `db` commands are added by Flask-Migrate.
+manager = FlaskGroup(create_app=create_app)
 
 
-@manager.command
+@manager.command('create_user')
 def create_user():
     """This command is used for creating first user(admin)."""
     user_details = User.get_by_email(
@@ -46,9 +54,68 @@ def create_user():
                 'first_name': config_data['ADMIN']['NAME']
             }
         }
+        send_mail_q = Queue(QueueName.SEND_MAIL, connection=get_redis())
         send_mail_q.enqueue(email_worker.EmailWorker.send,  # type: ignore  # noqa: FKA100
                             data, job_timeout=config_data['RQ_JOB_TIMEOUT'])
 
 
+@manager.command('maintain_audit_partitions')
+def maintain_audit_partitions():
+    """This command creates upcoming audit_log partitions and archives expired ones."""
+    AuditPartitionWorker.maintain(engine=db.engine)
+
+
+@manager.command('schedule_audit_partitions')
+def schedule_audit_partitions():
+    """This command registers rq_scheduler cron job which maintains audit_log partitions."""
+    scheduler = Scheduler(queue_name=QueueName.AUDIT_LOG, connection=get_redis())
+    for job in scheduler.get_jobs():
+        if job.func == AuditPartitionWorker.maintain:
+            scheduler.cancel(job)
+    scheduler.cron(config_data['AUDIT_LOG']['PARTITION_CRON'], func=AuditPartitionWorker.maintain,  # type: ignore  # noqa: FKA100
+                   queue_name=QueueName.AUDIT_LOG, timeout=config_data['RQ_JOB_TIMEOUT'])
+
+
+@manager.command('backfill_audit_rollup')
+@click.option('-s', '--start_date', default=None, help='First day (dd/mm/yyyy) to recompute.')
+@click.option('-e', '--end_date', default=None, help='Last day (dd/mm/yyyy) to recompute.')
+def backfill_audit_rollup(start_date=None, end_date=None):
+    """This command recomputes audit_rollup counts of given days (all days by default) from audit_log."""
+    start_date = datetime.strptime(start_date, '%d/%m/%Y').date() if start_date else None  # type: ignore  # noqa: FKA100
+    end_date = datetime.strptime(end_date, '%d/%m/%Y').date() + timedelta(days=1) if end_date else None  # type: ignore  # noqa: FKA100
+    with db.engine.begin() as connection:
+        count = AuditRollup.backfill(connection=connection, start_date=start_date, end_date=end_date)
+    print(f'{count} audit rollup rows written.')
+
+
+@manager.command('import_users')
+@click.option('-f', '--file', 'file_path', default=None, help='CSV or NDJSON file of users.')
+@click.option('--format', 'file_format', default=None, help='csv or ndjson, detected from extension by default.')
+@click.option('-c', '--chunk_size', default=None, help='Records committed together.')
+@click.option('-r', '--resume', 'import_id', default=None, help='Id of interrupted import to resume.')
+def import_users(file_path=None, file_format=None, chunk_size=None, import_id=None):
+    """This command imports users from CSV/NDJSON file in chunks, interrupted import is resumed with --resume."""
+    if import_id is None:
+        file_format = UserImport.get_file_format(file_name=file_path or '', file_format=file_format)
+        if not file_path or not file_format:
+            print('Pass CSV or NDJSON file with --file.')
+            return
+        user_import = UserImport.create(file_path=file_path, file_format=file_format,
+                                        chunk_size=int(chunk_size or config_data['USER_IMPORT']['CHUNK_SIZE']))
+        import_id = user_import.id
+    print(f'Importing users, resume with: python manage.py import_users --resume {import_id}')
+
+    def print_progress(progress):
+        """Print progress of import after each chunk."""
+        print(f'Chunk {progress.last_chunk + 1} done: {progress.imported_rows} imported, '
+              f'{progress.skipped_rows} skipped, {progress.failed_rows} failed')
+
+    progress = UserImportWorker.import_users(engine=db.engine, import_id=int(import_id),
+                                             progress_callback=print_progress)
+    for error in progress.errors:
+        print(f"Row {error['row']}: {error['error']}")
+    print(f'Import {import_id} {progress.status}.')
+
+
 if __name__ == '__main__':
-    manager.run()
+    manager()
@@ -0,0 +1,113 @@
+"""partition audit log by month
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 11:02:47.551093
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+# Partitions created ahead of current month, later months are created by AuditPartitionWorker.
+MONTHS_AHEAD = 3
+AUDIT_LOG_COLUMNS = ('id, user_id, table_name, object_id, action, state_before, state_after, method, url, '
+                     'headers, body, args, ip, created_at, updated_at')
+AUDIT_LOG_DEFINITION = """
+    id BIGINT NOT NULL DEFAULT nextval('audit_log_id_seq'),
+    user_id BIGINT,
+    table_name TEXT NOT NULL,
+    object_id VARCHAR,
+    action VARCHAR,
+    state_before JSON,
+    state_after JSON,
+    method VARCHAR,
+    url VARCHAR,
+    headers JSON,
+    body JSON,
+    args JSON,
+    ip VARCHAR,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP WITH TIME ZONE
+"""
+
+
+def add_months(value, months):
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def create_indexes():
+    op.create_index('ix_audit_log_created_at_id', 'audit_log', ['created_at', 'id'], unique=False)
+    op.create_index('ix_audit_log_user_id_created_at_id', 'audit_log', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_audit_log_action_created_at_id', 'audit_log', ['action', 'created_at', 'id'], unique=False)
+
+
+def drop_indexes():
+    op.drop_index('ix_audit_log_action_created_at_id', table_name='audit_log')
+    op.drop_index('ix_audit_log_user_id_created_at_id', table_name='audit_log')
+    op.drop_index('ix_audit_log_created_at_id', table_name='audit_log')
+
+
+def upgrade():
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        # Native partitioning is postgres only, other databases keep the plain table.
+        return
+
+    drop_indexes()
+    op.rename_table('audit_log', 'audit_log_old')
+    op.execute('ALTER TABLE audit_log_old RENAME CONSTRAINT audit_log_pkey TO audit_log_old_pkey')
+    op.execute(f"""
+        CREATE TABLE audit_log ({AUDIT_LOG_DEFINITION},
+            CONSTRAINT audit_log_pkey PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """)
+    op.execute('ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log.id')
+    op.execute('CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT')
+
+    first_created_at = connection.execute(sa.text('SELECT min(created_at) FROM audit_log_old')).scalar()
+    month = add_months(first_created_at or date.today(), 0)
+    last_month = add_months(date.today(), MONTHS_AHEAD)
+    while month <= last_month:
+        op.execute(f"""
+            CREATE TABLE audit_log_{month:%Y_%m} PARTITION OF audit_log
+            FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')
+        """)
+        month = add_months(month, 1)
+
+    op.execute(f"""
+        INSERT INTO audit_log ({AUDIT_LOG_COLUMNS})
+        SELECT {AUDIT_LOG_COLUMNS.replace('created_at', 'COALESCE(created_at, updated_at, now())')}
+        FROM audit_log_old
+    """)
+    op.drop_table('audit_log_old')
+    create_indexes()
+
+
+def downgrade():
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        return
+
+    # Partitions which are already archived (detached and dropped) are not restored.
+    op.execute(f"""
+        CREATE TABLE audit_log_old ({AUDIT_LOG_DEFINITION},
+            CONSTRAINT audit_log_old_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute(f'INSERT INTO audit_log_old ({AUDIT_LOG_COLUMNS}) SELECT {AUDIT_LOG_COLUMNS} FROM audit_log')
+    op.execute('ALTER SEQUENCE audit_log_id_seq OWNED BY audit_log_old.id')
+    op.drop_table('audit_log')
+    op.rename_table('audit_log_old', 'audit_log')
+    op.execute('ALTER TABLE audit_log RENAME CONSTRAINT audit_log_old_pkey TO audit_log_pkey')
+    op.execute('ALTER TABLE audit_log ALTER COLUMN created_at DROP NOT NULL, ALTER COLUMN created_at DROP DEFAULT')
+    create_indexes()
@@ -0,0 +1,39 @@
+"""user search name with trigram index
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 15:21:06.180342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+SEARCH_NAME_EXPRESSION = "first_name || coalesce(' ' || nullif(last_name, ''), '')"
+
+
+def upgrade():
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.add_column('user', sa.Column('search_name', sa.Text(), sa.Computed(SEARCH_NAME_EXPRESSION, persisted=True),
+                                        nullable=True))
+        op.create_index('ix_user_search_name_trgm', 'user', ['search_name'], unique=False, postgresql_using='gin',
+                        postgresql_ops={'search_name': 'gin_trgm_ops'})
+    else:
+        # Stored generated columns can not be added to existing tables of sqlite, search scans table there.
+        op.add_column('user', sa.Column('search_name', sa.Text(), sa.Computed(SEARCH_NAME_EXPRESSION, persisted=False),
+                                        nullable=True))
+
+
+def downgrade():
+    connection = op.get_bind()
+    if connection.dialect.name == 'postgresql':
+        op.drop_index('ix_user_search_name_trgm', table_name='user')
+    op.drop_column('user', 'search_name')
@@ -1,20 +1,29 @@
+import functools
 import traceback
 
-from app import app
 from app import config_data
+from app import create_app
 from app import logger
 from flask import render_template
 from flask_mail import Mail
 from flask_mail import Message
 
-app.config['MAIL_SERVER'] = config_data['MAIL']['MAIL_SERVER']
-app.config['MAIL_PORT'] = config_data['MAIL']['MAIL_PORT']
-app.config['MAIL_USERNAME'] = config_data['MAIL']['MAIL_USERNAME']
-app.config['MAIL_PASSWORD'] = config_data['MAIL']['MAIL_PASSWORD']
-app.config['MAIL_USE_TLS'] = config_data['MAIL']['MAIL_USE_TLS']
-app.config['MAIL_USE_SSL'] = config_data['MAIL']['MAIL_USE_SSL']
-app.config['MAIL_DEFAULT_SENDER'] = config_data['MAIL']['MAIL_DEFAULT_SENDER']
-mail = Mail(app)
+mail = Mail()
+
+
+@functools.lru_cache(maxsize=None)
+def get_mail_app():
+    """Return application which renders and sends emails, it is created on first email of process."""
+    app = create_app()
+    app.config['MAIL_SERVER'] = config_data['MAIL']['MAIL_SERVER']
+    app.config['MAIL_PORT'] = config_data['MAIL']['MAIL_PORT']
+    app.config['MAIL_USERNAME'] = config_data['MAIL']['MAIL_USERNAME']
+    app.config['MAIL_PASSWORD'] = config_data['MAIL']['MAIL_PASSWORD']
+    app.config['MAIL_USE_TLS'] = config_data['MAIL']['MAIL_USE_TLS']
+    app.config['MAIL_USE_SSL'] = config_data['MAIL']['MAIL_USE_SSL']
+    app.config['MAIL_DEFAULT_SENDER'] = config_data['MAIL']['MAIL_DEFAULT_SENDER']
+    mail.init_app(app)
+    return app
 
 
 def send_mail(email_to, subject, template, email_type, data={}, org_id=None):
@@ -24,7 +33,7 @@ def send_mail(email_to, subject, template, email_type, data={}, org_id=None):
         msg = Message(subject, sender=(config_data['MAIL']['MAIL_DEFAULT_SENDER_NAME'],
                                        config_data['MAIL']['MAIL_DEFAULT_SENDER']), recipients=[email_to])
 
-        with app.app_context():
+        with get_mail_app().app_context():
             msg.html = render_template(template, data=data)
 
             response = mail.send(msg)
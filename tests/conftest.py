@@ -1,14 +1,24 @@
 """
     This file contains the configuration of settings and initialization of the testing framework for the project.
 """
+import os
 
 from app import app_set_configurations
 from app import config_data
 from app import db
+from app import init_logger
 from app import initialize_extensions
 from app import ratelimit_handler
 from app import register_blueprints
+from app import register_compression
+from app import register_metrics
 from app import register_swagger_blueprints
+from app import set_json_provider
+from app.helpers.cache import student_cache
+from app.helpers.cache import student_version_cache
+from app.helpers.cache import token_cache
+from app.helpers.cache import view_cache
+from app.helpers.cache import view_version_cache
 from app.models.user import User
 from flask import Flask
 import pytest
@@ -25,7 +35,10 @@ def app():
             - Once test session is ended drop all the tables.
     """
 
-    application = Flask(__name__, instance_relative_config=True)
+    init_logger()
+    # Static files (swagger json) are those of application package, not of tests package.
+    application = Flask(__name__, instance_relative_config=True,
+                        static_folder=os.path.join(os.path.dirname(os.path.dirname(__file__)), 'app', 'static'))
     application.config.from_object(config_data)
 
     application.register_error_handler(429, ratelimit_handler)  # type: ignore  # noqa: FKA100
@@ -37,10 +50,13 @@ def app():
     application.config.update({
         'SQLALCHEMY_DATABASE_URI': config_data.get('SQLALCHEMY_TEST_DATABASE_URI')
     })
+    set_json_provider(application)
 
     initialize_extensions(application)
     register_blueprints(application)
     register_swagger_blueprints(application)
+    register_metrics(application)
+    register_compression(application)
     with application.app_context():
         db.create_all()  # creates all the tables
 
@@ -77,6 +93,81 @@ def user_client(app):
     yield app.test_client()
 
 
+class SharedRedis:
+    """
+        Stand-in for Redis tier of caches in tests: one dict shared by every cache instance using it, as Redis is
+        shared by gunicorn workers. Only commands used by TieredCache are implemented, expiry is ignored.
+        Setting `down` makes every command raise ConnectionError like an unreachable server.
+    """
+
+    def __init__(self):
+        """Initialize empty store."""
+        self.data = {}
+        self.down = False
+
+    def check(self):
+        """Raise ConnectionError while server is down."""
+        if self.down:
+            raise ConnectionError('Redis is down')
+
+    def get(self, key):
+        """Return value of key or None."""
+        self.check()
+        return self.data.get(key)
+
+    def mget(self, keys):
+        """Return values of keys, None for missing ones."""
+        self.check()
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        """Store value at key."""
+        self.check()
+        self.data[key] = value
+        return True
+
+    def delete(self, *keys):
+        """Remove keys, returns number of removed keys."""
+        self.check()
+        return len([key for key in keys if self.data.pop(key, None) is not None])
+
+    def pipeline(self, transaction=True):
+        """Return pipeline of commands sent on execute."""
+        return SharedRedisPipeline(self)
+
+
+class SharedRedisPipeline:
+    """Pipeline of SharedRedis, only SET is queued."""
+
+    def __init__(self, redis_client):
+        """Initialize empty pipeline of redis_client."""
+        self.redis_client = redis_client
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        """Queue SET of value at key."""
+        self.commands.append((key, value, ex))
+
+    def execute(self):
+        """Send queued commands, returns their results."""
+        return [self.redis_client.set(key, value, ex=ex) for key, value, ex in self.commands]
+
+
+@pytest.fixture
+def shared_redis():
+    """Point token, student and view caches at a SharedRedis for duration of test."""
+    redis_client = SharedRedis()
+    caches = (token_cache, student_cache, student_version_cache, view_cache, view_version_cache)
+    previous_clients = [cache._redis for cache in caches]
+    for cache in caches:
+        cache._redis, cache._redis_down_until = redis_client, 0.0
+    yield redis_client
+    for cache, previous_client in zip(caches, previous_clients):
+        cache._redis = previous_client
+        cache._pending_deletes.clear()
+        cache.clear()
+
+
 def validate_status_code(**kwargs):
     """
         This method is a generic method being used to validate the status_code.
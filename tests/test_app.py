@@ -0,0 +1,75 @@
+"""
+    This file contains the test cases for application setup.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from app import db
+from app.helpers.cache import student_cache
+from app.helpers.replica import write_cache
+from app.models.student import SMS
+import pytest
+
+
+@pytest.mark.run(order=25)
+def test_students_read_from_replica(app, user_client, tmp_path):
+    """
+            TEST CASE: Student list is read from replica, from primary right after own write and when replica is down.
+        """
+    binds, replicas = app.config.get('SQLALCHEMY_BINDS'), app.config.get('DATABASE_REPLICAS')
+    app.config['SQLALCHEMY_BINDS'] = {'replica': f'sqlite:///{tmp_path / "replica.db"}',
+                                      'down': f'sqlite:///{tmp_path / "missing" / "replica.db"}'}
+    app.config['DATABASE_REPLICAS'] = {'ENABLED': True, 'BINDS': ['replica'], 'STICKY_SECONDS': 60}
+    try:
+        engine = db.get_engine(app, bind='replica')
+        SMS.__table__.create(engine)
+        with engine.begin() as connection:
+            connection.execute(SMS.__table__.insert().values(name='OnReplica', clas=9, division='A'))
+        write_cache.clear()
+        student_cache.clear()
+        assert [student['name'] for student in json.loads(user_client.get('/api/v1/get?clas=9').get_data())] == [
+            'OnReplica']
+
+        user_client.post('/api/v1/post', json={'name': 'OnPrimary', 'clas': 9, 'division': 'A'})
+        assert [student['name'] for student in json.loads(user_client.get('/api/v1/get?clas=9').get_data())] == [
+            'OnPrimary']
+
+        write_cache.clear()
+        student_cache.clear()
+        app.config['DATABASE_REPLICAS']['BINDS'] = ['down']
+        assert [student['name'] for student in json.loads(user_client.get('/api/v1/get?clas=9').get_data())] == [
+            'OnPrimary']
+    finally:
+        app.config.update(SQLALCHEMY_BINDS=binds, DATABASE_REPLICAS=replicas)
+        student_cache.clear()
+
+
+@pytest.mark.run(order=28)
+def test_import_app_has_no_side_effects():
+    """
+            TEST CASE: Importing app in a new interpreter reads no config or other data file, connects to nothing
+            (redis, S3, ECS metadata), creates no directory and starts no thread.
+        """
+    script = '''
+import json
+import sys
+import threading
+import warnings
+
+warnings.simplefilter('ignore')
+events = []
+sys.addaudithook(lambda event, args: events.append([event, str(args[0]) if args else ''])
+                 if event in ('open', 'socket.connect', 'subprocess.Popen', 'os.mkdir') else None)
+import app
+print(json.dumps({'events': [event for event in events if event[0] != 'open' or not event[1].endswith(
+                      ('.py', '.pyc', '.so')) and event[1].startswith(app.base_dir)],
+                  'config_loaded': app.config_data.data is not None, 'threads': threading.active_count(),
+                  'handlers': len(app.logger.handlers), 'boto3': 'boto3' in sys.modules}))
+'''
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', script], cwd=base_dir, check=True, capture_output=True,
+                            text=True).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == {'events': [], 'config_loaded': False, 'threads': 1,
+                                                           'handlers': 0, 'boto3': False}
@@ -0,0 +1,344 @@
+"""
+    This file contains the test cases for the audit log module.
+"""
+from datetime import date
+import gzip
+import json
+
+from app import db
+from app.helpers.constants import AuditGuarantee
+from app.helpers.constants import AuditWriterBackend
+from app.helpers.json_provider import FastJSONProvider
+from app.helpers.json_provider import has_float_mismatch
+from app.helpers.json_provider import json_default
+from app.helpers.json_provider import orjson
+from app.helpers.utility import encode_cursor
+from app.models import audit_event
+from app.models.audit_log import AuditLog
+from app.models.audit_request import AuditRequest
+from app.models.audit_rollup import AuditRollup
+from app.models.user import User
+from app.views.common_view import MAX_CURSOR_PAGE_SIZE
+from manage import manager
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import text
+from tests.conftest import validate_status_code
+from workers.audit_worker import audit_log_writer
+from workers.audit_worker import AuditLogWriter
+from workers.audit_worker import AuditPartitionWorker
+
+
+def get_auth_headers(user_client) -> dict:
+    """
+        This method logs in admin user and returns headers with access token.
+    """
+    data = {
+        'email': 'admin@project.com',
+        'pin': '12345'
+    }
+    api_response = user_client.post(
+        '/api/v1/user/auth', json=data, content_type='application/json'
+    )
+    return {'x-access-token': json.loads(api_response.get_data()).get('data').get('token')}
+
+
+@pytest.mark.run(order=10)
+def test_audit_log_cursor_pagination(user_client):
+    """
+            TEST CASE: Audit logs are paged with cursor without skipping or repeating entries.
+        """
+    for index in range(5):
+        db.session.add(User(first_name=f'AuditUser{index}', primary_email=f'audit{index}@project.com',
+                            primary_phone='9876543210'))
+        db.session.commit()
+    headers = get_auth_headers(user_client)
+    total_count = json.loads(user_client.get(
+        '/api/v1/log/audit', headers=headers).get_data()).get('data').get('total_count')
+
+    cursor = ''
+    audit_log_ids = []
+    while cursor is not None:
+        api_response = user_client.get(
+            f'/api/v1/log/audit?cursor={cursor}&pagination=2', headers=headers)
+        assert validate_status_code(
+            expected=200, received=api_response.status_code)
+        data = json.loads(api_response.get_data()).get('data')
+        assert data['current_page_count'] <= 2
+        audit_log_ids.extend(audit_log['id'] for audit_log in data['result'])
+        cursor = data['next_cursor']
+
+    assert len(audit_log_ids) == total_count
+    assert audit_log_ids == sorted(set(audit_log_ids), reverse=True)
+
+
+@pytest.mark.run(order=10)
+@pytest.mark.skipif(orjson is None, reason='orjson is not installed')
+def test_audit_log_response_serialized_by_orjson(user_client, monkeypatch):
+    """
+            TEST CASE: Response of audit log list (objects.user included) is written by orjson itself and has
+            same bytes as stdlib json.
+        """
+    users = User.query.order_by(User.id).all()
+    assert users[-1].id >= 10
+    audit_logs = []
+    for user in users:
+        audit_logs.append(AuditLog(table_name=User.__tablename__, object_id=str(user.id), action='update',
+                                   state_before=None, state_after=None))
+        audit_logs[-1].user_id = user.id
+    db.session.add_all(audit_logs)
+    db.session.commit()
+    audit_log_ids = [audit_log.id for audit_log in audit_logs]
+    payloads = []
+    provider = user_client.application.json
+    dumps_compact = provider.dumps_compact
+    monkeypatch.setattr(provider, 'dumps_compact', lambda obj: payloads.append(obj) or dumps_compact(obj))
+    try:
+        api_response = user_client.get('/api/v1/log/audit?page=1&pagination=50&sort=desc',
+                                       headers=get_auth_headers(user_client))
+    finally:
+        # Rows are not counted in audit rollup, later tests compare both.
+        AuditLog.query.filter(AuditLog.id.in_(audit_log_ids)).delete(synchronize_session=False)
+        db.session.commit()
+    assert validate_status_code(expected=200, received=api_response.status_code)
+    payload = payloads[-1]
+    assert set(payload['data']['objects']['user']) == {str(user.id) for user in users}
+
+    orjson_body = orjson.dumps(payload, default=json_default, option=orjson.OPT_SORT_KEYS)
+    assert not has_float_mismatch(orjson_body)
+    stdlib_body = FastJSONProvider(user_client.application, encoder='stdlib').dumps_compact(payload)
+    assert orjson_body == stdlib_body
+    assert api_response.get_data() == stdlib_body + b'\n'
+
+
+@pytest.mark.run(order=11)
+def test_audit_log_invalid_cursor(user_client):
+    """
+            TEST CASE: Invalid cursor is rejected.
+        """
+    headers = get_auth_headers(user_client)
+    api_response = user_client.get(
+        '/api/v1/log/audit?cursor=invalid', headers=headers)
+    assert validate_status_code(
+        expected=400, received=api_response.status_code)
+    for values in ([1], ['2024-01-01', 1], [{'dt': '2024-01-01T00:00:00'}, 1, 2]):
+        api_response = user_client.get(
+            f'/api/v1/log/audit?cursor={encode_cursor(values)}', headers=headers)
+        assert validate_status_code(
+            expected=400, received=api_response.status_code)
+
+
+@pytest.mark.run(order=11)
+def test_audit_log_invalid_cursor_pagination(user_client):
+    """
+            TEST CASE: Page size of cursor pagination out of range is rejected.
+        """
+    headers = get_auth_headers(user_client)
+    for pagination in (0, -1, MAX_CURSOR_PAGE_SIZE + 1):
+        api_response = user_client.get(
+            f'/api/v1/log/audit?cursor=&pagination={pagination}', headers=headers)
+        assert validate_status_code(
+            expected=400, received=api_response.status_code)
+    api_response = user_client.get(
+        f'/api/v1/log/audit?cursor=&pagination={MAX_CURSOR_PAGE_SIZE}', headers=headers)
+    assert validate_status_code(
+        expected=200, received=api_response.status_code)
+
+
+@pytest.mark.run(order=12)
+def test_audit_log_export(user_client):
+    """
+            TEST CASE: Exported audit logs match audit log list and are gzip encoded on request.
+        """
+    headers = get_auth_headers(user_client)
+    total_count = json.loads(user_client.get(
+        '/api/v1/log/audit', headers=headers).get_data()).get('data').get('total_count')
+
+    # Export runs under configured engine options (SQLALCHEMY_ENGINE_OPTIONS, AUTOCOMMIT in config.yml), its
+    # server-side cursor has to be opened in a transaction of its own connection.
+    executions = []
+
+    def record_execution(conn, cursor, statement, parameters, context, executemany):  # noqa: F841
+        if 'FROM audit_log' in statement:
+            executions.append((conn.in_transaction(), context.execution_options.get('stream_results'),
+                               conn.get_execution_options().get('isolation_level')))
+    event.listen(db.engine, 'before_cursor_execute', record_execution)  # noqa: FKA100
+    try:
+        api_response = user_client.get('/api/v1/log/audit/export', headers=headers)
+        assert validate_status_code(
+            expected=200, received=api_response.status_code)
+        rows = [json.loads(line) for line in api_response.get_data(as_text=True).splitlines()]
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_execution)  # noqa: FKA100
+    assert len(rows) == total_count
+    assert executions == [(True, True, db.engine.dialect.default_isolation_level)]
+
+    api_response = user_client.get('/api/v1/log/audit/export?format=csv',
+                                   headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert api_response.headers['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(api_response.get_data()).decode().splitlines()) == total_count + 1
+
+
+@pytest.mark.run(order=13)
+def test_audit_log_summary(user_client):
+    """
+            TEST CASE: Audit log summary counts match audit log list.
+        """
+    headers = get_auth_headers(user_client)
+    total_count = json.loads(user_client.get(
+        '/api/v1/log/audit?action=create', headers=headers).get_data()).get('data').get('total_count')
+
+    api_response = user_client.get('/api/v1/log/audit/summary?group_by=action&action=create', headers=headers)
+    assert validate_status_code(
+        expected=200, received=api_response.status_code)
+    result = json.loads(api_response.get_data()).get('data').get('result')
+    assert result == [{'action': 'create', 'count': total_count}]
+
+
+def get_user_audit_logs(users: list) -> list:
+    """
+        This method returns audit logs of creation of given users.
+    """
+    return AuditLog.query.filter(AuditLog.table_name == User.__tablename__,
+                                 AuditLog.object_id.in_([str(user.id) for user in users])).all()
+
+
+def add_users(prefix: str, count: int) -> list:
+    """
+        This method adds users with one commit per user and returns them.
+    """
+    users = []
+    for index in range(count):
+        user = User(first_name=f'{prefix}{index}', primary_email=f'{prefix.lower()}{index}@project.com',
+                    primary_phone='9876543210')
+        db.session.add(user)
+        db.session.commit()
+        users.append(user)
+    return users
+
+
+@pytest.mark.run(order=14)
+def test_audit_log_at_commit(app, monkeypatch):
+    """
+            TEST CASE: With at_commit guarantee audit logs are written by commit and request is stored once.
+        """
+    monkeypatch.setattr(audit_event, 'AUDIT_GUARANTEE', AuditGuarantee.AT_COMMIT.value)
+    request_count = AuditRequest.query.count()
+    with app.test_request_context('/api/v1/user/add', method='POST', json={}):
+        users = add_users(prefix='AtCommitUser', count=2)
+        audit_logs = get_user_audit_logs(users)
+        assert len(audit_logs) == 2
+    assert len({audit_log.request_id for audit_log in audit_logs}) == 1
+    assert AuditRequest.query.count() == request_count + 1
+
+
+@pytest.mark.run(order=15)
+def test_audit_log_async(app, monkeypatch):
+    """
+            TEST CASE: With async guarantee audit logs of all commits of a request are written after request ends,
+            by writer thread, with request stored once.
+        """
+    monkeypatch.setattr(audit_event, 'AUDIT_GUARANTEE', AuditGuarantee.ASYNC.value)
+    monkeypatch.setitem(audit_event.AUDIT_CONFIG, 'ASYNC_BACKEND', AuditWriterBackend.THREAD.value)
+    request_count = AuditRequest.query.count()
+    with app.test_request_context('/api/v1/user/add', method='POST', json={}):
+        users = add_users(prefix='AsyncUser', count=2)
+        assert get_user_audit_logs(users) == []
+    audit_log_writer.flush()
+    audit_logs = get_user_audit_logs(users)
+    assert len(audit_logs) == 2
+    assert len({audit_log.request_id for audit_log in audit_logs}) == 1
+    assert AuditRequest.query.count() == request_count + 1
+
+
+@pytest.mark.run(order=16)
+def test_audit_log_writer_fallbacks(monkeypatch):
+    """
+            TEST CASE: Writer writes in caller thread when its queue is full and hands batches it can not write
+            to dead letter queue.
+        """
+    writer = AuditLogWriter(max_size=1, enqueue_timeout=0.01)
+    monkeypatch.setattr(writer, '_ensure_started', lambda: None)
+    writer._queue.put(None)
+    user = add_users(prefix='FullQueueUser', count=1)[0]
+    rows = [AuditLog(table_name='user_full_queue', object_id=str(user.id), action='CREATE', state_before={},
+                     state_after={}).to_row()]
+    writer.submit(engine=db.engine, rows=rows)
+    assert AuditLog.query.filter_by(table_name='user_full_queue').count() == 1
+
+    dead_letters = []
+    monkeypatch.setattr(writer, 'dead_letter', lambda batches: dead_letters.extend(batches))
+    broken_engine = create_engine('sqlite:////nonexistent/audit.db')
+    with pytest.raises(Exception):
+        writer.write(engine=broken_engine, batches=[(None, rows)])
+    writer.write_or_dead_letter(engine=broken_engine, batches=[(None, rows)])
+    assert dead_letters == [(None, rows)]
+
+
+@pytest.mark.run(order=17)
+def test_audit_partition_months():
+    """
+            TEST CASE: Partitions are planned from current month ahead and expire after retention period.
+        """
+    assert AuditPartitionWorker.get_partition_months(months_ahead=2, today=date(2026, 11, 15)) == [
+        date(2026, 11, 1), date(2026, 12, 1), date(2027, 1, 1)]
+    partitions = [('audit_log_2025_09', 'audit_log', date(2025, 9, 1), True),
+                  ('audit_request_2025_09', 'audit_request', date(2025, 9, 1), False),
+                  ('audit_log_2025_10', 'audit_log', date(2025, 10, 1), True)]
+    assert AuditPartitionWorker.get_expired_partitions(partitions=partitions, retention_months=12,
+                                                       today=date(2026, 10, 18)) == partitions[:2]
+
+
+@pytest.mark.run(order=18)
+def test_audit_partitions_created_and_archived(tmp_path):
+    """
+            TEST CASE: Upcoming partitions are created and expired ones are exported to gzipped csv and dropped
+            (postgres only, partitioned tables are created in a scratch schema).
+        """
+    if db.engine.dialect.name != 'postgresql':
+        pytest.skip('Audit log partitioning is supported on postgres only.')
+    schema = 'audit_partition_test'
+    with db.engine.begin() as connection:
+        connection.execute(text(f'CREATE SCHEMA {schema}'))
+    engine = create_engine(db.engine.url, connect_args={'options': f'-csearch_path={schema}'})
+    try:
+        with engine.begin() as connection:
+            for table_name in AuditPartitionWorker.PARTITIONED_TABLES:
+                connection.execute(text(f'CREATE TABLE {table_name} (id BIGINT, created_at TIMESTAMPTZ NOT NULL) '
+                                        'PARTITION BY RANGE (created_at)'))
+        AuditPartitionWorker.create_partitions(engine=engine, months_ahead=1, today=date(2026, 1, 15))
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO audit_log VALUES (1, '2026-01-20')"))
+
+        AuditPartitionWorker.archive_expired_partitions(engine=engine, retention_months=1,
+                                                        archive_dir=str(tmp_path), today=date(2026, 3, 1))
+        with engine.connect() as connection:
+            partitions = AuditPartitionWorker.get_partitions(connection=connection)
+        assert {partition[0] for partition in partitions} == {'audit_log_2026_02', 'audit_request_2026_02'}
+        with gzip.open(tmp_path / 'audit_log_2026_01.csv.gz', 'rt') as archive_file:
+            lines = archive_file.read().splitlines()
+        assert lines[0] == 'id,created_at'
+        assert len(lines) == 2 and lines[1].startswith('1,2026-01-20')
+        assert (tmp_path / 'audit_request_2026_01.csv.gz').exists()
+    finally:
+        engine.dispose()
+        with db.engine.begin() as connection:
+            connection.execute(text(f'DROP SCHEMA {schema} CASCADE'))
+
+
+@pytest.mark.run(order=19)
+def test_backfill_audit_rollup_command(app):
+    """
+            TEST CASE: `python manage.py backfill_audit_rollup` recomputes rollup counts from audit logs.
+        """
+    expected_summary = AuditRollup.get_summary(group_by=['table_name', 'action']).all()
+    with db.engine.begin() as connection:
+        connection.execute(AuditRollup.__table__.delete())
+    assert AuditRollup.get_summary(group_by=['table_name', 'action']).all() == []
+
+    today = date.today().strftime('%d/%m/%Y')
+    result = app.test_cli_runner().invoke(manager, ['backfill_audit_rollup', '-s', today, '-e', today])
+    assert result.exit_code == 0, result.output
+    assert result.output.strip().endswith('audit rollup rows written.')
+    assert AuditRollup.get_summary(group_by=['table_name', 'action']).all() == expected_summary
@@ -0,0 +1,60 @@
+"""
+    This file contains the test cases for response compression.
+"""
+import gzip
+import json
+
+from app.helpers.compression import brotli
+import pytest
+from tests.conftest import validate_status_code
+
+
+@pytest.mark.run(order=24)
+def test_students_response_compressed(user_client):
+    """
+            TEST CASE: Large responses are gzip encoded for clients which accept gzip, small ones are not.
+        """
+    user_client.post('/api/v1/students/bulk', json=[{'name': f'Compressed{index}', 'clas': 8, 'division': 'A'}
+                                                    for index in range(30)])
+    api_response = user_client.get('/api/v1/get?clas=8&size=30', headers={'Accept-Encoding': 'gzip'})
+    assert api_response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in api_response.headers['Vary']
+    assert len(json.loads(gzip.decompress(api_response.get_data()))) == 30
+
+    api_response = user_client.get('/api/v1/get?clas=8&size=1', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in api_response.headers
+    assert 'Content-Encoding' not in user_client.get('/api/v1/get?clas=8&size=30').headers
+
+
+@pytest.mark.run(order=24)
+def test_swagger_json_precompressed(user_client):
+    """
+            TEST CASE: Swagger json is served precompressed for each accepted encoding with its own ETag and 304.
+        """
+    url = '/static/swagger_json/swagger.json'
+    api_response = user_client.get(url)
+    assert validate_status_code(expected=200, received=api_response.status_code)
+    assert 'Content-Encoding' not in api_response.headers
+    body = api_response.get_data()
+    etags = {None: api_response.headers['ETag']}
+
+    decompressors = {'gzip': gzip.decompress}
+    if brotli is not None:
+        decompressors['br'] = brotli.decompress
+    for encoding, decompress in decompressors.items():
+        api_response = user_client.get(url, headers={'Accept-Encoding': encoding})
+        assert api_response.headers['Content-Encoding'] == encoding
+        assert 'Accept-Encoding' in api_response.headers['Vary']
+        assert decompress(api_response.get_data()) == body
+        etags[encoding] = api_response.headers['ETag']
+
+        api_response = user_client.get(url, headers={'Accept-Encoding': encoding, 'If-None-Match': etags[encoding]})
+        assert validate_status_code(expected=304, received=api_response.status_code)
+        assert api_response.get_data() == b''
+        assert 'Accept-Encoding' in api_response.headers['Vary']
+    assert len(set(etags.values())) == len(etags)
+
+    # ETag of gzip variant does not match identity variant, so full body is sent.
+    api_response = user_client.get(url, headers={'If-None-Match': etags['gzip']})
+    assert validate_status_code(expected=200, received=api_response.status_code)
+    assert api_response.get_data() == body
@@ -0,0 +1,88 @@
+"""
+    This file contains the test cases for application logging.
+"""
+import gzip
+import logging
+import queue
+import threading
+import time
+
+from app.helpers.log_handlers import BoundedQueueHandler
+from app.helpers.log_handlers import build_file_handler
+from app.helpers.log_handlers import compress_rotated
+from app.helpers.log_handlers import get_rotated_name
+from app.helpers.log_handlers import QueueLogging
+import pytest
+
+
+def make_log_record(message: str) -> logging.LogRecord:
+    """
+        This method returns INFO record of given message.
+    """
+    return logging.makeLogRecord({'name': 'tests', 'msg': message, 'levelno': logging.INFO, 'levelname': 'INFO'})
+
+
+@pytest.mark.run(order=27)
+def test_log_queue_full_policies():
+    """
+            TEST CASE: Full log queue drops records (drop) or waits for space (block), number of dropped records is
+            logged before next record which fits.
+        """
+    handler = BoundedQueueHandler(queue.Queue(maxsize=2), policy='drop')
+    for index in range(4):
+        handler.handle(make_log_record(f'record{index}'))
+    assert handler.dropped == 2
+    assert [handler.queue.get_nowait().msg for _ in range(2)] == ['record0', 'record1']
+    handler.handle(make_log_record('record4'))
+    assert handler.dropped == 0
+    warning = handler.queue.get_nowait()
+    assert (warning.levelno, warning.msg) == (logging.WARNING, '2 log records were dropped, log queue was full')
+    assert handler.queue.get_nowait().msg == 'record4'
+
+    handler = BoundedQueueHandler(queue.Queue(maxsize=1), policy='block', block_timeout=0.05)
+    handler.handle(make_log_record('record0'))
+    started = time.monotonic()
+    handler.handle(make_log_record('record1'))
+    assert time.monotonic() - started >= 0.05
+    assert handler.dropped == 1
+
+    handler = BoundedQueueHandler(queue.Queue(maxsize=1), policy='block', block_timeout=5)
+    handler.handle(make_log_record('record0'))
+    consumer = threading.Timer(0.05, handler.queue.get)
+    consumer.start()
+    handler.handle(make_log_record('record1'))
+    consumer.join()
+    assert handler.dropped == 0
+    assert handler.queue.get_nowait().msg == 'record1'
+
+
+@pytest.mark.run(order=27)
+def test_log_rotation_and_listener_restart(tmp_path):
+    """
+            TEST CASE: Rotated log file is compressed by one process only without overwriting compressed files, and
+            listener restarted after fork writes records of its new queue.
+        """
+    log_file = str(tmp_path / 'app.log')
+    with open(log_file, 'w') as file:
+        file.write('first\n')
+    destination = get_rotated_name(log_file + '.2024-01-01')
+    compress_rotated(log_file, destination)
+    # Another process rolling over same file finds nothing to rotate.
+    compress_rotated(log_file, destination)
+    with open(log_file, 'w') as file:
+        file.write('second\n')
+    assert get_rotated_name(log_file + '.2024-01-01') == log_file + '.2024-01-01.1.gz'
+    compress_rotated(log_file, destination)
+    assert gzip.decompress((tmp_path / 'app.log.2024-01-01.gz').read_bytes()) == b'first\n'
+    assert gzip.decompress((tmp_path / 'app.log.2024-01-01.1.gz').read_bytes()) == b'second\n'
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['app.log.2024-01-01.1.gz', 'app.log.2024-01-01.gz']
+
+    queue_logging = QueueLogging(file_handler=build_file_handler(log_file=log_file, log_config={}),
+                                 log_config={'QUEUE_SIZE': 10})
+    parent_queue = queue_logging.handler.queue
+    queue_logging.restart()
+    assert queue_logging.handler.queue is not parent_queue
+    queue_logging.handler.handle(make_log_record('after fork'))
+    queue_logging.stop()
+    queue_logging.file_handler.close()
+    assert 'after fork' in (tmp_path / 'app.log').read_text()
@@ -0,0 +1,27 @@
+"""
+    This file contains the test cases for the metrics module.
+"""
+from app.helpers.metrics import format_value
+import pytest
+from tests.conftest import validate_status_code
+
+
+@pytest.mark.run(order=26)
+def test_metrics(user_client):
+    """
+            TEST CASE: /metrics reports latency histogram, in-flight requests and bytes of requests by url rule.
+        """
+    user_client.post('/api/v1/students/bulk', json=[{'name': 'Metrics', 'clas': 9, 'division': 'A'}])
+    user_client.get('/api/v1/get?clas=9')
+    api_response = user_client.get('/metrics')
+    assert validate_status_code(expected=200, received=api_response.status_code)
+    assert api_response.content_type.startswith('text/plain; version=0.0.4')
+    metrics = api_response.get_data(as_text=True)
+    labels = 'endpoint="/api/v1/get",method="GET",status="200"'
+    assert f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}}' in metrics
+    assert f'http_request_duration_seconds_count{{{labels}}}' in metrics
+    assert f'http_response_size_bytes_total{{{labels}}}' in metrics
+    assert 'http_request_size_bytes_total{endpoint="/api/v1/students/bulk",method="POST"}' in metrics
+    assert 'http_requests_in_progress{endpoint="/metrics",method="GET"} 1' in metrics
+    assert [format_value(value) for value in (3.0, 0.25, float('inf'), float('-inf'), float('nan'))] == [
+        '3', '0.25', '+Inf', '-Inf', 'NaN']
@@ -0,0 +1,51 @@
+"""
+    This file contains the test cases for request schema validation.
+"""
+from app.helpers.utility import field_type_validator
+from app.helpers.utility import RequestSchema
+from app.helpers.utility import required_validator
+from benchmarks.request_validation_benchmark import legacy_field_type_validator
+from benchmarks.request_validation_benchmark import legacy_required_validator
+import pytest
+from werkzeug.datastructures import MultiDict
+
+
+@pytest.mark.run(order=7)
+def test_request_schema_matches_previous_validators():
+    """
+            TEST CASE: RequestSchema returns same messages (and converted data) as previous field_type_validator
+            and required_validator for missing, wrongly typed and empty fields.
+        """
+    field_types = {'page': int, 'price': float, 'email': str, 'user_id': int}
+    required_fields = ['page', 'email', 'name', 'user_id']
+    requests = [
+        MultiDict({'page': '1', 'price': '1.5', 'email': 'user@project.com', 'name': 'Name', 'user_id': '3'}),
+        {},
+        {'page': '', 'email': '', 'name': '', 'user_id': 1},
+        {'page': 'one', 'price': 'free', 'email': 1234, 'name': 'Name', 'user_id': 'me'},
+        MultiDict({'page': '2', 'email': 'user@project.com'}),
+    ]
+    for prefix, module_name in ((None, None), ('Student', 'student_class')):
+        schema = RequestSchema(field_types=field_types, required_fields=required_fields, prefix=prefix,
+                               module_name=module_name)
+        for data in requests:
+            type_errors = legacy_field_type_validator(request_data=data, field_types=field_types, prefix=prefix)
+            required_errors = legacy_required_validator(request_data=data, required_fields=required_fields,
+                                                        prefix=prefix, module_name=module_name)
+            assert field_type_validator(request_data=data, field_types=field_types, prefix=prefix) == type_errors
+            assert required_validator(request_data=data, required_fields=required_fields, prefix=prefix,
+                                      module_name=module_name) == required_errors
+            assert schema.check_types(data) == type_errors
+            assert schema.check_required(data) == required_errors
+            # Views checked types first and required fields only when types were valid.
+            expected = type_errors if type_errors['is_error'] or not required_errors['is_error'] else required_errors
+            assert schema.validate(data) == expected
+
+    schema = RequestSchema(field_types=field_types, required_fields=required_fields)
+    assert schema.validate(requests[0])['data']['page'] == 1
+    assert schema.validate(requests[2])['data'] == {'page': 'Page should be integer value.'}
+    assert schema.validate(requests[4])['data'] == {'name': 'Name is mandatory to add.', 'user_id': 'User is required.'}
+    assert schema.validate(requests[3])['data'] == {'page': 'Page should be integer value.',
+                                                    'price': 'Price should be float value.',
+                                                    'email': 'Email should be string value.',
+                                                    'user_id': 'User Id should be integer value.'}
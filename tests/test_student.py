@@ -0,0 +1,134 @@
+"""
+    This file contains the test cases for the student module.
+"""
+import json
+
+from app import db
+from app.helpers.cache import student_cache
+from app.helpers.cache import student_version_cache
+from app.models.student import SMS
+import pytest
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import DBAPIError
+from tests.conftest import validate_status_code
+
+
+@pytest.mark.run(order=20)
+def test_students_pagination_and_filters(user_client):
+    """
+            TEST CASE: Students are paged with page/size or cursor and filtered by class and division.
+        """
+    for index in range(5):
+        api_response = user_client.post('/api/v1/post', json={'name': f'Student{index}', 'clas': index % 2,
+                                                               'division': 'A' if index < 3 else 'B'})
+        assert validate_status_code(expected=200, received=api_response.status_code)
+        assert json.loads(api_response.get_data())['name'] == f'Student{index}'
+
+    api_response = user_client.get('/api/v1/get?page=2&size=2')
+    assert api_response.headers['X-Total-Count'] == '5'
+    assert [student['name'] for student in json.loads(api_response.get_data())] == ['Student2', 'Student3']
+
+    api_response = user_client.get('/api/v1/get?clas=0&division=A')
+    assert [student['name'] for student in json.loads(api_response.get_data())] == ['Student0', 'Student2']
+
+    api_response = user_client.get('/api/v1/get')
+    assert 'X-Total-Count' not in api_response.headers
+    assert len(json.loads(api_response.get_data())) == 5
+
+    api_response = user_client.get('/api/v1/get?clas=abc')
+    assert validate_status_code(expected=400, received=api_response.status_code)
+    assert json.loads(api_response.get_data())['error'] == {'clas': 'Clas should be integer value.'}
+
+    names = []
+    cursor = ''
+    while cursor is not None:
+        api_response = user_client.get('/api/v1/get', query_string={'cursor': cursor, 'size': 2})
+        names.extend(student['name'] for student in json.loads(api_response.get_data()))
+        cursor = api_response.headers.get('X-Next-Cursor')
+    assert names == [f'Student{index}' for index in range(5)]
+
+
+@pytest.mark.run(order=21)
+def test_student_delete_returns_deleted_student(user_client):
+    """
+            TEST CASE: Delete returns only deleted student, whole table is returned with return_all flag.
+        """
+    students = json.loads(user_client.get('/api/v1/get').get_data())
+    api_response = user_client.delete(f'/api/v1/delete/{students[0]["sid"]}')
+    assert json.loads(api_response.get_data())['sid'] == students[0]['sid']
+    assert validate_status_code(expected=404, received=user_client.delete(
+        f'/api/v1/delete/{students[0]["sid"]}').status_code)
+
+    api_response = user_client.delete(f'/api/v1/delete/{students[1]["sid"]}?return_all=true')
+    assert len(json.loads(api_response.get_data())) == len(students) - 2
+
+
+@pytest.mark.run(order=22)
+def test_students_bulk(user_client):
+    """
+            TEST CASE: Bulk create, update and delete report result of each item and skip invalid ones.
+        """
+    api_response = user_client.post('/api/v1/students/bulk', json={'students': [
+        {'name': 'Bulk0', 'clas': 1, 'division': 'A'}, {'name': 'Bulk1'}, {'name': 'Bulk2', 'clas': 2, 'division': 'B'}]})
+    results = json.loads(api_response.get_data())['results']
+    assert [result['status'] for result in results] == ['created', 'invalid', 'created']
+    assert set(results[1]['errors']) == {'clas', 'division'}
+
+    # Sids are looked up and locked in transaction which updates them.
+    lookups = []
+
+    def record_lookup(conn, cursor, statement, parameters, context, executemany):  # noqa: F841
+        """Record transaction state and locking of lookups of sids."""
+        if statement.startswith(f'SELECT "{SMS.__tablename__}".sid'):
+            lookups.append((conn.in_transaction(), conn.get_execution_options().get('isolation_level'),
+                            'FOR UPDATE' in str(context.compiled.statement.compile(dialect=postgresql.dialect()))))
+    event.listen(db.engine, 'before_cursor_execute', record_lookup)  # noqa: FKA100
+    try:
+        api_response = user_client.put('/api/v1/students/bulk', json=[
+            {'sid': results[0]['sid'], 'name': 'Bulk0', 'clas': 5, 'division': 'C'},
+            {'sid': 999999, 'name': 'Missing', 'clas': 1, 'division': 'A'}])
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record_lookup)  # noqa: FKA100
+    assert lookups == [(True, db.engine.dialect.default_isolation_level, True)]
+    assert [result['status'] for result in json.loads(api_response.get_data())['results']] == ['updated', 'not_found']
+    assert json.loads(user_client.get(f'/api/v1/get/{results[0]["sid"]}').get_data())['clas'] == 5
+
+    api_response = user_client.delete('/api/v1/students/bulk', json=[{'sid': results[0]['sid']},
+                                                                     {'sid': results[2]['sid']}])
+    assert [result['status'] for result in json.loads(api_response.get_data())['results']] == ['deleted', 'deleted']
+    assert json.loads(user_client.get('/api/v1/get?clas=5').get_data()) == []
+    assert validate_status_code(expected=400, received=user_client.post('/api/v1/students/bulk', json={}).status_code)
+
+    # Second row passes validation but fails in database, first row must be rolled back with it.
+    with pytest.raises((OverflowError, DBAPIError)):
+        user_client.post('/api/v1/students/bulk', json=[{'name': 'Bulk3', 'clas': 3, 'division': 'A'},
+                                                        {'name': 'Bulk4', 'clas': 2 ** 63, 'division': 'A'}])
+    assert 'Bulk3' not in [student['name'] for student in json.loads(user_client.get('/api/v1/get').get_data())]
+
+
+@pytest.mark.run(order=23)
+def test_student_cache_invalidated_on_write(user_client, shared_redis):
+    """
+            TEST CASE: Students are read through cache and writes are visible on next read, also when a row read
+            before the write is stored in cache after it.
+        """
+    sid = json.loads(user_client.post('/api/v1/post', json={'name': 'Cached', 'clas': 7,
+                                                            'division': 'A'}).get_data())['sid']
+    assert json.loads(user_client.get('/api/v1/get?clas=7').get_data())[0]['name'] == 'Cached'
+    hits = student_cache.get_stats()['hits']
+    assert json.loads(user_client.get(f'/api/v1/get/{sid}').get_data())['name'] == 'Cached'
+    assert json.loads(user_client.get(f'/api/v1/get/{sid}').get_data())['name'] == 'Cached'
+    assert json.loads(user_client.get('/api/v1/get?clas=7').get_data())[0]['name'] == 'Cached'
+    assert student_cache.get_stats()['hits'] == hits + 2
+
+    stale_key = 'id:{}:{}'.format(sid, student_version_cache.get_version(f'version:{sid}'))
+    user_client.put(f'/api/v1/put/{sid}', json={'name': 'Renamed', 'clas': 7, 'division': 'A'})
+    student_cache.set(stale_key, {'sid': sid, 'name': 'Cached', 'clas': 7, 'division': 'A'})
+    assert json.loads(user_client.get(f'/api/v1/get/{sid}').get_data())['name'] == 'Renamed'
+    assert json.loads(user_client.get('/api/v1/get?clas=7').get_data())[0]['name'] == 'Renamed'
+
+    user_client.delete('/api/v1/students/bulk', json=[{'sid': sid}])
+    assert json.loads(user_client.get('/api/v1/get?clas=7').get_data()) == []
+    stats = json.loads(user_client.get('/api/v1/students/cache/stats').get_data())['data']
+    assert stats['hits'] >= hits + 2
@@ -1,14 +1,30 @@
 """
     This file contains the test cases for the user module.
 """
+from datetime import timedelta
 import json
+import pickle
+import time
 
+from app import db
+from app.helpers.cache import build_tiered_cache
+from app.helpers.cache import get_token_digest
+from app.helpers.cache import get_view_tag_key
+from app.helpers.cache import token_cache
+from app.helpers.cache import view_version_cache
+from app.helpers.constants import ImportStatus
 from app.helpers.constants import ResponseMessageKeys
 from app.models.user import User
+from app.models.user_import import UserImport
 from app.views.user_view import UserView
+from manage import manager
 import pytest
+from sqlalchemy import update
+from tests.conftest import SharedRedis
 from tests.conftest import validate_response
 from tests.conftest import validate_status_code
+from werkzeug.security import check_password_hash
+from workers.user_import_worker import UserImportWorker
 
 
 @pytest.mark.run(order=1)
@@ -64,3 +80,262 @@ def test_login_with_wrong_pin(user_client):
     assert validate_response(
         expected=expected_response, received=json.loads(
             api_response.get_data()))
+
+
+@pytest.mark.run(order=3)
+def test_token_cache_invalidated_on_login(user_client, shared_redis):
+    """
+            TEST CASE: Cached token is used for repeated requests and rejected once a new token is issued.
+        """
+    data = {
+        'email': 'admin@project.com',
+        'pin': '12345'
+    }
+    old_token = json.loads(user_client.post(
+        '/api/v1/user/auth', json=data, content_type='application/json'
+    ).get_data()).get('data').get('token')
+    hits = token_cache.get_stats()['hits']
+
+    for _ in range(2):
+        api_response = user_client.get(
+            '/api/v1/user/get?page=1&size=10', headers={'x-access-token': old_token})
+        assert validate_status_code(
+            expected=200, received=api_response.status_code)
+    assert token_cache.get_stats()['hits'] > hits
+
+    time.sleep(1)  # token expiry has second precision, wait so that a new token is issued
+    user_client.post('/api/v1/user/auth', json=data,
+                     content_type='application/json')
+    api_response = user_client.get(
+        '/api/v1/user/get?page=1&size=10', headers={'x-access-token': old_token})
+    assert validate_status_code(
+        expected=401, received=api_response.status_code)
+
+
+@pytest.mark.run(order=3)
+def test_token_cache_invalidated_in_other_workers(user_client):
+    """
+            TEST CASE: Token invalidated by one worker is not accepted from cache of another worker.
+        """
+    redis_client = SharedRedis()
+    worker_caches = [build_tiered_cache(config_key='AUTH_CACHE', default_prefix='AUTH_TOKEN', use_l1=False,
+                                        fail_closed=True) for _ in range(2)]
+    for worker_cache in worker_caches:
+        worker_cache._redis = redis_client
+    token_key = get_token_digest('old-token')
+    worker_caches[1].set(token_key, {'id': 1})
+    assert worker_caches[0].get(token_key) == {'id': 1}
+
+    worker_caches[0].delete(token_key)
+    assert worker_caches[1].get(token_key) is None
+
+    # Delete is sent even while worker marks redis down after an earlier failure.
+    worker_caches[1].set(token_key, {'id': 1})
+    redis_client.down = True
+    assert worker_caches[0].get(token_key) is None
+    redis_client.down = False
+    worker_caches[0].delete(token_key)
+    assert worker_caches[1].get(token_key) is None
+
+    # Failed delete fails closed: key is not cached again and its delete is retried on next access.
+    worker_caches[1].set(token_key, {'id': 1})
+    redis_client.down = True
+    worker_caches[0].delete(token_key)
+    worker_caches[0].set(token_key, {'id': 2})
+    redis_client.down = False
+    assert worker_caches[0].get_stats()['pending_deletes'] == 1
+    assert worker_caches[1].get(token_key) == {'id': 1}
+    assert worker_caches[0].get(token_key) is None
+    assert worker_caches[1].get(token_key) is None
+    assert worker_caches[0].get_stats()['pending_deletes'] == 0
+
+
+@pytest.mark.run(order=3)
+def test_token_cache_invalidated_after_commit(user_client, shared_redis):
+    """
+            TEST CASE: Cached token of user is dropped once transaction commits, not when it is flushed.
+        """
+    for end_transaction in (db.session.commit, db.session.rollback):
+        user = User.get_by_email('admin@project.com')
+        token_key = get_token_digest(user.auth_token)
+        token_cache.set(token_key, user.to_cache_state())
+        user.auth_token = f'{end_transaction.__name__}-token'
+        db.session.flush()
+        assert token_cache.get(token_key) is not None
+        end_transaction()
+        assert token_cache.get(token_key) is None
+
+    api_response = user_client.get('/api/v1/user/token-cache/stats')
+    assert validate_status_code(
+        expected=200, received=api_response.status_code)
+    assert {'hits', 'misses', 'hit_rate', 'pending_deletes'} <= set(json.loads(api_response.get_data())['data'])
+
+
+@pytest.mark.run(order=4)
+def test_user_search_relevance(user_client):
+    """
+            TEST CASE: Users are searched by full name and ranked by relevance on request.
+        """
+    for first_name, last_name in (('Rankson', 'Tester'), ('Tester', 'Rankin'), ('Ranker', None)):
+        db.session.add(User(first_name=first_name, last_name=last_name,
+                            primary_email=f'{first_name.lower()}@project.com', primary_phone='9876543210'))
+    db.session.commit()
+    data = {
+        'email': 'admin@project.com',
+        'pin': '12345'
+    }
+    token = json.loads(user_client.post(
+        '/api/v1/user/auth', json=data, content_type='application/json'
+    ).get_data()).get('data').get('token')
+
+    api_response = user_client.get(
+        '/api/v1/user/get?page=1&size=10&q=rank&sort=relevance', headers={'x-access-token': token})
+    assert validate_status_code(
+        expected=200, received=api_response.status_code)
+    names = [user['name'] for user in json.loads(api_response.get_data()).get('data').get('result')]
+    assert set(names) == {'Rankson Tester', 'Tester Rankin', 'Ranker'}
+    assert names[0] == 'Ranker'
+
+
+@pytest.mark.run(order=4)
+def test_user_name_without_last_name(user_client):
+    """
+            TEST CASE: Name of user with empty last name has no trailing space.
+        """
+    db.session.add(User(first_name='Solo', last_name='', primary_email='solo@project.com',
+                        primary_phone='9876543210'))
+    db.session.commit()
+    data = {
+        'email': 'admin@project.com',
+        'pin': '12345'
+    }
+    token = json.loads(user_client.post(
+        '/api/v1/user/auth', json=data, content_type='application/json'
+    ).get_data()).get('data').get('token')
+
+    api_response = user_client.get('/api/v1/user/get?page=1&size=10&q=solo', headers={'x-access-token': token})
+    assert validate_status_code(
+        expected=200, received=api_response.status_code)
+    assert [user['name'] for user in json.loads(api_response.get_data()).get('data').get('result')] == ['Solo']
+
+
+@pytest.mark.run(order=5)
+def test_import_users(tmp_path):
+    """
+            TEST CASE: Users are imported from CSV in chunks, invalid and existing rows are reported.
+        """
+    import_file = tmp_path / 'users.csv'
+    import_file.write_text('first_name,last_name,primary_email,primary_phone,pin\n'
+                           'Imported,One,imported1@project.com,9876543210,1234\n'
+                           'Imported,Two,imported2@project.com,9876543210,\n'
+                           'Invalid,Row,,9876543210,\n'
+                           'Existing,Admin,admin@project.com,9876543210,\n')
+    user_import = UserImport.create(file_path=str(import_file), file_format='csv', chunk_size=2)
+
+    progress = UserImportWorker.import_users(engine=db.engine, import_id=user_import.id)
+    assert progress.status == ImportStatus.COMPLETED.value
+    assert (progress.imported_rows, progress.skipped_rows, progress.failed_rows) == (2, 1, 1)
+    assert progress.errors == [{'row': 3, 'error': {'primary_email': 'Primary Email is required.'}}]
+    assert check_password_hash(User.get_by_email('imported1@project.com').pin, '1234')
+
+
+@pytest.mark.run(order=5)
+def test_running_import_not_resumed(user_client, tmp_path):
+    """
+            TEST CASE: Import which is being run is not resumed nor run by a second worker, interrupted one is.
+        """
+    import_file = tmp_path / 'users.csv'
+    import_file.write_text('first_name,primary_email,primary_phone\n'
+                           'Running,running1@project.com,9876543210\n')
+    user_import = UserImport.create(file_path=str(import_file), file_format='csv', chunk_size=1)
+    with db.engine.begin() as connection:
+        assert UserImport.claim(connection=connection, import_id=user_import.id)
+        assert not UserImport.claim(connection=connection, import_id=user_import.id)
+    data = {
+        'email': 'admin@project.com',
+        'pin': '12345'
+    }
+    token = json.loads(user_client.post(
+        '/api/v1/user/auth', json=data, content_type='application/json'
+    ).get_data()).get('data').get('token')
+
+    api_response = user_client.post(f'/api/v1/user/import/{user_import.id}/resume', headers={'x-access-token': token})
+    assert validate_status_code(expected=409, received=api_response.status_code)
+    progress = UserImportWorker.import_users(engine=db.engine, import_id=user_import.id)
+    assert (progress.status, progress.imported_rows) == (ImportStatus.RUNNING.value, 0)
+    assert User.get_by_email('running1@project.com') is None
+
+    with db.engine.begin() as connection:
+        connection.execute(UserImport.__table__.update().where(UserImport.__table__.c.id == user_import.id).values(
+            updated_at=UserImport.get_stale_before() - timedelta(seconds=1)))
+    progress = UserImportWorker.import_users(engine=db.engine, import_id=user_import.id)
+    assert (progress.status, progress.imported_rows) == (ImportStatus.COMPLETED.value, 1)
+
+
+@pytest.mark.run(order=5)
+def test_import_users_command(app, tmp_path):
+    """
+            TEST CASE: `python manage.py import_users` imports file in chunks and prints progress of each chunk.
+        """
+    import_file = tmp_path / 'users.ndjson'
+    import_file.write_text('{"first_name": "Command", "primary_email": "command1@project.com", '
+                           '"primary_phone": "9876543210"}\n'
+                           '{"first_name": "Command", "primary_email": "command2@project.com", '
+                           '"primary_phone": "9876543210"}\n')
+
+    result = app.test_cli_runner().invoke(manager, ['import_users', '--file', str(import_file), '--chunk_size', '1'])
+    assert result.exit_code == 0, result.output
+    assert 'Chunk 1 done: 1 imported, 0 skipped, 0 failed' in result.output
+    assert 'Chunk 2 done: 2 imported, 0 skipped, 0 failed' in result.output
+    assert result.output.strip().endswith(f'{ImportStatus.COMPLETED.value}.')
+    assert User.get_by_email('command2@project.com') is not None
+
+
+@pytest.mark.run(order=6)
+def test_user_list_cached_view(user_client):
+    """
+            TEST CASE: User list is cached with ETag, answered with 304 and invalidated when a user changes.
+        """
+    data = {
+        'email': 'admin@project.com',
+        'pin': '12345'
+    }
+    headers = {'x-access-token': json.loads(user_client.post(
+        '/api/v1/user/auth', json=data, content_type='application/json'
+    ).get_data()).get('data').get('token')}
+    api_response = user_client.get('/api/v1/user/get?page=1&size=50', headers=headers)
+    etag = api_response.headers['ETag']
+    assert user_client.get('/api/v1/user/get?page=1&size=50', headers=headers).get_data() == api_response.get_data()
+    assert validate_status_code(expected=304, received=user_client.get(
+        '/api/v1/user/get?page=1&size=50', headers=dict(headers, **{'If-None-Match': etag})).status_code)
+
+    user = User.get_by_email('imported1@project.com')
+    user.first_name = 'Renamed'
+    db.session.commit()
+    api_response = user_client.get('/api/v1/user/get?page=1&size=50',
+                                   headers=dict(headers, **{'If-None-Match': etag}))
+    assert validate_status_code(expected=200, received=api_response.status_code)
+    assert 'Renamed One' in [user['name'] for user in json.loads(api_response.get_data()).get('data').get('result')]
+
+
+@pytest.mark.run(order=6)
+def test_cached_view_sees_tags_invalidated_by_other_worker(user_client, shared_redis):
+    """
+            TEST CASE: Version of tag bumped in Redis by another worker changes cache key at once, so response cached
+            in L1 of this worker is not served.
+        """
+    data = {
+        'email': 'admin@project.com',
+        'pin': '12345'
+    }
+    headers = {'x-access-token': json.loads(user_client.post(
+        '/api/v1/user/auth', json=data, content_type='application/json'
+    ).get_data()).get('data').get('token')}
+    url = '/api/v1/user/get?page=1&size=50&q=Renamed'
+    assert json.loads(user_client.get(url, headers=headers).get_data()).get('data').get('result')
+
+    db.session.execute(update(User).where(User.first_name == 'Renamed').values(first_name='Imported'))
+    db.session.commit()
+    assert json.loads(user_client.get(url, headers=headers).get_data()).get('data').get('result')
+    shared_redis.set(view_version_cache._key(get_view_tag_key(User.__tablename__)), pickle.dumps('other-worker'))
+    assert not json.loads(user_client.get(url, headers=headers).get_data()).get('data').get('result')
@@ -0,0 +1,271 @@
+"""Contains background writers used to insert audit logs outside of the request path."""
+import atexit
+from datetime import date
+import gzip
+import os
+import queue
+import re
+import threading
+import traceback
+from typing import Any
+
+from app import base_dir
+from app import config_data
+from app import get_redis
+from app import logger
+from app.helpers.cache import invalidate_view_tags
+from app.helpers.constants import QueueName
+from app.helpers.utility import add_months
+from app.models.audit_log import AuditLog
+from app.models.audit_request import AuditRequest
+from rq import Queue
+from sqlalchemy import create_engine
+from sqlalchemy import text
+
+_worker_engine = None
+
+
+def get_worker_engine():
+    """Returns engine used by rq jobs which run outside of flask application."""
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = create_engine(config_data['SQLALCHEMY_DATABASE_URI'])
+    return _worker_engine
+
+
+class AuditWorker:
+    """rq job which inserts batches of audit logs handed over by AuditableEvent."""
+    @classmethod
+    def write(cls, rows, request_row=None):
+        """This method is used for inserting request row and audit log rows with one multi-row insert."""
+        try:
+            with get_worker_engine().begin() as connection:
+                AuditLog.save_all(connection=connection, rows=rows, request_row=request_row,
+                                  batch_size=(config_data.get('AUDIT_LOG') or {}).get('BATCH_SIZE', 500))
+            # Views were invalidated when audited change was committed, before these audit logs existed.
+            invalidate_view_tags(AuditLog.__tablename__)
+        except Exception as e:
+            logger.error(
+                'Inside AuditWorker.write() : ' + str(e))
+            logger.error(traceback.format_exc())
+            raise
+
+
+class AuditPartitionWorker:
+    """
+        rq_scheduler job which maintains monthly partitions of audit_log and audit_request (postgres only).
+        - Partitions are created AUDIT_LOG.PARTITION_MONTHS_AHEAD months ahead so rows never land in default partition.
+        - Partitions older than AUDIT_LOG.RETENTION_MONTHS are detached, exported as gzipped csv to
+          AUDIT_LOG.ARCHIVE_DIR and dropped, so retention never runs bulk deletes.
+    """
+    PARTITIONED_TABLES = ('audit_log', 'audit_request')
+    PARTITION_NAME_PATTERN = re.compile(r'^(audit_log|audit_request)_(\d{4})_(\d{2})$')
+
+    @classmethod
+    def maintain(cls, engine=None):
+        """This method is used for creating upcoming partitions and archiving expired ones."""
+        try:
+            engine = engine or get_worker_engine()
+            if engine.dialect.name != 'postgresql':
+                logger.info('Audit log partitioning is supported on postgres only.')
+                return
+            audit_config = config_data.get('AUDIT_LOG') or {}
+            cls.create_partitions(engine=engine, months_ahead=audit_config.get('PARTITION_MONTHS_AHEAD', 3))
+            cls.archive_expired_partitions(engine=engine, retention_months=audit_config.get('RETENTION_MONTHS', 12),
+                                           archive_dir=os.path.join(base_dir, audit_config.get(  # type: ignore  # noqa: FKA100
+                                               'ARCHIVE_DIR', 'media/audit_archive')))
+        except Exception as e:
+            logger.error(
+                'Inside AuditPartitionWorker.maintain() : ' + str(e))
+            logger.error(traceback.format_exc())
+            raise
+
+    @staticmethod
+    def get_partition_months(months_ahead: int, today: Any = None) -> list:
+        """Returns first days of months from current month up to `months_ahead` months."""
+        current_month = add_months(today or date.today(), 0)  # type: ignore  # noqa: FKA100
+        return [add_months(current_month, offset) for offset in range(months_ahead + 1)]  # type: ignore  # noqa: FKA100
+
+    @staticmethod
+    def get_expired_partitions(partitions: list, retention_months: int, today: Any = None) -> list:
+        """Returns partitions (see get_partitions) whose month ended before retention period."""
+        cutoff = add_months(today or date.today(), -retention_months)  # type: ignore  # noqa: FKA100
+        return [partition for partition in partitions
+                if add_months(partition[2], 1) <= cutoff]  # type: ignore  # noqa: FKA100
+
+    @classmethod
+    def create_partitions(cls, engine, months_ahead: int, today: Any = None) -> None:
+        """Create partitions from current month up to `months_ahead` months."""
+        with engine.begin() as connection:
+            for table_name in cls.PARTITIONED_TABLES:
+                for month in cls.get_partition_months(months_ahead=months_ahead, today=today):
+                    connection.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {table_name}_{month:%Y_%m} PARTITION OF {table_name} "
+                        f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"))  # type: ignore  # noqa: FKA100
+
+    @classmethod
+    def get_partitions(cls, connection) -> list:
+        """
+            Returns (table name, parent table name, first day of month, is attached) of monthly partitions in
+            current schema.
+        """
+        rows = connection.execute(text("""
+            SELECT c.relname, i.inhparent IS NOT NULL
+            FROM pg_class c
+            LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+            WHERE c.relkind = 'r' AND c.relnamespace = current_schema()::regnamespace
+            AND (c.relname LIKE 'audit\\_log\\_%' OR c.relname LIKE 'audit\\_request\\_%')
+        """)).all()
+        partitions = []
+        for name, is_attached in rows:
+            match = cls.PARTITION_NAME_PATTERN.match(name)
+            if match:
+                partitions.append((name, match.group(1), date(int(match.group(2)), int(match.group(3)), 1),
+                                   is_attached))
+        return sorted(partitions, key=lambda partition: partition[2])
+
+    @classmethod
+    def archive_expired_partitions(cls, engine, retention_months: int, archive_dir: str, today: Any = None) -> None:
+        """Detach, export and drop partitions whose month ended before retention period."""
+        with engine.connect() as connection:
+            partitions = cls.get_partitions(connection=connection)
+        os.makedirs(archive_dir, exist_ok=True)
+        for name, parent_name, month, is_attached in cls.get_expired_partitions(
+                partitions=partitions, retention_months=retention_months, today=today):
+            if is_attached:
+                with engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE {parent_name} DETACH PARTITION {name}'))
+            archive_path = os.path.join(archive_dir, f'{name}.csv.gz')  # type: ignore  # noqa: FKA100
+            cls.export_table(engine=engine, table_name=name, archive_path=archive_path)
+            with engine.begin() as connection:
+                connection.execute(text(f'DROP TABLE {name}'))
+            logger.info(f'Archived audit log partition {name} to {archive_path}')
+
+    @classmethod
+    def export_table(cls, engine, table_name: str, archive_path: str) -> None:
+        """Stream table as gzipped csv using COPY, file is renamed in place only after export completes."""
+        temp_path = archive_path + '.part'
+        raw_connection = engine.raw_connection()
+        try:
+            with gzip.open(temp_path, 'wb') as archive_file:
+                raw_connection.cursor().copy_expert(f'COPY {table_name} TO STDOUT WITH (FORMAT csv, HEADER)',
+                                                    archive_file)
+            raw_connection.commit()
+        finally:
+            raw_connection.close()
+        os.replace(temp_path, archive_path)
+
+
+class AuditLogWriter:
+    """
+        In-process writer thread for audit logs.
+        - Batches are kept in a bounded queue, when queue is full `submit` waits for `enqueue_timeout`
+          seconds and then writes the batch in caller thread (backpressure instead of dropping entries).
+        - Writer drains all pending batches and inserts them with one multi-row insert per engine.
+    """
+
+    def __init__(self, max_size: int = 1000, batch_size: int = 500, enqueue_timeout: float = 1):
+        """Initialize writer, thread is started on first submit."""
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self) -> None:
+        """Start writer thread in current process (threads do not survive fork of gunicorn workers)."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, engine, rows: list, request_row: Any = None) -> None:
+        """Queue rows (and row of request which created them) to be written by writer thread."""
+        self._ensure_started()
+        try:
+            self._queue.put((engine, request_row, rows), timeout=self.enqueue_timeout)
+        except queue.Full:
+            logger.warning('Audit log writer queue is full, writing {} entries synchronously'.format(len(rows)))
+            self.write_or_dead_letter(engine=engine, batches=[(request_row, rows)])
+
+    def write(self, engine, batches: list) -> None:
+        """
+            Insert batches of (request row, audit log rows) in one transaction, request rows are inserted
+            one by one and all audit log rows together with multi-row inserts. Errors are raised.
+        """
+        rows = []
+        try:
+            with engine.begin() as connection:
+                for request_row, batch_rows in batches:
+                    request_id = AuditRequest.save(connection=connection, row=request_row) if request_row else None
+                    rows.extend(dict(row, request_id=request_id) if request_id else row for row in batch_rows)
+                AuditLog.save_all(connection=connection, rows=rows, batch_size=self.batch_size)
+            invalidate_view_tags(AuditLog.__tablename__)
+        except Exception as e:
+            logger.error('Unable to write {} audit log entries : {}'.format(len(rows), e))
+            logger.error(traceback.format_exc())
+            raise
+
+    def write_or_dead_letter(self, engine, batches: list) -> None:
+        """Write batches, batches which can not be written are handed to dead letter queue."""
+        try:
+            self.write(engine=engine, batches=batches)
+        except Exception:
+            self.dead_letter(batches=batches)
+
+    @staticmethod
+    def dead_letter(batches: list) -> None:
+        """
+            Enqueue batches which could not be written as AuditWorker.write jobs of audit_log queue, so they are
+            written by rq worker once database is back and kept in its failed job registry (`rq requeue`) otherwise.
+        """
+        try:
+            audit_log_q = Queue(QueueName.AUDIT_LOG, connection=get_redis())
+            for request_row, rows in batches:
+                audit_log_q.enqueue(AuditWorker.write,  # type: ignore  # noqa: FKA100
+                                    rows, request_row, job_timeout=config_data['RQ_JOB_TIMEOUT'])
+            logger.warning('{} audit log batches were handed to dead letter queue'.format(len(batches)))
+        except Exception as e:
+            logger.error('Unable to enqueue audit logs to dead letter queue, {} entries are lost : {}'.format(
+                sum(len(rows) for request_row, rows in batches), e))
+
+    def _run(self) -> None:
+        """Writer loop, groups all pending batches by engine before writing them."""
+        while True:
+            pending = [self._queue.get()]
+            while len(pending) < self.batch_size:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            grouped: dict = {}
+            for engine, request_row, rows in pending:
+                grouped.setdefault(engine, []).append((request_row, rows))  # noqa: FKA100
+            for engine, batches in grouped.items():
+                self.write_or_dead_letter(engine=engine, batches=batches)
+            for _ in pending:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = 5) -> None:
+        """Wait until queued entries are written, used on shutdown."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        done = threading.Event()
+
+        def wait():
+            self._queue.join()
+            done.set()
+
+        threading.Thread(target=wait, daemon=True).start()
+        done.wait(timeout)
+
+
+audit_config = config_data.get('AUDIT_LOG') or {}
+audit_log_writer = AuditLogWriter(max_size=audit_config.get('QUEUE_MAX_SIZE', 1000),
+                                  batch_size=audit_config.get('BATCH_SIZE', 500),
+                                  enqueue_timeout=audit_config.get('ENQUEUE_TIMEOUT', 1))
+atexit.register(audit_log_writer.flush)
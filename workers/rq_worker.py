@@ -0,0 +1,16 @@
+"""Contains rq worker class of application, start workers with `rq worker -w workers.rq_worker.AppWorker`."""
+from app import init_logger
+from rq import Worker
+
+
+class AppWorker(Worker):
+    """
+        rq worker which attaches handlers of app logger before it starts working.
+        Jobs run in work horses forked per job which exit with os._exit, so atexit handlers never run and records
+        still queued for a listener thread would be lost. Records are written by logging thread (LOGGING.MODE sync).
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Initialize worker and logger of application."""
+        init_logger(mode='sync')
+        super().__init__(*args, **kwargs)
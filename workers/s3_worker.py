@@ -4,8 +4,8 @@ import os
 import traceback
 
 from app import config_data
+from app import get_s3_resource
 from app import logger
-from app import S3_RESOURCE
 from app.helpers.constants import TimeInSeconds
 from magic import Magic
 
@@ -24,7 +24,7 @@ def upload_file_and_get_object_details(file_obj, temp_path=None):
             temp_path = os.path.join(config_data['UPLOAD_FOLDER'], file_obj.filename)  # type: ignore  # noqa: FKA100
             file_obj.save(temp_path)
         size = os.stat(temp_path).st_size
-        S3_RESOURCE.Bucket(bucket).upload_file(temp_path, f'{folder}{file_name}', ExtraArgs={  # type: ignore  # noqa: FKA100
+        get_s3_resource().Bucket(bucket).upload_file(temp_path, f'{folder}{file_name}', ExtraArgs={  # type: ignore  # noqa: FKA100
             'ACL': 'public-read', 'ContentType': Magic(mime=True).from_file(temp_path)})
 
         os.remove(temp_path)
@@ -40,7 +40,7 @@ def delete_file_from_bucket(key):
     bucket = config_data['AWS']['S3_BUCKET']
 
     try:
-        s3_object = S3_RESOURCE.Object(bucket, key)  # type: ignore  # noqa: FKA100
+        s3_object = get_s3_resource().Object(bucket, key)  # type: ignore  # noqa: FKA100
 
         s3_object.delete()
 
@@ -73,7 +73,7 @@ def get_presigned_url(path: str) -> str:
     else:
         bucket_name = config_data['AWS']['S3_BUCKET']
         try:
-            response = S3_RESOURCE.meta.client.generate_presigned_url('get_object',
+            response = get_s3_resource().meta.client.generate_presigned_url('get_object',
                                                                       Params={'Bucket': bucket_name,
                                                                               'Key': path},
                                                                       ExpiresIn=TimeInSeconds.TWO_DAYS.value)
@@ -0,0 +1,213 @@
+"""Contains worker which imports users in bulk from CSV/NDJSON files."""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import csv
+from datetime import datetime
+import io
+from itertools import islice
+import json
+import traceback
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import Optional
+
+from app import config_data
+from app import logger
+from app.helpers.cache import invalidate_view_tags
+from app.helpers.constants import DatabaseAction
+from app.helpers.constants import ImportStatus
+from app.helpers.constants import RecordFormat
+from app.helpers.utility import RequestSchema
+from app.models.audit_event import AuditPlan
+from app.models.audit_log import AuditLog
+from app.models.user import User
+from app.models.user_import import UserImport
+from dateutil import tz
+from sqlalchemy import select
+from sqlalchemy.orm import class_mapper
+from werkzeug.security import generate_password_hash
+from workers.audit_worker import get_worker_engine
+
+import_config = config_data.get('USER_IMPORT') or {}
+IMPORT_COLUMNS = ('first_name', 'last_name', 'primary_email', 'primary_phone', 'country_code', 'pin', 'address',
+                  'zip_code')
+REQUIRED_COLUMNS = ['first_name', 'primary_email', 'primary_phone']
+import_schema = RequestSchema(required_fields=REQUIRED_COLUMNS)
+INSERT_COLUMNS = IMPORT_COLUMNS + ('created_by', 'created_at', 'updated_at')
+
+
+def hash_pin(pin: Any) -> Any:
+    """Hash pin of imported user, it is executed in process pool as hashing is CPU bound."""
+    return generate_password_hash(pin) if pin else None
+
+
+class UserImportWorker:
+    """
+        Imports users from CSV/NDJSON files tracked by UserImport.
+        - File is streamed and processed in chunks, pins of a chunk are hashed in a process pool.
+        - Users of a chunk are inserted with COPY on postgres (multi-row inserts elsewhere) and their audit logs
+          with multi-row inserts, in one transaction along with progress of import.
+        - Rows whose email already exists are skipped, so a chunk interrupted before its commit is imported
+          again without duplicates when import is resumed.
+    """
+    @classmethod
+    def run(cls, import_id: int) -> None:
+        """This method is used for running (or resuming) import as rq job."""
+        try:
+            cls.import_users(engine=get_worker_engine(), import_id=import_id)
+        except Exception as e:
+            logger.error(
+                'Inside UserImportWorker.run() : ' + str(e))
+            logger.error(traceback.format_exc())
+            raise
+
+    @classmethod
+    def read_records(cls, file_path: str, file_format: str) -> Iterator[Any]:
+        """Yields records of file one by one, lines of NDJSON which are not valid JSON objects are yielded as None."""
+        with open(file_path, newline='', encoding='utf-8-sig') as import_file:
+            if file_format == RecordFormat.CSV.value:
+                yield from csv.DictReader(import_file)
+                return
+            for line in import_file:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield record if isinstance(record, dict) else None
+
+    @classmethod
+    def import_users(cls, engine, import_id: int, progress_callback: Optional[Callable] = None) -> Any:
+        """
+            Import chunks of file after last committed chunk and return progress row of import.
+            progress_callback is called with progress row after each chunk.
+        """
+        with engine.begin() as connection:
+            user_import = UserImport.get_progress(connection=connection, import_id=import_id)
+            if user_import is None:
+                raise ValueError(f'User import {import_id} does not exist.')
+            if not UserImport.claim(connection=connection, import_id=import_id):
+                logger.info(f'User import {import_id} is already {user_import.status}, it is not run again')
+                return user_import
+
+        chunk_size = user_import.chunk_size
+        chunk_index = user_import.last_chunk + 1
+        errors = list(user_import.errors or [])
+        try:
+            records = cls.read_records(file_path=user_import.file_path, file_format=user_import.file_format)
+            # Records of committed chunks are read and dropped.
+            deque(islice(records, chunk_index * chunk_size), maxlen=0)  # type: ignore  # noqa: FKA100
+            with ProcessPoolExecutor(max_workers=import_config.get('HASH_WORKERS')) as executor:
+                while True:
+                    chunk = list(islice(records, chunk_size))  # type: ignore  # noqa: FKA100
+                    if not chunk:
+                        break
+                    with engine.begin() as connection:
+                        counts = cls.import_chunk(connection=connection, records=chunk,
+                                                  first_row=chunk_index * chunk_size + 1, executor=executor,
+                                                  created_by=user_import.created_by, errors=errors)
+                        table = UserImport.__table__
+                        UserImport.update_progress(
+                            connection=connection, import_id=import_id, last_chunk=chunk_index,
+                            imported_rows=table.c.imported_rows + counts['imported'],
+                            skipped_rows=table.c.skipped_rows + counts['skipped'],
+                            failed_rows=table.c.failed_rows + counts['failed'],
+                            errors=errors)
+                        progress = UserImport.get_progress(connection=connection, import_id=import_id)
+                    # Users are inserted without ORM, so views cached with their tags are invalidated here.
+                    invalidate_view_tags(User.__tablename__, AuditLog.__tablename__)
+                    logger.info(f'User import {import_id}: chunk {chunk_index} committed, '
+                                f'{progress.imported_rows} imported, {progress.skipped_rows} skipped, '
+                                f'{progress.failed_rows} failed')
+                    if progress_callback:
+                        progress_callback(progress)
+                    chunk_index += 1
+        except Exception:
+            with engine.begin() as connection:
+                UserImport.update_progress(connection=connection, import_id=import_id,
+                                           status=ImportStatus.FAILED.value)
+            raise
+
+        with engine.begin() as connection:
+            UserImport.update_progress(connection=connection, import_id=import_id,
+                                       status=ImportStatus.COMPLETED.value)
+            return UserImport.get_progress(connection=connection, import_id=import_id)
+
+    @classmethod
+    def import_chunk(cls, connection, records: list, first_row: int, executor, created_by: Any,
+                     errors: list) -> dict:
+        """Validate, insert and audit users of one chunk, returns number of imported, skipped and failed rows."""
+        records_by_email = {}
+        skipped = 0
+        failed = 0
+        for row_number, record in enumerate(records, start=first_row):
+            if record is None:
+                cls.add_error(errors=errors, row_number=row_number, error={'record': 'Please enter valid record.'})
+                failed += 1
+                continue
+            values = {}
+            for column in IMPORT_COLUMNS:
+                value = record.get(column)
+                values[column] = (str(value).strip() or None) if value is not None else None
+            is_valid = import_schema.check_required(values)
+            if is_valid['is_error']:
+                cls.add_error(errors=errors, row_number=row_number, error=is_valid['data'])
+                failed += 1
+            elif values['primary_email'] in records_by_email:
+                skipped += 1
+            else:
+                records_by_email[values['primary_email']] = values
+
+        existing_emails = set(connection.execute(select(User.primary_email).where(
+            User.primary_email.in_(list(records_by_email)))).scalars()) if records_by_email else set()
+        skipped += len(existing_emails)
+        users = [values for email, values in records_by_email.items() if email not in existing_emails]
+        if not users:
+            return {'imported': 0, 'skipped': skipped, 'failed': failed}
+
+        now = datetime.now(tz=tz.tzlocal())
+        pins = executor.map(hash_pin, [values['pin'] for values in users],  # type: ignore  # noqa: FKA100
+                            chunksize=max(1, len(users) // 64))
+        for values, pin in zip(users, pins):  # type: ignore  # noqa: FKA100
+            values.update(pin=pin, created_by=created_by, created_at=now, updated_at=now)
+        cls.insert_users(connection=connection, users=users)
+
+        user_ids = dict(connection.execute(select(User.primary_email, User.id).where(  # type: ignore  # noqa: FKA100
+            User.primary_email.in_([values['primary_email'] for values in users]))).all())
+        plan = AuditPlan.for_mapper(class_mapper(User))
+        audit_rows = []
+        for values in users:
+            values['id'] = user_ids[values['primary_email']]
+            audit = AuditLog(table_name=plan.table_name, object_id=values['id'], action=DatabaseAction.CREATE.value,
+                             state_before={}, state_after=plan.get_values_state(values))
+            audit.user_id = created_by
+            audit.created_at = now
+            audit_rows.append(audit.to_row())
+        AuditLog.save_all(connection=connection, rows=audit_rows,
+                          batch_size=(config_data.get('AUDIT_LOG') or {}).get('BATCH_SIZE', 500))
+        return {'imported': len(users), 'skipped': skipped, 'failed': failed}
+
+    @classmethod
+    def add_error(cls, errors: list, row_number: int, error: dict) -> None:
+        """Keep error of row, only first UserImport.MAX_ERRORS errors are kept."""
+        if len(errors) < UserImport.MAX_ERRORS:
+            errors.append({'row': row_number, 'error': error})
+
+    @classmethod
+    def insert_users(cls, connection, users: list) -> None:
+        """Insert users with COPY on postgres and with multi-row inserts on other databases."""
+        if connection.dialect.name == 'postgresql':
+            buffer = io.StringIO()
+            # Empty unquoted csv values are read as NULL by COPY.
+            csv.writer(buffer).writerows([values[column] for column in INSERT_COLUMNS] for values in users)
+            buffer.seek(0)
+            cursor = connection.connection.cursor()
+            cursor.copy_expert('COPY "user" ({}) FROM STDIN WITH (FORMAT csv)'.format(', '.join(INSERT_COLUMNS)),
+                               buffer)
+            return
+        batch_size = import_config.get('INSERT_BATCH_SIZE', 500)
+        for index in range(0, len(users), batch_size):
+            connection.execute(User.__table__.insert().values(
+                [{column: values[column] for column in INSERT_COLUMNS} for values in users[index:index + batch_size]]))